@@ -1,36 +1,490 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, current_app, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
+import json
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from services.signature_service import SignatureService
-from services.verification_service import VerificationService
+from services.verification_service import VerificationService, build_qr_payload
 from services.qr_service import QRService
-from services.pdf_service import PDFService
-from datetime import datetime
+from services.qr_template_service import QRTemplateMemory
+from services.pdf_service import PDFService, OUTPUT_PROFILES
+from services.stamp_template_service import StampTemplateService, POSITIONS
+from services.executor_service import CPUExecutor, ExecutorSaturated, JobTimeout
+from services.batch_signing_service import MerkleBatchSigner
+from services.registry_service import DocumentRegistry
+from services.revocation_service import RevocationService
+from services.integrity_scanner_service import IntegrityScanner
+from services.download_service import DownloadService
+from services.preflight_service import PreflightService, INTERACTIVE, BULK
+from services.rpc_service import RPCServer
+from services.receipt_service import ReceiptService
+from services.audit_log_service import AuditLog
+from services.image_qr_service import check_image_size, UNSUPPORTED_IMAGE
+from services.upload_session_service import (
+    UploadSessionService, UploadNotFound, UploadOffsetMismatch, UploadTooLarge
+)
+from services import cpu_tasks, digest_service, memory_governor
+from services.digest_service import DIGEST_ALGORITHMS, signing_message
+from datetime import datetime, timezone
 import re
+import secrets
+from urllib.parse import quote
+from werkzeug.http import parse_etags, unquote_etag
+from werkzeug.utils import secure_filename
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Endpoints that accept whole PDFs (directly or as upload-session chunks)
+DOCUMENT_UPLOAD_ENDPOINTS = frozenset({'sign_document', 'verify_document', 'extract_qr_data', 'upload_chunk'})
+
+
+class DocumentUploadRequest(Request):
+    """Body limit of MAX_DOCUMENT_BYTES on the PDF upload endpoints, MAX_CONTENT_LENGTH everywhere else"""
+
+    @property
+    def max_content_length(self):
+        if not current_app:
+            return None
+        if self.endpoint in DOCUMENT_UPLOAD_ENDPOINTS:
+            return current_app.config['MAX_DOCUMENT_BYTES']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+
 app = Flask(__name__)
+app.request_class = DocumentUploadRequest
 CORS(app)
 
 # Configuration
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['SIGNED_FOLDER'] = 'signed'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max request size
+# PDFs sent to /sign-document, /verify-document, /extract-qr and upload sessions may be larger
+app.config['MAX_DOCUMENT_BYTES'] = int(os.environ.get('MAX_DOCUMENT_BYTES', 512 * 1024 * 1024))  # 512MB
+# Documents above this size are processed in large-document mode (pages released eagerly)
+app.config['LARGE_DOCUMENT_BYTES'] = int(os.environ.get('LARGE_DOCUMENT_BYTES', 64 * 1024 * 1024))
+# Digest for new signatures: sha256 | sha512-256 | blake2b-256, each optionally '-tree'
+# (4MiB leaves hashed on TREE_HASH_THREADS threads). Recorded in the QR payload.
+app.config['DIGEST_ALGORITHM'] = os.environ.get('DIGEST_ALGORITHM', 'sha256')
+app.config['TREE_HASH_THREADS'] = int(os.environ.get('TREE_HASH_THREADS', os.cpu_count() or 2))
+# Keep signed PDFs under SIGNED_FOLDER by default; a request can opt out with persist=0
+# when it takes the PDF inline (response_format=pdf|multipart)
+app.config['SIGN_PERSIST_DEFAULT'] = os.environ.get('SIGN_PERSIST_DEFAULT', '1') == '1'
+# Downloads: hand file bodies to the front proxy (x-accel = nginx X-Accel-Redirect to
+# DOWNLOAD_ACCEL_PREFIX, x-sendfile = Apache/lighttpd), and how long versioned links are cached
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD') or None
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected/signed/')
+app.config['DOWNLOAD_IMMUTABLE_MAX_AGE'] = int(os.environ.get('DOWNLOAD_IMMUTABLE_MAX_AGE', 31536000))
+# Default signed-PDF output profile: fastest-save, balanced, smallest-file, web-linearized
+app.config['PDF_OUTPUT_PROFILE'] = os.environ.get('PDF_OUTPUT_PROFILE', 'fastest-save')
+# Stamp templates: optional JSON of per-tenant layouts, LRU size of prebuilt templates
+app.config['STAMP_TEMPLATES_PATH'] = os.environ.get('STAMP_TEMPLATES_PATH')
+app.config['STAMP_TEMPLATE_CACHE_SIZE'] = int(os.environ.get('STAMP_TEMPLATE_CACHE_SIZE', 64))
+# QR decoder cascade order (opencv, aruco, zbar); see benchmarks/qr_decoders.py.
+# Auto-order reorders the cascade from live hit rates (off: keep the configured order)
+app.config['QR_DECODERS'] = os.environ.get('QR_DECODERS', 'opencv,aruco,zbar').split(',')
+app.config['QR_DECODERS_AUTO_ORDER'] = os.environ.get('QR_DECODERS_AUTO_ORDER', '0') == '1'
+# Finder-pattern locator render zoom (0 = always decode full pages); see benchmarks/finder_locator.py
+app.config['QR_LOCATOR_ZOOM'] = float(os.environ.get('QR_LOCATOR_ZOOM', 1.5))
+# Learned QR locations per document template, shared by all workers (empty path disables)
+app.config['QR_TEMPLATE_DB_PATH'] = os.environ.get('QR_TEMPLATE_DB_PATH', 'data/qr_templates.db')
+app.config['QR_TEMPLATE_MAX_MISSES'] = int(os.environ.get('QR_TEMPLATE_MAX_MISSES', 3))
+# Photo/scan verification: longest side of the working image used to locate the QR,
+# the latency budget per megapixel of the uploaded image, and the largest upload and
+# pixel count (read from the image header) accepted before anything is decoded
+app.config['IMAGE_VERIFY_WORK_SIZE'] = int(os.environ.get('IMAGE_VERIFY_WORK_SIZE', 1024))
+app.config['IMAGE_VERIFY_TARGET_MS_PER_MP'] = float(os.environ.get('IMAGE_VERIFY_TARGET_MS_PER_MP', 50))
+app.config['IMAGE_VERIFY_MAX_BYTES'] = int(os.environ.get('IMAGE_VERIFY_MAX_BYTES', 16 * 1024 * 1024))
+app.config['IMAGE_VERIFY_MAX_PIXELS'] = int(os.environ.get('IMAGE_VERIFY_MAX_PIXELS', 50_000_000))
+# Process pool for rendering / decoding / signing; beyond workers + queue requests get 503
+app.config['EXECUTOR_ENABLED'] = os.environ.get('EXECUTOR_ENABLED', '1') == '1'
+app.config['EXECUTOR_WORKERS'] = int(os.environ.get('EXECUTOR_WORKERS', os.cpu_count() or 2))
+app.config['EXECUTOR_MAX_QUEUE'] = int(os.environ.get('EXECUTOR_MAX_QUEUE', 16))
+app.config['EXECUTOR_JOB_TIMEOUT'] = float(os.environ.get('EXECUTOR_JOB_TIMEOUT', 60))
+# QoS lanes: a preflight (trailer/xref only) sends documents at or above any of these
+# thresholds to a separate, niced bulk pool so interactive calls never queue behind them
+app.config['PREFLIGHT_BULK_PAGES'] = int(os.environ.get('PREFLIGHT_BULK_PAGES', 50))
+app.config['PREFLIGHT_BULK_BYTES'] = int(os.environ.get('PREFLIGHT_BULK_BYTES', 20 * 1024 * 1024))
+app.config['PREFLIGHT_BULK_IMAGES'] = int(os.environ.get('PREFLIGHT_BULK_IMAGES', 200))
+app.config['BULK_EXECUTOR_WORKERS'] = int(os.environ.get('BULK_EXECUTOR_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+app.config['BULK_EXECUTOR_MAX_QUEUE'] = int(os.environ.get('BULK_EXECUTOR_MAX_QUEUE', 32))
+app.config['BULK_EXECUTOR_JOB_TIMEOUT'] = float(os.environ.get('BULK_EXECUTOR_JOB_TIMEOUT', 600))
+app.config['BULK_EXECUTOR_NICENESS'] = int(os.environ.get('BULK_EXECUTOR_NICENESS', 10))
+# Memory governor, per process (each worker and this one): RSS budget, MuPDF store cap and
+# the size it is trimmed to between jobs, and how many renders estimated above
+# HIGH_DPI_RENDER_BYTES (default: a full A4 page at zoom 2) may run at once across all
+# workers. Others queue for RENDER_QUEUE_TIMEOUT seconds (BULK_RENDER_QUEUE_TIMEOUT in the
+# bulk lane), then render at the zoom that fits HIGH_DPI_RENDER_BYTES
+app.config['MEMORY_BUDGET_BYTES'] = int(os.environ.get('MEMORY_BUDGET_BYTES', 1024 * 1024 * 1024))
+app.config['MUPDF_STORE_MAX_BYTES'] = int(os.environ.get('MUPDF_STORE_MAX_BYTES', 128 * 1024 * 1024))
+app.config['MUPDF_STORE_IDLE_BYTES'] = int(os.environ.get('MUPDF_STORE_IDLE_BYTES', 16 * 1024 * 1024))
+app.config['HIGH_DPI_RENDER_BYTES'] = int(os.environ.get('HIGH_DPI_RENDER_BYTES', 12 * 1024 * 1024))
+app.config['MAX_HIGH_DPI_RENDERS'] = int(os.environ.get('MAX_HIGH_DPI_RENDERS', max(1, (os.cpu_count() or 2) // 2)))
+app.config['RENDER_SLOTS_DIR'] = os.environ.get('RENDER_SLOTS_DIR', 'data/render_slots')
+app.config['RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('RENDER_QUEUE_TIMEOUT', 2))
+app.config['BULK_RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('BULK_RENDER_QUEUE_TIMEOUT', 30))
+# Merkle batch signing: one RSA signature per window of up to N documents
+app.config['BATCH_SIGNING_ENABLED'] = os.environ.get('BATCH_SIGNING_ENABLED', '0') == '1'
+app.config['BATCH_SIGNING_MAX_DELAY_MS'] = float(os.environ.get('BATCH_SIGNING_MAX_DELAY_MS', 20))
+app.config['BATCH_SIGNING_MAX_SIZE'] = int(os.environ.get('BATCH_SIGNING_MAX_SIZE', 64))
+# Signed-document registry (SQLite, WAL)
+app.config['REGISTRY_PATH'] = os.environ.get('REGISTRY_PATH', 'data/registry.db')
+# Revocation list (exact store + memory-mapped Bloom filter)
+app.config['REVOCATION_DB_PATH'] = os.environ.get('REVOCATION_DB_PATH', 'data/revocations.db')
+app.config['REVOCATION_BLOOM_PATH'] = os.environ.get('REVOCATION_BLOOM_PATH', 'data/revocations.bloom')
+app.config['REVOCATION_CAPACITY'] = int(os.environ.get('REVOCATION_CAPACITY', 1000000))
+# Resumable uploads: idle sessions older than the TTL are reclaimed by a background reaper
+app.config['UPLOAD_SESSION_DIR'] = os.environ.get('UPLOAD_SESSION_DIR', 'uploads/sessions')
+app.config['UPLOAD_SESSION_TTL'] = float(os.environ.get('UPLOAD_SESSION_TTL', 86400))
+app.config['UPLOAD_SESSION_REAP_INTERVAL'] = float(os.environ.get('UPLOAD_SESSION_REAP_INTERVAL', 300))
+# Audit log: fsync policy always|batch|interval|never, group-commit window and segment rotation.
+# One server process owns the directory; a second one sharing it refuses to start
+app.config['AUDIT_LOG_DIR'] = os.environ.get('AUDIT_LOG_DIR', 'data/audit')
+app.config['AUDIT_FSYNC'] = os.environ.get('AUDIT_FSYNC', 'batch')
+app.config['AUDIT_FLUSH_INTERVAL_MS'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL_MS', 50))
+app.config['AUDIT_SEGMENT_MAX_BYTES'] = int(os.environ.get('AUDIT_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+app.config['AUDIT_SEGMENT_MAX_AGE'] = float(os.environ.get('AUDIT_SEGMENT_MAX_AGE', 86400))
+# Base URL printed into QR verification links, and how long browsers may cache the JWKS
+app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL', 'http://localhost:5000').rstrip('/')
+app.config['JWKS_MAX_AGE'] = int(os.environ.get('JWKS_MAX_AGE', 86400))
+# Signed verification receipts (/verify-document with receipt=1): lifetime, clock
+# leeway when checking expiry, and receipts per /receipts/validate request
+app.config['RECEIPT_TTL'] = int(os.environ.get('RECEIPT_TTL', 7 * 86400))
+app.config['RECEIPT_LEEWAY'] = int(os.environ.get('RECEIPT_LEEWAY', 60))
+app.config['RECEIPT_MAX_BATCH'] = int(os.environ.get('RECEIPT_MAX_BATCH', 1000))
+# Background integrity scanner over signed/: pass interval, read rate cap and CPU duty cycle
+app.config['INTEGRITY_SCAN_ENABLED'] = os.environ.get('INTEGRITY_SCAN_ENABLED', '1') == '1'
+app.config['INTEGRITY_DB_PATH'] = os.environ.get('INTEGRITY_DB_PATH', 'data/integrity.db')
+app.config['INTEGRITY_SCAN_INTERVAL'] = float(os.environ.get('INTEGRITY_SCAN_INTERVAL', 86400))
+app.config['INTEGRITY_SCAN_MAX_BYTES_PER_SEC'] = int(os.environ.get('INTEGRITY_SCAN_MAX_BYTES_PER_SEC', 8 * 1024 * 1024))
+app.config['INTEGRITY_SCAN_MAX_CPU_FRACTION'] = float(os.environ.get('INTEGRITY_SCAN_MAX_CPU_FRACTION', 0.1))
+# Binary RPC for co-located callers on a Unix socket (unset = off); socket file mode in octal.
+# Signing raw hashes over the socket is opt-in. See benchmarks/rpc_vs_http.py
+app.config['RPC_SOCKET_PATH'] = os.environ.get('RPC_SOCKET_PATH') or None
+app.config['RPC_SOCKET_MODE'] = int(os.environ.get('RPC_SOCKET_MODE', '660'), 8)
+app.config['RPC_SIGN_ENABLED'] = os.environ.get('RPC_SIGN_ENABLED', '0') == '1'
+# Verification memo (LRU of verdicts) and /verify-stream concurrency
+app.config['VERIFY_MEMO_SIZE'] = int(os.environ.get('VERIFY_MEMO_SIZE', 100000))
+app.config['VERIFY_STREAM_WORKERS'] = int(os.environ.get('VERIFY_STREAM_WORKERS', 4))
+app.config['VERIFY_STREAM_WINDOW'] = int(os.environ.get('VERIFY_STREAM_WINDOW', 256))
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['SIGNED_FOLDER'], exist_ok=True)
 os.makedirs('keys', exist_ok=True)
 
+# Spawned executor workers re-run this file as __mp_main__ when the app is
+# started with `python app.py` (multiprocessing.parent_process() is still None
+# while they do). They build their own services in services.cpu_tasks. Under
+# `python app.py` the first process is also only the debug reloader's watcher:
+# it restarts the server child (WERKZEUG_RUN_MAIN=true) and serves nothing.
+# Neither gets any of the services, executors or background threads below.
+EXECUTOR_WORKER = __name__ == '__mp_main__'
+RELOADER_WATCHER = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+SERVING = not EXECUTOR_WORKER and not RELOADER_WATCHER
+
+def _executor_busy():
+    for executor in lane_executors.values():
+        stats = executor.get_stats()
+        if stats['queue_depth'] > 0 or stats['running'] >= stats['max_workers']:
+            return True
+    return False
+
+def _rpc_sign(message):
+    """Sign a message for the RPC listener: (signature bytes, Merkle fields or {})"""
+    if batch_signer is None:
+        return cpu_executor.run(cpu_tasks.sign_document, message), {}
+    fields = batch_signer.sign(message)
+    return fields.pop('signature'), fields
+
 # Initialize services
-signature_service = SignatureService()
-verification_service = VerificationService()
-qr_service = QRService()
-pdf_service = PDFService()
+if SERVING:
+    digest_service.configure(app.config['TREE_HASH_THREADS'])
+    signature_service = SignatureService(
+        large_document_bytes=app.config['LARGE_DOCUMENT_BYTES'],
+        digest_alg=app.config['DIGEST_ALGORITHM']
+    )
+    verification_service = VerificationService(memo_size=app.config['VERIFY_MEMO_SIZE'])
+    receipt_service = ReceiptService(
+        verification_service,
+        private_key_path=signature_service.private_key_path,
+        issuer=app.config['PUBLIC_BASE_URL'],
+        ttl=app.config['RECEIPT_TTL'],
+        leeway=app.config['RECEIPT_LEEWAY']
+    )
+    qr_templates = QRTemplateMemory(
+        db_path=app.config['QR_TEMPLATE_DB_PATH'],
+        max_misses=app.config['QR_TEMPLATE_MAX_MISSES']
+    ) if app.config['QR_TEMPLATE_DB_PATH'] else None
+    qr_service = QRService(
+        decoders=app.config['QR_DECODERS'],
+        auto_order_decoders=app.config['QR_DECODERS_AUTO_ORDER'],
+        locator_zoom=app.config['QR_LOCATOR_ZOOM'],
+        large_document_bytes=app.config['LARGE_DOCUMENT_BYTES'],
+        template_memory=qr_templates
+    )
+    stamp_templates = StampTemplateService(
+        cache_size=app.config['STAMP_TEMPLATE_CACHE_SIZE'],
+        tenants_path=app.config['STAMP_TEMPLATES_PATH']
+    )
+    pdf_service = PDFService(
+        default_profile=app.config['PDF_OUTPUT_PROFILE'],
+        stamp_templates=stamp_templates
+    )
+    document_registry = DocumentRegistry(app.config['REGISTRY_PATH'])
+    revocation_service = RevocationService(
+        db_path=app.config['REVOCATION_DB_PATH'],
+        bloom_path=app.config['REVOCATION_BLOOM_PATH'],
+        capacity=app.config['REVOCATION_CAPACITY']
+    )
+    upload_sessions = UploadSessionService(
+        directory=app.config['UPLOAD_SESSION_DIR'],
+        ttl=app.config['UPLOAD_SESSION_TTL'],
+        reap_interval=app.config['UPLOAD_SESSION_REAP_INTERVAL'],
+        max_bytes=app.config['MAX_DOCUMENT_BYTES']
+    )
+    audit_log = AuditLog(
+        directory=app.config['AUDIT_LOG_DIR'],
+        fsync=app.config['AUDIT_FSYNC'],
+        flush_interval_ms=app.config['AUDIT_FLUSH_INTERVAL_MS'],
+        segment_max_bytes=app.config['AUDIT_SEGMENT_MAX_BYTES'],
+        segment_max_age=app.config['AUDIT_SEGMENT_MAX_AGE']
+    )
+    # Shared by both lanes' workers, including the high-DPI render slots
+    cpu_initargs = ({
+        'qr_decoders': app.config['QR_DECODERS'],
+        'qr_decoders_auto_order': app.config['QR_DECODERS_AUTO_ORDER'],
+        'qr_locator_zoom': app.config['QR_LOCATOR_ZOOM'],
+        'qr_template_db_path': app.config['QR_TEMPLATE_DB_PATH'],
+        'qr_template_max_misses': app.config['QR_TEMPLATE_MAX_MISSES'],
+        'large_document_bytes': app.config['LARGE_DOCUMENT_BYTES'],
+        'digest_alg': app.config['DIGEST_ALGORITHM'],
+        'tree_hash_threads': app.config['TREE_HASH_THREADS'],
+        'pdf_output_profile': app.config['PDF_OUTPUT_PROFILE'],
+        'stamp_templates_path': app.config['STAMP_TEMPLATES_PATH'],
+        'stamp_template_cache_size': app.config['STAMP_TEMPLATE_CACHE_SIZE'],
+        'image_verify_work_size': app.config['IMAGE_VERIFY_WORK_SIZE'],
+        'image_verify_target_ms_per_mp': app.config['IMAGE_VERIFY_TARGET_MS_PER_MP'],
+        'image_verify_max_pixels': app.config['IMAGE_VERIFY_MAX_PIXELS'],
+        'memory_budget_bytes': app.config['MEMORY_BUDGET_BYTES'],
+        'mupdf_store_max_bytes': app.config['MUPDF_STORE_MAX_BYTES'],
+        'mupdf_store_idle_bytes': app.config['MUPDF_STORE_IDLE_BYTES'],
+        'high_dpi_bytes': app.config['HIGH_DPI_RENDER_BYTES'],
+        'max_high_dpi_renders': app.config['MAX_HIGH_DPI_RENDERS'],
+        'render_slots_dir': app.config['RENDER_SLOTS_DIR'],
+        'render_queue_timeout': app.config['RENDER_QUEUE_TIMEOUT'],
+    },)
+    # Bulk jobs are not waited on interactively, so they may queue longer for a render slot
+    bulk_initargs = ({**cpu_initargs[0], 'render_queue_timeout': app.config['BULK_RENDER_QUEUE_TIMEOUT']},)
+    # This process renders too when the executor is disabled
+    cpu_tasks.configure_memory(cpu_initargs[0])
+    cpu_executor = CPUExecutor(
+        max_workers=app.config['EXECUTOR_WORKERS'],
+        max_queue=app.config['EXECUTOR_MAX_QUEUE'],
+        job_timeout=app.config['EXECUTOR_JOB_TIMEOUT'],
+        initializer=cpu_tasks.init_worker,
+        initargs=cpu_initargs,
+        enabled=app.config['EXECUTOR_ENABLED'],
+        name=INTERACTIVE,
+        after_job=cpu_tasks.after_job
+    )
+    bulk_executor = CPUExecutor(
+        max_workers=app.config['BULK_EXECUTOR_WORKERS'],
+        max_queue=app.config['BULK_EXECUTOR_MAX_QUEUE'],
+        job_timeout=app.config['BULK_EXECUTOR_JOB_TIMEOUT'],
+        initializer=cpu_tasks.init_worker,
+        initargs=bulk_initargs,
+        enabled=app.config['EXECUTOR_ENABLED'],
+        niceness=app.config['BULK_EXECUTOR_NICENESS'],
+        name=BULK,
+        after_job=cpu_tasks.after_job
+    )
+    lane_executors = {INTERACTIVE: cpu_executor, BULK: bulk_executor}
+    preflight_service = PreflightService(
+        bulk_pages=app.config['PREFLIGHT_BULK_PAGES'],
+        bulk_bytes=app.config['PREFLIGHT_BULK_BYTES'],
+        bulk_images=app.config['PREFLIGHT_BULK_IMAGES']
+    )
+
+    verify_stream_pool = ThreadPoolExecutor(
+        max_workers=app.config['VERIFY_STREAM_WORKERS'],
+        thread_name_prefix='verify-stream'
+    )
+    batch_signer = None
+    if app.config['BATCH_SIGNING_ENABLED']:
+        batch_signer = MerkleBatchSigner(
+            lambda message: cpu_executor.run(cpu_tasks.sign_document, message),
+            max_delay_ms=app.config['BATCH_SIGNING_MAX_DELAY_MS'],
+            max_batch_size=app.config['BATCH_SIGNING_MAX_SIZE']
+        )
+
+    download_service = DownloadService(
+        signed_folder=app.config['SIGNED_FOLDER'],
+        offload=app.config['DOWNLOAD_OFFLOAD'],
+        accel_prefix=app.config['DOWNLOAD_ACCEL_PREFIX']
+    )
+
+    integrity_scanner = IntegrityScanner(
+        document_registry,
+        verification_service,
+        signed_folder=app.config['SIGNED_FOLDER'],
+        db_path=app.config['INTEGRITY_DB_PATH'],
+        interval=app.config['INTEGRITY_SCAN_INTERVAL'],
+        max_bytes_per_sec=app.config['INTEGRITY_SCAN_MAX_BYTES_PER_SEC'],
+        max_cpu_fraction=app.config['INTEGRITY_SCAN_MAX_CPU_FRACTION'],
+        should_yield=_executor_busy,
+        on_finding=lambda subject, kind, detail: audit_log.append(
+            'integrity_finding', transaction_id=subject, kind=kind, detail=detail)
+    )
+    if app.config['INTEGRITY_SCAN_ENABLED']:
+        integrity_scanner.start()
+    upload_sessions.start()
+
+    rpc_server = None
+    if app.config['RPC_SOCKET_PATH']:
+        rpc_server = RPCServer(
+            app.config['RPC_SOCKET_PATH'],
+            verification_service,
+            revocation_service,
+            sign=_rpc_sign if app.config['RPC_SIGN_ENABLED'] else None,
+            audit=audit_log.append,
+            pool=verify_stream_pool,
+            mode=app.config['RPC_SOCKET_MODE']
+        )
+        rpc_server.start()
+
+def audit_verification(source, verification):
+    """Record a verification outcome in the audit log"""
+    audit_log.append(
+        'verify',
+        transaction_id=verification.get('transaction_id'),
+        source=source,
+        document_hash=verification.get('document_hash') or verification.get('original_hash'),
+        overall_valid=verification.get('overall_valid'),
+        signature_valid=verification.get('signature_valid'),
+        revoked=verification.get('revoked'),
+        client=request.remote_addr
+    )
+
+def receive_document(prefix=''):
+    """
+    Store the request's document under UPLOAD_FOLDER, from either a multipart
+    'file' or a finished upload session ('upload_id' form field).
+    Returns (file_path, filename, sha256 or None, error_response or None);
+    sha256 is the raw-file hash already computed while a session was uploading.
+    The session itself is only dropped once the request succeeded (see
+    release_upload_session), so a 503/504 can be retried with the same upload_id.
+    """
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        try:
+            session = upload_sessions.get(upload_id)
+            file_path = _upload_path(prefix, session.filename)
+            filename, sha256 = upload_sessions.link(upload_id, file_path)
+        except UploadNotFound:
+            return None, None, None, (jsonify({
+                'success': False,
+                'error': 'Upload session not found or expired'
+            }), 404)
+        except ValueError as e:
+            return None, None, None, (jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400)
+        return file_path, filename, sha256, None
+
+    if 'file' not in request.files:
+        return None, None, None, (jsonify({
+            'success': False,
+            'error': 'No file provided'
+        }), 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        return None, None, None, (jsonify({
+            'success': False,
+            'error': 'No file selected'
+        }), 400)
+
+    filename = file.filename
+    file_path = _upload_path(prefix, filename)
+    file.save(file_path)
+    return file_path, filename, None, None
+
+def _discard_upload(file_path):
+    """Remove a received upload; handlers call this on the way out, whatever the outcome"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def _upload_path(prefix, filename):
+    """Private path under UPLOAD_FOLDER: concurrent uploads of the same name never share a file"""
+    name = secure_filename(filename) or 'document.pdf'
+    return os.path.join(app.config['UPLOAD_FOLDER'], f"{prefix}{secrets.token_hex(8)}_{name}")
+
+def _stored_file_intact(record):
+    """True if a registry record's signed file exists and still has the recorded SHA-256"""
+    path = record.get('signed_file_path')
+    if not path or not record.get('signed_file_sha256') or not os.path.exists(path):
+        return False
+    if digest_service.file_digest(path, 'sha256') != record['signed_file_sha256']:
+        logger.warning(f"⚠️  Stored file of {record['transaction_id']} does not match the registry, re-signing")
+        return False
+    return True
+
+def preflight_document(file_path):
+    """
+    Cheap trailer/xref preflight of a received PDF and the executor of its lane.
+    Returns (preflight info, executor, error_response or None); password-protected
+    PDFs are rejected here instead of failing inside a worker.
+    """
+    info = preflight_service.inspect(file_path)
+    if info.get('needs_password'):
+        return info, None, (jsonify({
+            'success': False,
+            'error': 'PDF is password-protected'
+        }), 400)
+    if info['lane'] == BULK:
+        logger.info(f"🐢 Bulk lane: {info.get('page_count')} pages, {info['file_size']} bytes, "
+                    f"{info.get('image_count')} images (preflight {info['elapsed_ms']}ms)")
+    return info, lane_executors[info['lane']], None
+
+def executor_error_response(e):
+    """503 + Retry-After when the executor is saturated, 504 when a job timed out"""
+    if isinstance(e, ExecutorSaturated):
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return jsonify({
+        'success': False,
+        'error': f"Processing timed out: {str(e)}"
+    }), 504
+
+@app.before_request
+def reject_oversized_body():
+    """413 before any parsing when the declared body is over this endpoint's limit"""
+    limit = request.max_content_length
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return jsonify({
+            'success': False,
+            'error': f"Request body exceeds the {limit} byte limit"
+        }), 413
+
+@app.after_request
+def release_upload_session(response):
+    """A sign/verify that succeeded has used its upload session up; any other outcome keeps it for a retry"""
+    if (request.endpoint in ('sign_document', 'verify_document') and 200 <= response.status_code < 300
+            and request.form.get('upload_id')):
+        upload_sessions.release(request.form['upload_id'])
+    return response
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -41,6 +495,89 @@ def health_check():
         'version': '1.0.0'
     })
 
+@app.route('/qr-decoders', methods=['GET'])
+def qr_decoder_stats():
+    """QR decoder cascade order and per-backend hit/latency stats"""
+    return jsonify({
+        'success': True,
+        'decoders': qr_service.decoders.get_stats()
+    })
+
+@app.route('/qr-templates', methods=['GET'])
+def qr_template_stats():
+    """Learned QR locations per document template (shared by all workers)"""
+    if qr_templates is None:
+        return jsonify({'success': False, 'error': 'QR template learning is disabled'}), 404
+    return jsonify({
+        'success': True,
+        'qr_templates': qr_templates.get_stats()
+    })
+
+@app.route('/qr-templates', methods=['DELETE'])
+def qr_template_reset():
+    """Forget one learned template (?fingerprint=...), or all of them and reset the counters"""
+    if qr_templates is None:
+        return jsonify({'success': False, 'error': 'QR template learning is disabled'}), 404
+    removed = qr_templates.forget(request.args.get('fingerprint'))
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/executor/stats', methods=['GET'])
+def executor_stats():
+    """CPU executor queue depth, wait times and counters"""
+    return jsonify({
+        'success': True,
+        'executor': cpu_executor.get_stats(),
+        'bulk_executor': bulk_executor.get_stats(),
+        'batch_signing': batch_signer.get_stats() if batch_signer else None
+    })
+
+@app.route('/qos/stats', methods=['GET'])
+def qos_stats():
+    """Preflight timings, lane routing counts and each lane's executor"""
+    return jsonify({
+        'success': True,
+        'preflight': preflight_service.get_stats(),
+        'lanes': {lane: executor.get_stats() for lane, executor in lane_executors.items()}
+    })
+
+@app.route('/memory/stats', methods=['GET'])
+def memory_stats():
+    """Current and peak memory per subsystem: this process and each worker's last report"""
+    return jsonify({
+        'success': True,
+        'process': memory_governor.get().get_stats(),
+        'workers': {lane: executor.worker_reports() for lane, executor in lane_executors.items()}
+    })
+
+@app.route('/stamp-templates', methods=['GET'])
+def stamp_template_stats():
+    """Stamp template cache stats and configured tenants"""
+    return jsonify({
+        'success': True,
+        'stamp_templates': stamp_templates.get_stats()
+    })
+
+@app.route('/.well-known/jwks.json', methods=['GET'])
+def jwks():
+    """Public signing key(s) for client-side verification, cacheable with a strong ETag"""
+    try:
+        keys, etag = verification_service.get_jwks()
+    except FileNotFoundError:
+        return jsonify({
+            'success': False,
+            'error': 'No signing key available'
+        }), 404
+
+    cache_control = f"public, max-age={app.config['JWKS_MAX_AGE']}"
+    # Exact match against each listed tag (or *), not a substring of the header
+    if parse_etags(request.headers.get('If-None-Match')).contains(unquote_etag(etag)[0]):
+        response = Response(status=304)
+    else:
+        response = jsonify(keys)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    return response
+
 @app.route('/generate-keys', methods=['POST'])
 def generate_keys():
     """Generate new RSA key pair"""
@@ -59,75 +596,335 @@ def generate_keys():
             'error': str(e)
         }), 500
 
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload. Body: {filename, total_size?}.
+    Then PUT chunks to /uploads/<id> with an Upload-Offset header, HEAD/GET it to
+    find the offset after a drop, and pass upload_id to /sign-document or
+    /verify-document (or POST /uploads/<id>/finalize first to check the sha256).
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session = upload_sessions.create(data.get('filename'), data.get('total_size'))
+        response = jsonify({
+            'success': True,
+            'upload': session.to_dict(),
+            'upload_url': f"/uploads/{session.upload_id}"
+        })
+        response.status_code = 201
+        response.headers['Location'] = f"/uploads/{session.upload_id}"
+        response.headers['Upload-Offset'] = '0'
+        return response
+
+    except UploadTooLarge as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def upload_chunk(upload_id):
+    """Append the request body at Upload-Offset; 409 with the current offset if it doesn't match"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Missing or invalid Upload-Offset header'
+        }), 400
+
+    try:
+        new_offset = upload_sessions.append(upload_id, offset, request.stream)
+    except UploadNotFound:
+        return jsonify({
+            'success': False,
+            'error': 'Upload session not found or expired'
+        }), 404
+    except UploadOffsetMismatch as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e),
+            'offset': e.offset
+        })
+        response.status_code = 409
+        response.headers['Upload-Offset'] = str(e.offset)
+        return response
+    except UploadTooLarge as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 413
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    response = jsonify({
+        'success': True,
+        'offset': new_offset
+    })
+    response.headers['Upload-Offset'] = str(new_offset)
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def upload_status(upload_id):
+    """Current offset of an upload session (also in the Upload-Offset header)"""
+    try:
+        session = upload_sessions.get(upload_id)
+    except UploadNotFound:
+        return jsonify({
+            'success': False,
+            'error': 'Upload session not found or expired'
+        }), 404
+    response = jsonify({
+        'success': True,
+        'upload': session.to_dict()
+    })
+    response.headers['Upload-Offset'] = str(session.offset)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Close an upload; optional body {sha256} is checked against the running hash"""
+    try:
+        data = request.get_json(silent=True) or {}
+        session = upload_sessions.finalize(upload_id, data.get('sha256'))
+        return jsonify({
+            'success': True,
+            'upload': session.to_dict()
+        })
+    except UploadNotFound:
+        return jsonify({
+            'success': False,
+            'error': 'Upload session not found or expired'
+        }), 404
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """Abort an upload session"""
+    try:
+        upload_sessions.delete(upload_id)
+    except UploadNotFound:
+        return jsonify({
+            'success': False,
+            'error': 'Upload session not found or expired'
+        }), 404
+    return jsonify({
+        'success': True,
+        'message': 'Upload deleted'
+    })
+
+@app.route('/uploads/stats', methods=['GET'])
+def upload_stats():
+    """Upload session counters"""
+    return jsonify({
+        'success': True,
+        'uploads': upload_sessions.get_stats()
+    })
+
 @app.route('/sign-document', methods=['POST'])
 def sign_document():
-    """Sign a PDF document and add QR code"""
+    """Sign a PDF document and add QR code (multipart 'file' or a finished 'upload_id')"""
     try:
-        if 'file' not in request.files:
+        if 'upload_id' in request.form:
+            try:
+                upload_filename = upload_sessions.get(request.form['upload_id']).filename
+            except UploadNotFound:
+                return jsonify({
+                    'success': False,
+                    'error': 'Upload session not found or expired'
+                }), 404
+        else:
+            if 'file' not in request.files:
+                return jsonify({
+                    'success': False,
+                    'error': 'No file provided'
+                }), 400
+            upload_filename = request.files['file'].filename
+            if upload_filename == '':
+                return jsonify({
+                    'success': False,
+                    'error': 'No file selected'
+                }), 400
+
+        if not upload_filename.lower().endswith('.pdf'):
             return jsonify({
                 'success': False,
-                'error': 'No file provided'
+                'error': 'Only PDF files are allowed'
             }), 400
 
-        file = request.files['file']
-        if file.filename == '':
+        # Get additional data from request
+        transaction_id = request.form.get('transaction_id', '')
+        customer_name = request.form.get('customer_name', '')
+        transaction_date = request.form.get('transaction_date', '')
+        output_profile = request.form.get('output_profile') or None
+        if output_profile and output_profile not in OUTPUT_PROFILES:
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
+                'error': f"Unknown output_profile, expected one of: {', '.join(OUTPUT_PROFILES)}"
+            }), 400
+        digest_alg = request.form.get('digest_alg') or app.config['DIGEST_ALGORITHM']
+        if digest_alg not in DIGEST_ALGORITHMS:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown digest_alg, expected one of: {', '.join(DIGEST_ALGORITHMS)}"
+            }), 400
+        stamp = {
+            'tenant': request.form.get('tenant') or None,
+            'position': request.form.get('stamp_position') or None,
+            'qr_size': request.form.get('stamp_qr_size', type=float),
+        }
+        if stamp['position'] and stamp['position'] not in POSITIONS:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown stamp_position, expected one of: {', '.join(POSITIONS)}"
             }), 400
 
-        if not file.filename.lower().endswith('.pdf'):
+        # Response: JSON with a download_url (default), or the signed PDF itself
+        # with the metadata in headers (pdf) or in a leading JSON part (multipart)
+        response_format = request.form.get('response_format') or _preferred_sign_format()
+        if response_format not in SIGN_RESPONSE_FORMATS:
             return jsonify({
                 'success': False,
-                'error': 'Only PDF files are allowed'
+                'error': f"Unknown response_format, expected one of: {', '.join(SIGN_RESPONSE_FORMATS)}"
+            }), 400
+        persist = request.form.get('persist')
+        persist = app.config['SIGN_PERSIST_DEFAULT'] if persist is None else persist.lower() in ('1', 'true', 'yes')
+        if not persist and response_format == 'json':
+            return jsonify({
+                'success': False,
+                'error': 'persist=0 needs response_format pdf or multipart'
             }), 400
 
-        # Get additional data from request
-        transaction_id = request.form.get('transaction_id', '')
-        customer_name = request.form.get('customer_name', '')
-        transaction_date = request.form.get('transaction_date', '')
+        # Save uploaded file (or take over the finished upload session)
+        file_path, filename, upload_sha256, error = receive_document()
+        if error:
+            return error
+        output_path = None
+        streaming = False
+        try:
+            # Large documents sign on the bulk lane, off the interactive workers
+            preflight, executor, error = preflight_document(file_path)
+            if error:
+                return error
 
-        # Save uploaded file
-        filename = file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+            # Idempotent retry: return the stored result if this transaction was already
+            # signed for the same content and its file is still the one recorded;
+            # a different document under a reused transaction_id is a conflict
+            existing = document_registry.get(transaction_id) if transaction_id else None
+            if existing:
+                current_hash = executor.run(cpu_tasks.generate_document_hash, file_path,
+                                            existing.get('digest_alg') or 'sha256')
+                if current_hash != existing['document_hash']:
+                    return _transaction_conflict(transaction_id)
+                if _stored_file_intact(existing):
+                    logger.info(f"♻️  Transaction {transaction_id} already signed, returning stored result")
+                    return _replay_signed_document(existing, response_format)
 
-        # Generate document hash
-        document_hash = signature_service.generate_document_hash(file_path)
+            # Unique per signing: the registry maps the transaction to its file
+            signed_filename = f"signed_{secrets.token_hex(8)}_{secure_filename(filename) or 'document.pdf'}"
+            signed_file_path = os.path.join(app.config['SIGNED_FOLDER'], signed_filename)
+            # The worker always writes the signed PDF to disk and inline responses stream it
+            # from there; without persist it is a scratch file, removed once sent
+            inline = response_format != 'json'
+            output_path = signed_file_path if persist else _upload_path('signed_', signed_filename)
+            qr_fields = {'transaction_id': transaction_id, 'timestamp': transaction_date}
+            batch_fields = {}
         
-        # Create digital signature
-        signature = signature_service.sign_document(document_hash)
+            if batch_signer is None:
+                # Hash, sign, build the QR and stamp it in one job, on one parse of the PDF
+                result = executor.run(
+                    cpu_tasks.sign_pipeline, file_path, qr_fields, output_path, digest_alg,
+                    output_profile, stamp, verification_service.key_id,
+                    app.config['PUBLIC_BASE_URL'], upload_sha256
+                )
+                document_hash = result['document_hash']
+                signature_hex = result['signature']
+                signed_file_sha256 = result['signed_file_sha256']
+            else:
+                # Batch signatures are collected in this process, so the document is
+                # parsed once for the hash and once more for stamping
+                document_hash = executor.run(cpu_tasks.generate_document_hash, file_path, digest_alg)
+                batch_fields = batch_signer.sign(signing_message(document_hash, digest_alg))
+                signature_hex = batch_fields.pop('signature').hex()
+                qr_data = build_qr_payload(transaction_id, document_hash, digest_alg, signature_hex,
+                                           transaction_date, batch_fields,
+                                           verification_service.key_id, app.config['PUBLIC_BASE_URL'])
+                signed_file_sha256 = executor.run(cpu_tasks.stamp_document, file_path, qr_data,
+                                                  output_path, output_profile, stamp)
         
-        # Generate QR code with verification data
-        qr_data = {
-            'transaction_id': transaction_id,
-            'document_hash': document_hash,
-            'signature': signature.hex(),
-            'timestamp': transaction_date,
-            'verification_url': f"http://localhost:5000/verify"
-        }
-        
-        qr_image_path = qr_service.generate_qr_code(qr_data, f"qr_{transaction_id}")
+            if persist:
+                # Downloads use the digest as ETag without reading the file again
+                download_service.remember(signed_file_path, signed_file_sha256)
+            else:
+                signed_file_path = None
         
-        # Add QR code to PDF
-        signed_filename = f"signed_{filename}"
-        signed_file_path = os.path.join(app.config['SIGNED_FOLDER'], signed_filename)
-        
-        pdf_service.add_qr_to_pdf(file_path, qr_image_path, signed_file_path)
-        
-        # Clean up temporary files
-        os.remove(file_path)
-        os.remove(qr_image_path)
+            record = {
+                'transaction_id': transaction_id,
+                'document_hash': document_hash,
+                'digest_alg': digest_alg,
+                'signature': signature_hex,
+                **batch_fields,
+                'signed_filename': signed_filename,
+                'signed_file_path': signed_file_path,
+                'signed_file_sha256': signed_file_sha256,
+            }
+            if transaction_id:
+                record = document_registry.record(
+                    key_id=verification_service.key_id,
+                    replaces=existing['signed_filename'] if existing else None,
+                    **record
+                )
+                if record['signed_filename'] != signed_filename:
+                    # A concurrent request for this transaction registered first: drop
+                    # this signing and answer with the stored one
+                    if signed_file_path:
+                        os.remove(signed_file_path)
+                    if record['document_hash'] != document_hash:
+                        return _transaction_conflict(transaction_id)
+                    if not _stored_file_intact(record):
+                        return jsonify({
+                            'success': False,
+                            'error': f"Transaction {transaction_id} is being signed by another request, retry"
+                        }), 409
+                    logger.info(f"♻️  Transaction {transaction_id} was signed concurrently, returning stored result")
+                    return _replay_signed_document(record, response_format)
+            audit_log.append('sign', transaction_id=transaction_id, replay=False,
+                             document_hash=document_hash, signature_mode=record.get('signature_mode'),
+                             signed_filename=signed_filename, persisted=persist,
+                             client=request.remote_addr)
         
-        return jsonify({
-            'success': True,
-            'message': 'Document signed successfully',
-            'signed_file_path': signed_file_path,
-            'document_hash': document_hash,
-            'signature': signature.hex(),
-            'download_url': f"/download/{signed_filename}"
-        })
+            body = _signed_document_response(record)
+            body['lane'] = preflight['lane']
+            if not inline:
+                return jsonify(body)
+            body['signed_file_sha256'] = signed_file_sha256
+            response = _inline_signed_response(response_format, body, signed_filename, path=output_path)
+            if not persist:
+                response.call_on_close(lambda: _discard_upload(output_path))
+                streaming = True
+            return response
+        finally:
+            _discard_upload(file_path)
+            if output_path and not persist and not streaming:
+                _discard_upload(output_path)
         
+    except (ExecutorSaturated, JobTimeout) as e:
+        logger.warning(f"Executor rejected sign request: {str(e)}")
+        return executor_error_response(e)
     except Exception as e:
         logger.error(f"Error signing document: {str(e)}")
         return jsonify({
@@ -135,116 +932,507 @@ def sign_document():
             'error': str(e)
         }), 500
 
-@app.route('/verify-document', methods=['POST'])
-def verify_document():
-    """Verify a signed PDF document - PROPERLY FIXED VERSION"""
+def _transaction_conflict(transaction_id):
+    """409 for a transaction_id already signed for a different document"""
+    logger.warning(f"⚠️  Transaction {transaction_id} already signed for a different document")
+    return jsonify({
+        'success': False,
+        'error': f"Transaction {transaction_id} was already signed for a different document"
+    }), 409
+
+def _replay_signed_document(record, response_format):
+    """Sign response for an already-signed transaction, from its registry record and stored file"""
+    audit_log.append('sign', transaction_id=record['transaction_id'], replay=True,
+                     document_hash=record['document_hash'], client=request.remote_addr)
+    body = _signed_document_response(record, replay=True)
+    if response_format == 'json':
+        return jsonify(body)
+    return _inline_signed_response(response_format, body, record['signed_filename'],
+                                   path=record['signed_file_path'])
+
+def _download_url(record):
+    """Download link; with the content hash as ?v= it is served as immutable"""
+    url = f"/download/{quote(record['signed_filename'])}"
+    if record.get('signed_file_sha256'):
+        url += f"?v={record['signed_file_sha256'][:DOWNLOAD_VERSION_LENGTH]}"
+    return url
+
+def _signed_document_response(record, replay=False):
+    """Sign response body from a registry record (or an unregistered sign result)"""
+    response = {
+        'success': True,
+        'message': 'Document already signed' if replay else 'Document signed successfully',
+        'signed_file_path': record['signed_file_path'],
+        'document_hash': record['document_hash'],
+        'digest_alg': record.get('digest_alg') or 'sha256',
+        'signature': record['signature'],
+        # Not persisted (persist=0): the PDF was only returned inline
+        'download_url': _download_url(record) if record['signed_file_path'] else None
+    }
+    if record.get('merkle_root'):
+        response.update({
+            'signature_mode': record['signature_mode'],
+            'merkle_root': record['merkle_root'],
+            'merkle_proof': record['merkle_proof'],
+        })
+    if replay:
+        response['idempotent_replay'] = True
+        response['signed_at'] = record['created_at']
+    return response
+
+SIGN_RESPONSE_FORMATS = ('json', 'pdf', 'multipart')
+INLINE_CHUNK_SIZE = 256 * 1024
+
+def _preferred_sign_format():
+    """response_format from the Accept header when the form does not name one"""
+    best = request.accept_mimetypes.best_match(['application/json', 'application/pdf', 'multipart/mixed'])
+    return {'application/pdf': 'pdf', 'multipart/mixed': 'multipart'}.get(best, 'json')
+
+def _inline_signed_response(response_format, body, filename, path):
+    """
+    Signed PDF in the sign response itself, streamed from the file at path in
+    INLINE_CHUNK_SIZE pieces.
+      pdf       - application/pdf body, the sign result in X-* headers
+      multipart - multipart/mixed: the JSON sign result, then the PDF
+    """
+    def pdf_chunks():
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(INLINE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    size = os.path.getsize(path)
+    disposition = f'attachment; filename="{filename}"'
+
+    if response_format == 'pdf':
+        headers = {
+            'Content-Disposition': disposition,
+            'Content-Length': str(size),
+            'X-Document-Hash': body['document_hash'],
+            'X-Digest-Alg': body['digest_alg'],
+            'X-Signature': body['signature'],
+        }
+        if body.get('signed_file_sha256'):
+            headers['X-Signed-File-Sha256'] = body['signed_file_sha256']
+        if body.get('download_url'):
+            headers['X-Download-Url'] = body['download_url']
+        if body.get('merkle_root'):
+            headers['X-Signature-Mode'] = body['signature_mode']
+            headers['X-Merkle-Root'] = body['merkle_root']
+            headers['X-Merkle-Proof'] = json.dumps(body['merkle_proof'], separators=(',', ':'))
+        if body.get('idempotent_replay'):
+            headers['X-Idempotent-Replay'] = 'true'
+        if body.get('lane'):
+            headers['X-Processing-Lane'] = body['lane']
+        return Response(stream_with_context(pdf_chunks()), mimetype='application/pdf',
+                        headers=headers)
+
+    boundary = secrets.token_hex(16)
+    def generate():
+        yield (f"--{boundary}\r\n"
+               "Content-Type: application/json\r\n\r\n"
+               f"{json.dumps(body)}\r\n"
+               f"--{boundary}\r\n"
+               "Content-Type: application/pdf\r\n"
+               f"Content-Disposition: {disposition}\r\n"
+               f"Content-Length: {size}\r\n\r\n").encode('utf-8')
+        yield from pdf_chunks()
+        yield f"\r\n--{boundary}--\r\n".encode('ascii')
+
+    return Response(stream_with_context(generate()),
+                    mimetype=f'multipart/mixed; boundary={boundary}')
+
+@app.route('/documents/<path:transaction_id>', methods=['GET'])
+def get_signed_document(transaction_id):
+    """Look up what was signed for a transaction"""
+    record = document_registry.get(transaction_id)
+    if record is None:
+        return jsonify({
+            'success': False,
+            'error': 'Transaction not found'
+        }), 404
+    return jsonify({
+        'success': True,
+        'document': record
+    })
+
+@app.route('/verify-reference', methods=['POST'])
+def verify_reference():
+    """
+    Verify a registered document without re-uploading it.
+    Body: {transaction_id}, {document_hash} and/or {signed_file_sha256} (the SHA-256
+    of a signed PDF the caller holds, hashed locally); with check_file=true the stored
+    signed PDF is re-hashed and compared with the hash recorded at signing time.
+    """
     try:
-        if 'file' not in request.files:
+        data = request.get_json() or {}
+        transaction_id = data.get('transaction_id')
+        document_hash = data.get('document_hash')
+        signed_file_sha256 = data.get('signed_file_sha256')
+
+        if transaction_id:
+            record = document_registry.get(transaction_id)
+        elif document_hash:
+            matches = document_registry.find_by_hash(document_hash, limit=1)
+            record = matches[0] if matches else None
+        elif signed_file_sha256:
+            record = document_registry.find_by_signed_file_sha256(signed_file_sha256)
+        else:
             return jsonify({
                 'success': False,
-                'error': 'No file provided'
+                'error': 'Missing transaction_id, document_hash or signed_file_sha256'
             }), 400
 
-        file = request.files['file']
-        if file.filename == '':
+        if record is None:
             return jsonify({
-                'success': False,
-                'error': 'No file selected'
-            }), 400
+                'success': True,
+                'verification': {
+                    'registered': False,
+                    'overall_valid': False,
+                    'message': 'Document is not registered'
+                }
+            })
 
-        # Save uploaded file temporarily
-        filename = file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"verify_{filename}")
-        file.save(file_path)
+        hash_matches = document_hash is None or document_hash == record['document_hash']
+        # The caller's copy is byte-identical to the signed PDF that was issued
+        file_matches = (None if signed_file_sha256 is None
+                        else signed_file_sha256 == record['signed_file_sha256'])
+        signature_valid = verification_service.verify_payload(record)
+        revocation = revocation_service.check(record['transaction_id'], record['document_hash'])
 
-        logger.info(f"🔍 Starting verification of: {filename}")
+        file_intact = None
+        if data.get('check_file'):
+            path = record['signed_file_path']
+            file_intact = bool(path and os.path.exists(path) and
+                               signature_service._binary_file_hash(path) == record['signed_file_sha256'])
 
-        # Step 1: Extract QR code from PDF
-        logger.info("📱 Step 1: Extracting QR code...")
-        qr_data = qr_service.extract_qr_from_pdf(file_path)
-        
-        if not qr_data:
-            return jsonify({
-                'success': False,
-                'error': 'No QR code found in document or QR code is corrupted'
-            }), 400
+        overall_valid = (hash_matches and file_matches is not False and signature_valid
+                         and file_intact is not False and not revocation)
+        if overall_valid:
+            message = 'Registered document is authentic'
+        elif revocation:
+            message = 'Document has been revoked'
+        elif not hash_matches:
+            message = 'Document hash does not match the registered document'
+        elif file_matches is False:
+            message = 'File does not match the signed PDF issued for this document'
+        elif not signature_valid:
+            message = 'Stored signature is invalid'
+        else:
+            message = 'Stored signed file is missing or has been modified'
 
-        # Step 2: Get original hash and signature from QR data
-        logger.info("📋 Step 2: Parsing QR data...")
-        original_hash = qr_data.get('document_hash')
-        signature_hex = qr_data.get('signature')
+        verification = {
+            'registered': True,
+            'transaction_id': record['transaction_id'],
+            'document_hash': record['document_hash'],
+            'hash_matches': hash_matches,
+            'file_matches': file_matches,
+            'signature_valid': signature_valid,
+            'file_intact': file_intact,
+            'revoked': revocation is not None,
+            'revocation': revocation,
+            'overall_valid': overall_valid,
+            'key_id': record['key_id'],
+            'signed_at': record['created_at'],
+            'message': message
+        }
+        audit_verification('reference', verification)
 
+        return jsonify({
+            'success': True,
+            'verification': verification
+        })
+
+    except Exception as e:
+        logger.error(f"Error verifying by reference: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
-        if not original_hash or not signature_hex:
+@app.route('/revocations', methods=['POST'])
+def revoke_document():
+    """Revoke a signed document by transaction_id and/or document_hash"""
+    try:
+        data = request.get_json() or {}
+        transaction_id = data.get('transaction_id')
+        document_hash = data.get('document_hash')
+        if not transaction_id and not document_hash:
             return jsonify({
                 'success': False,
-                'error': 'Invalid QR code data - missing hash or signature'
+                'error': 'Missing transaction_id or document_hash'
             }), 400
 
-        logger.info(f"📜 Original hash: {original_hash[:16]}...")
-        logger.info(f"✍️  Signature: {signature_hex[:16]}...")
+        revocation_service.revoke(transaction_id, document_hash, data.get('reason'))
+        logger.info(f"🚫 Revoked transaction={transaction_id} hash={document_hash}")
+        audit_log.append('revoke', transaction_id=transaction_id, document_hash=document_hash,
+                         reason=data.get('reason'), client=request.remote_addr)
+        return jsonify({
+            'success': True,
+            'message': 'Document revoked',
+            'transaction_id': transaction_id,
+            'document_hash': document_hash
+        })
+
+    except Exception as e:
+        logger.error(f"Error revoking document: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
-        # Step 3: Generate current document hash (WITHOUT QR code area)
-        logger.info("🔐 Step 3: Generating current document hash...")
-        current_hash = signature_service.generate_document_hash_for_verification(file_path)
-        # current_qr_data = qr_service.extract_qr_from_pdf(file_path)
-        # current_hash = current_qr_data.get('document_hash')
+@app.route('/audit', methods=['GET'])
+def query_audit_log():
+    """
+    Query the audit log by transaction_id, event and/or time range.
+    since/until are Unix timestamps or ISO-8601 datetimes.
+    """
+    try:
+        def parse_time(value):
+            if not value:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return datetime.fromisoformat(value).timestamp()
 
-        logger.info(f"📄 Current hash: {current_hash[:16]}...")
+        records = audit_log.query(
+            transaction_id=request.args.get('transaction_id'),
+            since=parse_time(request.args.get('since')),
+            until=parse_time(request.args.get('until')),
+            event=request.args.get('event'),
+            limit=min(request.args.get('limit', 100, type=int), 1000)
+        )
+        return jsonify({
+            'success': True,
+            'count': len(records),
+            'records': records
+        })
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f"Invalid time range: {str(e)}"
+        }), 400
+    except Exception as e:
+        logger.error(f"Error querying audit log: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
-        # Step 4: Check document integrity
-        logger.info("🔍 Step 4: Checking document integrity...")
-        document_integrity = current_hash == original_hash
-        logger.info(f"📊 Document integrity: {'✅ VALID' if document_integrity else '❌ TAMPERED'}")
+@app.route('/audit/verify', methods=['GET'])
+def verify_audit_log():
+    """Recompute the audit log hash chain"""
+    result = audit_log.verify_chain()
+    if not result['valid']:
+        logger.error(f"❌ Audit log chain broken: {result}")
+    return jsonify({
+        'success': True,
+        'chain': result
+    })
 
-        # Step 5: Verify digital signature
-        logger.info("🔐 Step 5: Verifying digital signature...")
-        signature = bytes.fromhex(signature_hex)
-        signature_valid = verification_service.verify_signature(original_hash, signature)
-        logger.info(f"✍️  Signature validity: {'✅ VALID' if signature_valid else '❌ INVALID'}")
+@app.route('/audit/stats', methods=['GET'])
+def audit_log_stats():
+    """Audit log writer counters"""
+    return jsonify({
+        'success': True,
+        'audit_log': audit_log.get_stats()
+    })
 
-        # Step 6: Determine overall validity
-        overall_valid = document_integrity and signature_valid
-        logger.info(f"🎯 Overall result: {'✅ AUTHENTIC' if overall_valid else '❌ NOT AUTHENTIC'}")
+@app.route('/integrity/findings', methods=['GET'])
+def integrity_findings():
+    """Integrity scanner findings: ?kind=...&include_resolved=1&limit=..."""
+    findings = integrity_scanner.findings(
+        kind=request.args.get('kind'),
+        include_resolved=request.args.get('include_resolved') == '1',
+        limit=min(request.args.get('limit', 100, type=int), 1000)
+    )
+    return jsonify({
+        'success': True,
+        'count': len(findings),
+        'findings': findings
+    })
 
-        # Clean up temporary file
-        os.remove(file_path)
+@app.route('/integrity/stats', methods=['GET'])
+def integrity_stats():
+    """Integrity scanner progress and counters"""
+    return jsonify({
+        'success': True,
+        'integrity': integrity_scanner.get_stats()
+    })
+
+@app.route('/integrity/scan', methods=['POST'])
+def start_integrity_scan():
+    """Start a scan pass now instead of waiting for the interval"""
+    if not integrity_scanner.get_stats()['running']:
+        return jsonify({
+            'success': False,
+            'error': 'Integrity scanner is disabled'
+        }), 409
+    integrity_scanner.request_scan()
+    return jsonify({
+        'success': True,
+        'message': 'Scan requested',
+        'integrity': integrity_scanner.get_stats()
+    }), 202
+
+@app.route('/revocations/check', methods=['GET'])
+def check_revocation():
+    """Check revocation status: ?transaction_id=...&document_hash=..."""
+    revocation = revocation_service.check(
+        request.args.get('transaction_id'),
+        request.args.get('document_hash')
+    )
+    return jsonify({
+        'success': True,
+        'revoked': revocation is not None,
+        'revocation': revocation
+    })
+
+@app.route('/revocations/stats', methods=['GET'])
+def revocation_stats():
+    """Revocation list size and Bloom filter counters"""
+    return jsonify({
+        'success': True,
+        'revocations': revocation_service.get_stats()
+    })
+
+@app.route('/verify-document', methods=['POST'])
+def verify_document():
+    """Verify a signed PDF document - PROPERLY FIXED VERSION"""
+    try:
+        # Save uploaded file temporarily (or take over the finished upload session)
+        file_path, filename, upload_sha256, error = receive_document('verify_')
+        if error:
+            return error
+        try:
+            preflight, executor, error = preflight_document(file_path)
+            if error:
+                return error
+
+            logger.info(f"🔍 Starting verification of: {filename} ({preflight['lane']} lane)")
+
+            # Step 1: Extract QR code from PDF (and hash it, on the same parse - see step 3)
+            logger.info("📱 Step 1: Extracting QR code...")
+            qr_data, current_hash = executor.run(cpu_tasks.inspect_document, file_path,
+                                                 upload_sha256)
         
-        # Determine verification message
-        if overall_valid:
-            message = 'Document is authentic and unmodified'
-        elif not document_integrity and not signature_valid:
-            message = 'Document has been modified AND signature is invalid'
-        elif not document_integrity:
-            message = 'Document has been modified after signing'
-        elif not signature_valid:
-            message = 'Digital signature is invalid'
-        else:
-            message = 'Verification failed'
+            if not qr_data:
+                return jsonify({
+                    'success': False,
+                    'error': 'No QR code found in document or QR code is corrupted'
+                }), 400
 
-        verification_result = {
-            'document_integrity': document_integrity,
-            'signature_valid': signature_valid,
-            'overall_valid': overall_valid,  # Both must be true
-            'transaction_id': qr_data.get('transaction_id'),
-            'timestamp': qr_data.get('timestamp'),
-            'original_hash': original_hash,
-            'current_hash': current_hash,
-            'message': message,
-            'security_details': {
-                'hash_algorithm': 'SHA-256',
-                'signature_algorithm': 'RSA-2048',
-                'verification_timestamp': str(datetime.now()),
-                'tamper_detected': not document_integrity,
-                'signature_verified': signature_valid
+            # Step 2: Get original hash and signature from QR data
+            logger.info("📋 Step 2: Parsing QR data...")
+            original_hash = qr_data.get('document_hash')
+            signature_hex = qr_data.get('signature')
+
+
+            if not original_hash or not signature_hex:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid QR code data - missing hash or signature'
+                }), 400
+
+            logger.info(f"📜 Original hash: {original_hash[:16]}...")
+            logger.info(f"✍️  Signature: {signature_hex[:16]}...")
+
+            # Step 3: Generate current document hash (WITHOUT QR code area)
+            logger.info("🔐 Step 3: Generating current document hash...")
+            digest_alg = qr_data.get('digest_alg') or 'sha256'  # absent on legacy documents
+            if digest_alg not in DIGEST_ALGORITHMS:
+                return jsonify({
+                    'success': False,
+                    'error': f"Unsupported digest algorithm in QR code: {digest_alg}"
+                }), 400
+            # Computed in step 1; SHA-256 uploads were already hashed chunk by chunk
+            # current_qr_data = qr_service.extract_qr_from_pdf(file_path)
+            # current_hash = current_qr_data.get('document_hash')
+
+            logger.info(f"📄 Current hash: {current_hash[:16]}...")
+
+            # Step 4: Check document integrity
+            logger.info("🔍 Step 4: Checking document integrity...")
+            document_integrity = current_hash == original_hash
+            logger.info(f"📊 Document integrity: {'✅ VALID' if document_integrity else '❌ TAMPERED'}")
+
+            # Step 5: Verify digital signature
+            logger.info("🔐 Step 5: Verifying digital signature...")
+            signature_valid = verification_service.verify_payload(qr_data)
+            logger.info(f"✍️  Signature validity: {'✅ VALID' if signature_valid else '❌ INVALID'}")
+
+            # Step 6: Check revocation list
+            revocation = revocation_service.check(qr_data.get('transaction_id'), original_hash)
+            if revocation:
+                logger.info(f"🚫 Document revoked: {revocation['reason']}")
+
+            # Step 7: Determine overall validity
+            overall_valid = document_integrity and signature_valid and not revocation
+            logger.info(f"🎯 Overall result: {'✅ AUTHENTIC' if overall_valid else '❌ NOT AUTHENTIC'}")
+
+            # The receipt binds the exact bytes verified (already hashed for upload sessions)
+            receipt_sha256 = None
+            if request.values.get('receipt', '').lower() in ('1', 'true', 'yes'):
+                receipt_sha256 = upload_sha256 or digest_service.file_digest(file_path, 'sha256')
+
+            # Determine verification message
+            if overall_valid:
+                message = 'Document is authentic and unmodified'
+            elif revocation:
+                message = 'Document has been revoked'
+            elif not document_integrity and not signature_valid:
+                message = 'Document has been modified AND signature is invalid'
+            elif not document_integrity:
+                message = 'Document has been modified after signing'
+            elif not signature_valid:
+                message = 'Digital signature is invalid'
+            else:
+                message = 'Verification failed'
+
+            verification_result = {
+                'document_integrity': document_integrity,
+                'signature_valid': signature_valid,
+                'revoked': revocation is not None,
+                'revocation': revocation,
+                'overall_valid': overall_valid,  # Integrity and signature valid, not revoked
+                'transaction_id': qr_data.get('transaction_id'),
+                'timestamp': qr_data.get('timestamp'),
+                'original_hash': original_hash,
+                'current_hash': current_hash,
+                'message': message,
+                'security_details': {
+                    'hash_algorithm': digest_alg,
+                    'signature_algorithm': 'RSA-2048',
+                    'verification_timestamp': str(datetime.now()),
+                    'tamper_detected': not document_integrity,
+                    'signature_verified': signature_valid
+                }
             }
-        }
+
+            response = {
+                'success': True,
+                'verification': verification_result,
+                'lane': preflight['lane']
+            }
+            # Step 8: Signed receipt, so other systems can rely on this result offline
+            if receipt_sha256:
+                token, claims = receipt_service.issue(receipt_sha256, verification_result)
+                verification_result['receipt_id'] = claims['jti']
+                response['receipt'] = token
+                response['receipt_expires_at'] = datetime.fromtimestamp(claims['exp'], timezone.utc).isoformat()
+            audit_verification('document', verification_result)
         
-        return jsonify({
-            'success': True,
-            'verification': verification_result
-        })
+            return jsonify(response)
+        finally:
+            _discard_upload(file_path)
         
+    except (ExecutorSaturated, JobTimeout) as e:
+        logger.warning(f"Executor rejected verify request: {str(e)}")
+        return executor_error_response(e)
     except Exception as e:
         logger.error(f"💥 Error verifying document: {str(e)}")
         return jsonify({
@@ -271,15 +1459,15 @@ def verify_signature_only():
                 'error': 'Missing document_hash or signature'
             }), 400
         
-        # Convert signature back to bytes
-        signature = bytes.fromhex(signature_hex)
-        
-        # Verify signature
-        signature_valid = verification_service.verify_signature(document_hash, signature)
+        # Verify signature (merkle_root / merkle_proof present for batch-signed documents)
+        signature_valid = verification_service.verify_payload(data)
+        revocation = revocation_service.check(data.get('transaction_id'), document_hash)
         
         return jsonify({
             'success': True,
             'signature_valid': signature_valid,
+            'revoked': revocation is not None,
+            'revocation': revocation,
             'document_hash': document_hash,
         })
         
@@ -290,6 +1478,133 @@ def verify_signature_only():
             'error': str(e)
         }), 500
 
+def _verify_stream_line(index, line):
+    """Verify one NDJSON line: a {document_hash, signature, ...} payload or {qr_data: "..."}"""
+    try:
+        payload = json.loads(line)
+        if isinstance(payload.get('qr_data'), str):
+            payload = json.loads(payload['qr_data'])
+        document_hash = payload.get('document_hash')
+        if not document_hash or not payload.get('signature'):
+            return {
+                'index': index,
+                'success': False,
+                'error': 'Missing document_hash or signature'
+            }
+        revocation = revocation_service.check(payload.get('transaction_id'), document_hash)
+        return {
+            'index': index,
+            'success': True,
+            'signature_valid': verification_service.verify_payload(payload),
+            'revoked': revocation is not None,
+            'document_hash': document_hash,
+            'transaction_id': payload.get('transaction_id'),
+        }
+    except Exception as e:
+        return {
+            'index': index,
+            'success': False,
+            'error': str(e)
+        }
+
+@app.route('/receipts/validate', methods=['POST'])
+def validate_receipts():
+    """
+    Check verification receipts in bulk: {"receipts": [token, or {"receipt": token,
+    "file_sha256": ...}, ...]}. Results are in request order; revoked_now reports
+    revocations recorded after a receipt was issued.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('receipts')
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'error': 'receipts must be a non-empty list'
+            }), 400
+        if len(items) > app.config['RECEIPT_MAX_BATCH']:
+            return jsonify({
+                'success': False,
+                'error': f"At most {app.config['RECEIPT_MAX_BATCH']} receipts per request"
+            }), 413
+
+        results = []
+        for item in items:
+            if isinstance(item, dict):
+                result = receipt_service.validate(item.get('receipt'), item.get('file_sha256'))
+            else:
+                result = receipt_service.validate(item)
+            if result['valid']:
+                claims = result['claims']
+                revocation = revocation_service.check(claims.get('txn'), claims.get('dh'))
+                result['revoked_now'] = revocation is not None
+                result['document_valid'] = claims.get('valid', False) and revocation is None
+            results.append(result)
+
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'valid': sum(r['valid'] for r in results),
+            'results': results
+        })
+
+    except Exception as e:
+        logger.error(f"Error validating receipts: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/receipts/stats', methods=['GET'])
+def receipt_stats():
+    """Receipts issued and validated by this process"""
+    return jsonify({
+        'success': True,
+        'receipts': receipt_service.get_stats()
+    })
+
+@app.route('/verify-stream', methods=['POST'])
+def verify_stream():
+    """
+    Verify many signature payloads in one request.
+    Body is NDJSON (one payload per line); results stream back as NDJSON in input order.
+    """
+    window = app.config['VERIFY_STREAM_WINDOW']
+
+    def generate():
+        pending = deque()
+        index = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            pending.append(verify_stream_pool.submit(_verify_stream_line, index, line))
+            index += 1
+            # Emit finished results in order; block only when the window is full
+            while pending and (pending[0].done() or len(pending) >= window):
+                yield json.dumps(pending.popleft().result()) + '\n'
+        while pending:
+            yield json.dumps(pending.popleft().result()) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/rpc/stats', methods=['GET'])
+def rpc_stats():
+    """Unix-socket RPC listener counters (null when RPC_SOCKET_PATH is unset)"""
+    return jsonify({
+        'success': True,
+        'rpc': rpc_server.get_stats() if rpc_server else None
+    })
+
+@app.route('/verify-stream/stats', methods=['GET'])
+def verify_stream_stats():
+    """Verification memo hit/miss counters"""
+    return jsonify({
+        'success': True,
+        'key_id': verification_service.key_id,
+        'memo': verification_service.memo.get_stats()
+    })
+
 @app.route('/extract-qr', methods=['POST'])
 def extract_qr_data():
     """Extract QR code data from PDF (untuk Laravel integration)"""
@@ -309,28 +1624,130 @@ def extract_qr_data():
 
         # Save uploaded file temporarily
         filename = file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"extract_{filename}")
+        file_path = _upload_path('extract_', filename)
         file.save(file_path)
+        try:
+            preflight, executor, error = preflight_document(file_path)
+            if error:
+                return error
 
-        # Extract QR code data
-        qr_data = qr_service.extract_qr_from_pdf(file_path)
+            # Extract QR code data
+            qr_data = executor.run(cpu_tasks.extract_qr_from_pdf, file_path)
         
-        # Clean up temporary file
-        os.remove(file_path)
+            if qr_data:
+                return jsonify({
+                    'success': True,
+                    'qr_data': qr_data
+                })
+            else:
+                return jsonify({
+                    'success': False,
+                    'error': 'No QR code found in document'
+                })
+        finally:
+            _discard_upload(file_path)
         
-        if qr_data:
+    except (ExecutorSaturated, JobTimeout) as e:
+        logger.warning(f"Executor rejected extract request: {str(e)}")
+        return executor_error_response(e)
+    except Exception as e:
+        logger.error(f"Error extracting QR data: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/verify-image', methods=['POST'])
+def verify_image():
+    """
+    Verify a phone photo or image scan of a signed document.
+    Only the signature and revocation status can be checked; document integrity
+    needs the original PDF.
+    """
+    try:
+        if 'file' not in request.files:
             return jsonify({
-                'success': True,
-                'qr_data': qr_data
-            })
-        else:
+                'success': False,
+                'error': 'No file provided'
+            }), 400
+
+        file = request.files['file']
+        if file.filename == '':
             return jsonify({
                 'success': False,
-                'error': 'No QR code found in document'
+                'error': 'No file selected'
+            }), 400
+
+        # Size checks happen here, before the bytes reach a worker and imdecode
+        max_bytes = app.config['IMAGE_VERIFY_MAX_BYTES']
+        if request.content_length is not None and request.content_length > max_bytes:
+            return jsonify({
+                'success': False,
+                'error': f"Image upload exceeds the {max_bytes} byte limit"
+            }), 413
+        image_bytes = file.read(max_bytes + 1)
+        if len(image_bytes) > max_bytes:
+            return jsonify({
+                'success': False,
+                'error': f"Image upload exceeds the {max_bytes} byte limit"
+            }), 413
+        error = check_image_size(image_bytes, app.config['IMAGE_VERIFY_MAX_PIXELS'])
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error
+            }), 400 if error == UNSUPPORTED_IMAGE else 413
+
+        qr_data, image_info = cpu_executor.run(cpu_tasks.extract_qr_from_image, image_bytes)
+        if 'error' in image_info:
+            return jsonify({
+                'success': False,
+                'error': image_info['error']
+            }), 400
+
+        if not qr_data:
+            return jsonify({
+                'success': False,
+                'error': 'No QR code found in image',
+                'image': image_info
             })
-        
+
+        document_hash = qr_data.get('document_hash')
+        signature_valid = verification_service.verify_payload(qr_data)
+        revocation = revocation_service.check(qr_data.get('transaction_id'), document_hash)
+
+        verification_result = {
+            'signature_valid': signature_valid,
+            'qr_valid': True,
+            'document_integrity': None,  # cannot be checked from a photo
+            'revoked': revocation is not None,
+            'revocation': revocation,
+            'overall_valid': signature_valid and not revocation,
+            'transaction_id': qr_data.get('transaction_id'),
+            'timestamp': qr_data.get('timestamp'),
+            'document_hash': document_hash,
+        }
+
+        if revocation:
+            verification_result['message'] = 'Document has been revoked'
+        elif signature_valid:
+            verification_result['message'] = 'QR code in image has a valid signature'
+        else:
+            verification_result['message'] = 'QR code is readable but signature is invalid'
+
+        audit_verification('image', verification_result)
+
+        return jsonify({
+            'success': True,
+            'verification': verification_result,
+            'image': image_info
+        })
+
+    except (ExecutorSaturated, JobTimeout) as e:
+        logger.warning(f"Executor rejected image verification: {str(e)}")
+        return executor_error_response(e)
     except Exception as e:
-        logger.error(f"Error extracting QR data: {str(e)}")
+        logger.error(f"Error verifying image: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -369,25 +1786,28 @@ def verify_qr_data():
                 'error': 'Invalid QR code data - missing hash or signature'
             }), 400
         
-        # Convert signature back to bytes
-        signature = bytes.fromhex(signature_hex)
-        
-        # Verify signature
-        signature_valid = verification_service.verify_signature(document_hash, signature)
+        # Verify signature (single or Merkle batch)
+        signature_valid = verification_service.verify_payload(qr_data)
+        revocation = revocation_service.check(qr_data.get('transaction_id'), document_hash)
         
         verification_result = {
             'signature_valid': signature_valid,
             'qr_valid': True,  # QR was readable and parseable
-            'overall_valid': signature_valid,
+            'revoked': revocation is not None,
+            'revocation': revocation,
+            'overall_valid': signature_valid and not revocation,
             'transaction_id': qr_data.get('transaction_id'),
             'timestamp': qr_data.get('timestamp'),
             'document_hash': document_hash,
         }
         
-        if signature_valid:
+        if revocation:
+            verification_result['message'] = 'Document has been revoked'
+        elif signature_valid:
             verification_result['message'] = 'QR code and signature are valid'
         else:
             verification_result['message'] = 'QR code is readable but signature is invalid'
+        audit_verification('qr-data', verification_result)
         
         return jsonify({
             'success': True,
@@ -405,18 +1825,48 @@ def verify_qr_data():
 # ENDPOINT YANG SUDAH ADA SEBELUMNYA (JANGAN DIUBAH)
 # ========================================================================================
 
+DOWNLOAD_VERSION_LENGTH = 16
+
 @app.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
-    """Download signed document"""
+    """
+    Download signed document. The ETag is the file's SHA-256, so repeat
+    downloads are 304s; links carrying the matching ?v=<hash prefix> are
+    cached as immutable. Range and If-Range requests are honoured, and with
+    DOWNLOAD_OFFLOAD the body is sent by the front proxy instead.
+    """
     try:
-        file_path = os.path.join(app.config['SIGNED_FOLDER'], filename)
-        if not os.path.exists(file_path):
+        file_path = download_service.resolve(filename)
+        if file_path is None:
             return jsonify({
                 'success': False,
                 'error': 'File not found'
             }), 404
-            
-        return send_file(file_path, as_attachment=True)
+        
+        etag = download_service.etag(file_path)
+        version = request.args.get('v', '')
+        
+        if download_service.offload:
+            response = Response(mimetype='application/pdf',
+                                headers=download_service.offload_headers(file_path))
+            response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
+            response.set_etag(etag)
+            # 304s are answered here; the proxy serves full and range requests
+            response = response.make_conditional(request)
+        else:
+            response = send_file(file_path, as_attachment=True, etag=etag, conditional=True)
+        
+        if len(version) >= DOWNLOAD_VERSION_LENGTH and etag.startswith(version):
+            # Versioned URL: these bytes never change under it
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config['DOWNLOAD_IMMUTABLE_MAX_AGE']
+            response.cache_control.immutable = True
+        else:
+            # The name can be re-issued: always revalidate (cheap 304 via the ETag)
+            response.cache_control.no_cache = True
+            response.cache_control.max_age = None
+        return response
         
     except Exception as e:
         logger.error(f"Error downloading file: {str(e)}")
@@ -425,9 +1875,23 @@ def download_file(filename):
             'error': str(e)
         }), 500
 
+@app.route('/download/stats', methods=['GET'])
+def download_stats():
+    """ETag cache counters and offload mode"""
+    return jsonify({
+        'success': True,
+        'downloads': download_service.get_stats()
+    })
+
 @app.route('/verify', methods=['GET'])
 def verify_page():
-    """Simple verification page for QR code links"""
+    """
+    Verification page for QR code links. The fragment holds a transaction
+    reference (r=<id>, looked up via /documents/<id>) or, for documents without
+    one, the signed fields themselves; either way the signature is checked in
+    the browser (WebCrypto + JWKS). Uploading the PDF remains for the document
+    integrity check.
+    """
     return '''
     <!DOCTYPE html>
     <html>
@@ -463,6 +1927,7 @@ def verify_page():
     <body>
         <div class="container">
             <h1>Verifikasi Dokumen Digital</h1>
+            <div id="clientResult"></div>
             <p>Upload dokumen PDF untuk memverifikasi keaslian dan integritas dokumen.</p>
             
             <div class="upload-area">
@@ -477,6 +1942,179 @@ def verify_page():
         </div>
         
         <script>
+            // ---- Client-side verification of the payload in the URL fragment ----
+            const encoder = new TextEncoder();
+
+            function esc(value) {
+                const div = document.createElement('div');
+                div.textContent = value == null || value === '' ? '-' : String(value);
+                return div.innerHTML;
+            }
+
+            function b64urlToBytes(text) {
+                text = text.replace(/-/g, '+').replace(/_/g, '/');
+                while (text.length % 4) text += '=';
+                const binary = atob(text);
+                const bytes = new Uint8Array(binary.length);
+                for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+                return bytes;
+            }
+
+            function hexToBytes(hex) {
+                const bytes = new Uint8Array(hex.length / 2);
+                for (let i = 0; i < bytes.length; i++) bytes[i] = parseInt(hex.substr(i * 2, 2), 16);
+                return bytes;
+            }
+
+            function bytesToHex(bytes) {
+                return Array.from(bytes).map(b => b.toString(16).padStart(2, '0')).join('');
+            }
+
+            async function sha256(...parts) {
+                const buffer = new Uint8Array(parts.reduce((n, part) => n + part.length, 0));
+                let offset = 0;
+                for (const part of parts) { buffer.set(part, offset); offset += part.length; }
+                return new Uint8Array(await crypto.subtle.digest('SHA-256', buffer));
+            }
+
+            // Same construction as services/batch_signing_service.py
+            async function merkleRoot(leafMessage, proof) {
+                let node = await sha256(new Uint8Array([0]), encoder.encode(leafMessage));
+                for (const step of proof) {
+                    const sibling = hexToBytes(step.slice(1));
+                    node = step[0] === 'L'
+                        ? await sha256(new Uint8Array([1]), sibling, node)
+                        : await sha256(new Uint8Array([1]), node, sibling);
+                }
+                return bytesToHex(node);
+            }
+
+            async function findKey(kid) {
+                // The JWKS is served with a long max-age; revalidate only for an unknown kid
+                for (const cache of ['default', 'no-cache']) {
+                    const response = await fetch('/.well-known/jwks.json', { cache });
+                    if (!response.ok) throw new Error('Kunci publik tidak tersedia');
+                    const keys = (await response.json()).keys;
+                    const jwk = kid ? keys.find(k => k.kid === kid) : keys[0];
+                    if (jwk) return jwk;
+                }
+                return null;
+            }
+
+            async function checkRevocation(payload) {
+                try {
+                    const params = new URLSearchParams({ transaction_id: payload.t || '', document_hash: payload.h });
+                    const response = await fetch('/revocations/check?' + params);
+                    return (await response.json()).revoked;
+                } catch (error) {
+                    return null;  // unknown, the signature result still stands
+                }
+            }
+
+            function showClientResult(valid, message, payload) {
+                const div = document.getElementById('clientResult');
+                div.className = 'result ' + (valid ? 'success' : 'error');
+                div.innerHTML = `
+                    <h3>Hasil Verifikasi Tautan QR</h3>
+                    <p><strong>Status:</strong> ${esc(message)}</p>
+                    ${payload ? `
+                    <p><strong>ID Transaksi:</strong> ${esc(payload.t)}</p>
+                    <p><strong>Tanggal:</strong> ${esc(payload.d)}</p>
+                    <p><strong>Hash Dokumen:</strong> <code>${esc(payload.h)}</code></p>` : ''}
+                    <p>Untuk memeriksa integritas isi dokumen, upload file PDF di bawah ini.</p>
+                `;
+            }
+
+            // Registry record from /documents/<id>, in the compact field names of an inline fragment
+            async function lookupReference(transactionId) {
+                const response = await fetch('/documents/' + encodeURIComponent(transactionId));
+                if (response.status === 404) return null;
+                if (!response.ok) throw new Error('Data transaksi tidak tersedia');
+                const doc = (await response.json()).document;
+                const payload = {
+                    t: doc.transaction_id,
+                    h: doc.document_hash,
+                    s: bytesToB64url(hexToBytes(doc.signature)),
+                    d: doc.created_at,
+                    k: doc.key_id,
+                };
+                if (doc.digest_alg && doc.digest_alg !== 'sha256') payload.a = doc.digest_alg;
+                if (doc.merkle_root) {
+                    payload.m = doc.merkle_root;
+                    payload.p = doc.merkle_proof || [];
+                }
+                return payload;
+            }
+
+            function bytesToB64url(bytes) {
+                return btoa(String.fromCharCode(...bytes)).replace(/\+/g, '-').replace(/\//g, '_').replace(/=+$/, '');
+            }
+
+            async function verifyFragment() {
+                if (location.hash.length < 2) return;
+                const fragment = location.hash.slice(1);
+                let payload;
+                try {
+                    if (fragment.startsWith('r=')) {
+                        payload = await lookupReference(decodeURIComponent(fragment.slice(2)));
+                        if (!payload) {
+                            showClientResult(false, 'Transaksi tidak terdaftar', null);
+                            return;
+                        }
+                    } else {
+                        payload = JSON.parse(new TextDecoder().decode(b64urlToBytes(fragment)));
+                    }
+                } catch (error) {
+                    showClientResult(false, 'Data verifikasi pada tautan tidak valid', null);
+                    return;
+                }
+                if (!window.crypto || !crypto.subtle) {
+                    showClientResult(false, 'Browser tidak mendukung verifikasi lokal, silakan upload dokumen PDF', payload);
+                    return;
+                }
+                try {
+                    const jwk = await findKey(payload.k);
+                    if (!jwk) {
+                        showClientResult(false, 'Kunci penandatangan tidak dikenal', payload);
+                        return;
+                    }
+                    const key = await crypto.subtle.importKey(
+                        'jwk', { kty: jwk.kty, n: jwk.n, e: jwk.e, alg: 'PS256', ext: true },
+                        { name: 'RSA-PSS', hash: 'SHA-256' }, false, ['verify']
+                    );
+                    // Signatures use the maximum PSS salt length: modulus bytes - hash bytes - 2
+                    const saltLength = b64urlToBytes(jwk.n).length - 32 - 2;
+
+                    // Digests other than legacy SHA-256 are bound into the signed message
+                    let message = payload.a ? payload.a + ':' + payload.h : payload.h;
+                    if (payload.p) {
+                        const root = await merkleRoot(message, payload.p);
+                        if (root !== payload.m) {
+                            showClientResult(false, 'Tanda tangan digital tidak valid', payload);
+                            return;
+                        }
+                        message = 'merkle-sha256:' + root;
+                    }
+                    const signatureValid = await crypto.subtle.verify(
+                        { name: 'RSA-PSS', saltLength }, key,
+                        b64urlToBytes(payload.s), encoder.encode(message)
+                    );
+                    if (!signatureValid) {
+                        showClientResult(false, 'Tanda tangan digital tidak valid', payload);
+                    } else if (await checkRevocation(payload)) {
+                        showClientResult(false, 'Dokumen telah dicabut (revoked)', payload);
+                    } else {
+                        showClientResult(true, 'Tanda tangan digital valid', payload);
+                    }
+                } catch (error) {
+                    showClientResult(false, 'Error: ' + error.message, payload);
+                }
+            }
+
+            verifyFragment();
+            window.addEventListener('hashchange', verifyFragment);
+
+            // ---- Server-side fallback: upload the PDF for the integrity check ----
             document.getElementById('fileInput').addEventListener('change', verifyDocument);
             
             function verifyDocument() {
@@ -527,7 +2165,7 @@ if __name__ == '__main__':
     # Generate keys if they don't exist
     if not os.path.exists('keys/private_key.pem') or not os.path.exists('keys/public_key.pem'):
         logger.info("Generating RSA key pair...")
-        signature_service.generate_keys()
+        SignatureService().generate_keys()
         logger.info("Keys generated successfully")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
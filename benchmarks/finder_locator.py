@@ -0,0 +1,88 @@
+"""
+QR extraction on PDFs whose QR is not in our stamp position: finder-pattern
+locator vs. full-page decoding at zoom 1/2/3.
+
+Usage: python benchmarks/finder_locator.py [count]
+Builds `count` (default 12) text pages with a QR of random size (60-200pt)
+at a random spot, then reports per-document latency and hit rate of both
+paths, plus the locator's own scan time.
+"""
+
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+import numpy as np
+
+logging.disable(logging.CRITICAL)
+
+from services.finder_locator import qr_candidate_boxes
+from services.qr_service import QRService, pixmap_to_gray
+from services.document_session import DocumentSession
+
+LOREM = ("Invoice line item, quantity and unit price as agreed in the order. "
+         "Payment due within thirty days of the invoice date. ") * 40
+
+
+def make_document(path, qr_png, rng):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_textbox(fitz.Rect(50, 50, 545, 792), LOREM, fontsize=9)
+    size = float(rng.uniform(60, 200))
+    x = float(rng.uniform(20, 595 - size - 20))
+    y = float(rng.uniform(20, 842 - size - 20))
+    page.draw_rect(fitz.Rect(x, y, x + size, y + size), color=None, fill=(1, 1, 1))
+    page.insert_image(fitz.Rect(x, y, x + size, y + size), stream=qr_png)
+    doc.save(path)
+    doc.close()
+
+
+def run(service, paths, expected):
+    times, hits = [], 0
+    for path in paths:
+        start = time.perf_counter()
+        result = service.extract_qr_from_pdf(path)
+        times.append((time.perf_counter() - start) * 1000)
+        hits += bool(result) and result.get('transaction_id') == expected
+    return hits, times
+
+
+def main(count=12):
+    rng = np.random.default_rng(0)
+    full_page = QRService(locator_zoom=0)
+    located = QRService()
+    payload = {'transaction_id': 'LOCATOR-BENCH', 'document_hash': 'ab' * 32,
+               'signature': 'cd' * 256, 'timestamp': '2024-01-01'}
+    qr_png = located.generate_qr_png(payload)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(count):
+            path = os.path.join(tmp, f"doc_{i}.pdf")
+            make_document(path, qr_png, rng)
+            paths.append(path)
+
+        scan_ms = []
+        for path in paths:
+            with DocumentSession(path) as session:
+                gray = session.render(0, located.locator_zoom, pixmap_to_gray, gray=True)
+                start = time.perf_counter()
+                qr_candidate_boxes(gray, located.locator_max_candidates)
+                scan_ms.append((time.perf_counter() - start) * 1000)
+
+        print(f"Documents: {count}, locator zoom {located.locator_zoom}, "
+              f"scan median {statistics.median(scan_ms):.1f}ms")
+        for name, service in (('full-page', full_page), ('locator', located)):
+            hits, times = run(service, paths, payload['transaction_id'])
+            print(f"{name:10s} hits {hits}/{count}  median {statistics.median(times):7.1f}ms  "
+                  f"max {max(times):7.1f}ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 12)
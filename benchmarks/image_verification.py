@@ -0,0 +1,73 @@
+"""
+Benchmark QR extraction from phone-photo style images of signed PDFs.
+
+Usage: python benchmarks/image_verification.py [megapixels] [pdf ...]
+Places each page (defaults to signed/*.pdf) into a perspective-distorted,
+unevenly lit 12MP (default) JPEG, runs ImageQRService on it and reports hit
+rate and latency per megapixel against IMAGE_VERIFY_TARGET_MS_PER_MP (50).
+Exits 1 if the median misses the target.
+"""
+
+import glob
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from services.qr_decoders import DecoderCascade
+from services.image_qr_service import ImageQRService
+from benchmarks.qr_decoders import render_page
+
+
+def make_photo(page, megapixels, rng):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    h, w = page.shape[:2]
+    s = min(width / w, height / h) * 0.9
+    cx, cy, hw, hh = width / 2, height / 2, w * s / 2, h * s / 2
+
+    def jitter():
+        return rng.uniform(-0.05, 0.05) * width
+
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = np.float32([[cx - hw + jitter(), cy - hh + jitter()], [cx + hw + jitter(), cy - hh + jitter()],
+                      [cx + hw + jitter(), cy + hh + jitter()], [cx - hw + jitter(), cy + hh + jitter()]])
+    photo = np.full((height, width, 3), (90, 110, 130), np.uint8)
+    cv2.warpPerspective(page, cv2.getPerspectiveTransform(src, dst), (width, height),
+                        dst=photo, borderMode=cv2.BORDER_TRANSPARENT)
+    lighting = np.linspace(0.75, 1.0, width, dtype=np.float32)[None, :, None]
+    photo = np.clip(photo * lighting + rng.normal(0, 4, photo.shape), 0, 255).astype(np.uint8)
+    return cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def main(megapixels, paths, target=50):
+    service = ImageQRService(DecoderCascade(auto_order=True), target_ms_per_megapixel=target)
+    rng = np.random.default_rng(0)
+    photos = [make_photo(render_page(path), megapixels, rng) for path in paths]
+
+    hits, per_mp = 0, []
+    for path, photo in zip(paths, photos):
+        qr_data, info = service.extract_qr_from_image(photo)
+        hits += qr_data is not None
+        per_mp.append(info['ms_per_megapixel'])
+        print(f"{os.path.basename(path):28s} found={qr_data is not None!s:5s} "
+              f"{info['elapsed_ms']:.0f}ms ({info['ms_per_megapixel']:.1f}ms/MP) "
+              f"candidates={info['candidates']} method={info['method']}")
+
+    median = statistics.median(per_mp)
+    print(f"Hit rate {hits}/{len(photos)}  median {median:.1f}ms/MP  "
+          f"max {max(per_mp):.1f}ms/MP  (target {target}ms/MP)")
+    if median > target:
+        print("FAIL: median latency exceeds target")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    mp = float(args.pop(0)) if args and not args[0].endswith('.pdf') else 12
+    main(mp, args or sorted(glob.glob('signed/*.pdf')))
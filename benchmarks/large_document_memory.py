@@ -0,0 +1,128 @@
+"""
+Check that hashing and QR extraction of large PDFs stay under a memory ceiling.
+
+Usage: python benchmarks/large_document_memory.py [size_mb] [ceiling_mb] [pages] [pages_ceiling_mb]
+Two documents, each generated in a child process and measured in a fresh one:
+  - scanned     about size_mb (default 200) of full-page scans: binary hash,
+                content hash and QR extraction, peak RSS growth over the
+                post-import baseline at most ceiling_mb (default 320)
+  - many-pages  `pages` (default 3000) text pages: binary and content hash,
+                growth at most pages_ceiling_mb (default 64), i.e. content
+                hashing must not grow with the page count
+Raises AssertionError (exit 1) when either bound is exceeded.
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LOREM = ("Statement line with account number, booking date, amount and balance. "
+         "Carried forward from the previous page of this archive. ") * 20
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_scanned(path, size_mb):
+    import cv2
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    # High-resolution noise scans: incompressible, so few pages reach the target size
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (8000, 6000, 3), dtype=np.uint8)
+    ok, jpeg = cv2.imencode('.jpg', noise, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    jpeg = jpeg.tobytes()
+    noise = None
+
+    doc = fitz.open()
+    pages = max(1, round(size_mb * 1024 * 1024 / len(jpeg)))
+    for i in range(pages):
+        page = doc.new_page()
+        # Trailing bytes after the JPEG end marker make each page's image distinct,
+        # otherwise PyMuPDF stores identical images only once
+        page.insert_image(page.rect, stream=jpeg + i.to_bytes(4, 'little'))
+        page.insert_text((72, 72), f"Scanned archive page {i + 1}")
+    doc.save(path)
+    doc.close()
+
+
+def generate_pages(path, pages):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for i in range(int(pages)):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), f"Page {i + 1}. {LOREM}", fontsize=9)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def measure(path, stages):
+    import logging
+    logging.disable(logging.CRITICAL)
+    from services.signature_service import SignatureService
+    from services.qr_service import QRService
+
+    signature_service = SignatureService(large_document_bytes=0)
+    qr_service = QRService(large_document_bytes=0)
+    baseline = peak_rss_mb()
+
+    runs = {
+        'binary_hash': signature_service.generate_document_hash_for_verification,
+        'content_hash': signature_service.generate_document_hash,
+        'qr_extraction': qr_service.extract_qr_from_pdf,
+    }
+    timings = {}
+    for stage in stages.split(','):
+        start = time.perf_counter()
+        runs[stage](path)
+        timings[f"{stage}_s"] = time.perf_counter() - start
+
+    print(json.dumps({'baseline_mb': baseline, 'peak_mb': peak_rss_mb(), **timings}))
+
+
+def check(name, generate_args, stages, ceiling_mb):
+    """Generate and measure one document; raises AssertionError above ceiling_mb of growth"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{name}.pdf")
+        subprocess.run([sys.executable, __file__, '--generate', name, path, str(generate_args)],
+                       check=True)
+        file_mb = os.path.getsize(path) / 1024 / 1024
+
+        out = subprocess.run([sys.executable, __file__, '--measure', path, stages],
+                             check=True, capture_output=True, text=True, cwd=ROOT)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    growth = result['peak_mb'] - result['baseline_mb']
+    print(f"{name}: file {file_mb:.0f}MB  baseline RSS {result['baseline_mb']:.0f}MB  "
+          f"peak RSS {result['peak_mb']:.0f}MB  growth {growth:.0f}MB (ceiling {ceiling_mb:.0f}MB)")
+    print("  " + "  ".join(f"{key[:-2].replace('_', ' ')} {value:.2f}s"
+                           for key, value in result.items() if key.endswith('_s')))
+    if growth > ceiling_mb:
+        raise AssertionError(f"{name}: peak RSS grew {growth:.0f}MB, ceiling is {ceiling_mb:.0f}MB")
+
+
+def main(size_mb=200, ceiling_mb=320, pages=3000, pages_ceiling_mb=64):
+    check('scanned', size_mb, 'binary_hash,content_hash,qr_extraction', ceiling_mb)
+    check('many-pages', int(pages), 'binary_hash,content_hash', pages_ceiling_mb)
+    print("OK")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--generate':
+        generate = generate_scanned if sys.argv[2] == 'scanned' else generate_pages
+        generate(sys.argv[3], float(sys.argv[4]))
+    elif len(sys.argv) > 1 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main(*(float(a) for a in sys.argv[1:5]))
@@ -0,0 +1,43 @@
+"""
+Compare signed-PDF output profiles: save time versus file size.
+
+Usage: python benchmarks/pdf_output_profiles.py [pdf ...]   (defaults to signed/*.pdf)
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qrcode
+
+from services.pdf_service import PDFService, OUTPUT_PROFILES
+
+
+def main(paths, repeat=3):
+    pdf_service = PDFService()
+    with tempfile.TemporaryDirectory() as tmp:
+        qr_path = os.path.join(tmp, 'qr.png')
+        qrcode.make('{"transaction_id": "BENCH", "document_hash": "' + '0' * 64 + '"}').save(qr_path)
+        input_size = sum(os.path.getsize(p) for p in paths)
+
+        print(f"Corpus: {len(paths)} PDFs, {input_size / 1024:.1f}KB")
+        print(f"{'profile':16s} {'stamp+save ms':>13s} {'total KB':>10s} {'vs input':>9s}")
+        for profile in OUTPUT_PROFILES:
+            timings, total_size = [], 0
+            for i, path in enumerate(paths):
+                out_path = os.path.join(tmp, f"{profile}_{i}.pdf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    pdf_service.add_qr_to_pdf(path, qr_path, out_path, profile)
+                    timings.append((time.perf_counter() - start) * 1000)
+                total_size += os.path.getsize(out_path)
+            print(f"{profile:16s} {sum(timings) / len(timings):13.2f} "
+                  f"{total_size / 1024:10.1f} {total_size / input_size:8.0%}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or sorted(glob.glob('signed/*.pdf')))
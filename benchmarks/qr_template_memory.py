@@ -0,0 +1,98 @@
+"""
+QR extraction with and without learned template locations.
+
+Usage: python benchmarks/qr_template_memory.py [count]
+Builds `count` (default 12) documents from each of two templates (A4 letter
+with the QR bottom-right, landscape form with the QR on the last of three
+pages, its position jittered by a few points), then extracts the QR from
+every document with
+  - cold     no template memory: locator, full-page renders, images, text
+  - learned  a fresh QRTemplateMemory: the first document of each template
+             pays the full search, the rest decode one padded box
+and reports hits, median/max latency and the learned table.
+"""
+
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+import numpy as np
+
+logging.disable(logging.CRITICAL)
+
+from services.qr_service import QRService
+from services.qr_template_service import QRTemplateMemory
+
+LOREM = ("Invoice line item, quantity and unit price as agreed in the order. "
+         "Payment due within thirty days of the invoice date. ") * 40
+
+TEMPLATES = {
+    # name: (page size, pages, QR page, QR box, producer)
+    'letter': ((595, 842), 1, 0, (440, 690, 540, 790), 'Letter Generator 2.1'),
+    'form': ((842, 595), 3, 2, (60, 420, 180, 540), 'Forms Engine 7'),
+}
+
+
+def make_document(path, template, qr_png, rng):
+    (width, height), pages, qr_page, (x0, y0, x1, y1), producer = TEMPLATES[template]
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=width, height=height)
+        page.insert_textbox(fitz.Rect(50, 50, width - 50, height - 160), LOREM, fontsize=9)
+        if page_num == qr_page:
+            dx, dy = (float(v) for v in rng.uniform(-6, 6, 2))
+            page.insert_image(fitz.Rect(x0 + dx, y0 + dy, x1 + dx, y1 + dy), stream=qr_png)
+    doc.set_metadata({'producer': producer, 'creator': template})
+    doc.save(path)
+    doc.close()
+
+
+def run(service, paths, expected):
+    times, hits = [], 0
+    for path in paths:
+        start = time.perf_counter()
+        result = service.extract_qr_from_pdf(path)
+        times.append((time.perf_counter() - start) * 1000)
+        hits += bool(result) and result.get('transaction_id') == expected
+    return hits, times
+
+
+def main(count=12):
+    rng = np.random.default_rng(0)
+    payload = {'transaction_id': 'TEMPLATE-BENCH', 'document_hash': 'ab' * 32,
+               'signature': 'cd' * 256, 'timestamp': '2024-01-01'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = QRTemplateMemory(os.path.join(tmp, 'qr_templates.db'))
+        cold = QRService()
+        learned = QRService(template_memory=memory)
+        qr_png = cold.generate_qr_png(payload)
+
+        paths = []
+        for i in range(count):
+            for template in TEMPLATES:
+                path = os.path.join(tmp, f"{template}_{i}.pdf")
+                make_document(path, template, qr_png, rng)
+                paths.append(path)
+
+        print(f"Documents: {len(paths)} ({count} per template, {len(TEMPLATES)} templates)")
+        for name, service in (('cold', cold), ('learned', learned)):
+            hits, times = run(service, paths, payload['transaction_id'])
+            print(f"{name:8s} hits {hits}/{len(paths)}  median {statistics.median(times):7.1f}ms  "
+                  f"max {max(times):7.1f}ms")
+
+        stats = memory.get_stats()
+        print(f"learned table: {stats['templates']} templates, counters {stats['counters']}")
+        for entry in stats['top_templates']:
+            print(f"  {entry['fingerprint']}  page {entry['page']:2d}  {entry['method']:7s} "
+                  f"zoom {entry['zoom']:.1f}  hits {entry['hits']}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 12)
@@ -0,0 +1,128 @@
+"""
+Signature verification over HTTP/JSON vs. the Unix-socket binary RPC.
+
+Usage: python benchmarks/rpc_vs_http.py [count]
+Signs `count` (default 2000) distinct hashes, then verifies all of them via
+  - HTTP  POST /verify-signature-only and /verify-qr-data (one keep-alive
+          HTTP/1.1 connection, JSON bodies with hex signatures)
+  - RPC   VERIFY and VERIFY_QR, one call at a time and pipelined in batches of 64
+and reports requests/s and per-call latency. The verdict memo is disabled
+(VERIFY_MEMO_SIZE=0) so every call pays for the RSA verify; set it in the
+environment to measure the memo-hit path instead.
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+TMP = tempfile.mkdtemp(prefix='rpc-bench-')
+os.environ['RPC_SOCKET_PATH'] = os.path.join(TMP, 'signer.sock')
+os.environ.setdefault('VERIFY_MEMO_SIZE', '0')
+os.environ['INTEGRITY_SCAN_ENABLED'] = '0'
+os.environ['AUDIT_LOG_DIR'] = os.path.join(TMP, 'audit')
+os.environ['EXECUTOR_ENABLED'] = '0'
+
+logging.disable(logging.CRITICAL)
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+import app as service
+from services.rpc_service import RPCClient, OP_VERIFY, OP_VERIFY_QR
+
+PIPELINE_DEPTH = 64
+
+
+def make_payloads(count):
+    payloads = []
+    for i in range(count):
+        document_hash = hashlib.sha256(f"rpc-bench-{i}".encode()).hexdigest()
+        signature = service.signature_service.sign_document(document_hash)
+        payloads.append({'transaction_id': f"RPC-{i}", 'document_hash': document_hash,
+                         'signature': signature.hex(), 'timestamp': '2024-01-01'})
+    return payloads
+
+
+def timed(calls):
+    """calls: iterable of zero-arg callables, each one request (or one pipelined batch)"""
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        t = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - t) * 1000)
+    return time.perf_counter() - start, latencies
+
+
+def http_calls(conn, path, bodies):
+    def call(body):
+        conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        result = json.loads(response.read())
+        assert result['success'], result
+    return [lambda body=body: call(body) for body in bodies]
+
+
+def report(name, count, elapsed, latencies, per_call=1):
+    per_request = [latency / per_call for latency in latencies]
+    print(f"{name:28s} {count / elapsed:9.0f} req/s   median {statistics.median(per_request):7.3f}ms"
+          f"   p99 {sorted(per_request)[int(len(per_request) * 0.99) - 1]:7.3f}ms")
+
+
+def main(count=2000):
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'  # keep-alive, like a pooled client
+    server = make_server('127.0.0.1', 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    payloads = make_payloads(count)
+    qr_strings = [json.dumps(p) for p in payloads]
+    print(f"{count} distinct signatures, memo size {service.app.config['VERIFY_MEMO_SIZE']}")
+
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port)
+    elapsed, latencies = timed(http_calls(conn, '/verify-signature-only',
+                                          [json.dumps(p) for p in payloads]))
+    report('HTTP /verify-signature-only', count, elapsed, latencies)
+    elapsed, latencies = timed(http_calls(conn, '/verify-qr-data',
+                                          [json.dumps({'qr_data': q}) for q in qr_strings]))
+    report('HTTP /verify-qr-data', count, elapsed, latencies)
+    conn.close()
+
+    with RPCClient(service.app.config['RPC_SOCKET_PATH']) as client:
+        raw = [bytes.fromhex(p['signature']) for p in payloads]
+        elapsed, latencies = timed(
+            lambda p=p, s=s: client.verify(p['document_hash'], s, transaction_id=p['transaction_id'])
+            for p, s in zip(payloads, raw))
+        report('RPC VERIFY', count, elapsed, latencies)
+        elapsed, latencies = timed(lambda q=q: client.verify_qr(q) for q in qr_strings)
+        report('RPC VERIFY_QR', count, elapsed, latencies)
+
+        batches = [[(OP_VERIFY, None, p['document_hash'], s, p['transaction_id'], None)
+                    for p, s in zip(payloads[i:i + PIPELINE_DEPTH], raw[i:i + PIPELINE_DEPTH])]
+                   for i in range(0, count, PIPELINE_DEPTH)]
+        elapsed, latencies = timed(lambda b=b: client.call_many(b) for b in batches)
+        report(f"RPC VERIFY x{PIPELINE_DEPTH} pipelined", count, elapsed, latencies, PIPELINE_DEPTH)
+        batches = [[(OP_VERIFY_QR, q) for q in qr_strings[i:i + PIPELINE_DEPTH]]
+                   for i in range(0, count, PIPELINE_DEPTH)]
+        elapsed, latencies = timed(lambda b=b: client.call_many(b) for b in batches)
+        report(f"RPC VERIFY_QR x{PIPELINE_DEPTH} pipelined", count, elapsed, latencies, PIPELINE_DEPTH)
+
+        results = client.call_many(batches[0])
+        assert all(r['signature_valid'] for r in results), results
+
+    server.shutdown()
+    service.rpc_server.stop()
+    service.audit_log.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,6 @@
+# client - Python SDK for the signing service (pooled sessions, batch helpers, retries)
+
+from client.signing_client import SigningClient, SigningClientError, hash_file
+from client.receipts import ReceiptError, check_receipt
+
+__all__ = ['SigningClient', 'SigningClientError', 'hash_file', 'ReceiptError', 'check_receipt']
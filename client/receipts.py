@@ -0,0 +1,72 @@
+# client/receipts.py - Offline check of the service's signed verification receipts
+
+import json
+import time
+import base64
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+RECEIPT_TYPE = 'verification-receipt+jwt'
+_PSS = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH)
+
+
+class ReceiptError(Exception):
+    """The receipt is malformed, expired, for another file or not signed by a known key"""
+
+
+def _b64url_decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _public_keys(jwks):
+    """{kid: RSA public key} from a JWK Set (as served at /.well-known/jwks.json)"""
+    keys = {}
+    for jwk in jwks.get('keys', []):
+        if jwk.get('kty') != 'RSA':
+            continue
+        numbers = rsa.RSAPublicNumbers(int.from_bytes(_b64url_decode(jwk['e']), 'big'),
+                                       int.from_bytes(_b64url_decode(jwk['n']), 'big'))
+        keys[jwk.get('kid')] = numbers.public_key()
+    return keys
+
+
+def check_receipt(token, jwks, file_sha256=None, now=None, leeway=60):
+    """
+    Claims of a receipt from /verify-document, checked without contacting the
+    service: PS256 signature by a key in jwks, not expired, and (if given) for
+    the file whose SHA-256 is file_sha256. Raises ReceiptError otherwise.
+    claims['valid'] is the verdict; revocations after claims['iat'] are only
+    visible to the service (SigningClient.validate_receipts).
+
+        jwks = client.jwks()  # cache it; refetch when a kid is unknown
+        claims = check_receipt(token, jwks, file_sha256=hash_file('invoice.pdf'))
+    """
+    try:
+        header_b64, claims_b64, signature_b64 = token.split('.')
+        header = json.loads(_b64url_decode(header_b64))
+        claims = json.loads(_b64url_decode(claims_b64))
+        signature = _b64url_decode(signature_b64)
+    except (AttributeError, ValueError):
+        raise ReceiptError('Malformed receipt')
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise ReceiptError('Malformed receipt')
+    if header.get('alg') != 'PS256' or header.get('typ') != RECEIPT_TYPE:
+        raise ReceiptError('Not a verification receipt')
+
+    public_key = _public_keys(jwks).get(header.get('kid'))
+    if public_key is None:
+        raise ReceiptError('Receipt signed with an unknown key')
+    try:
+        public_key.verify(signature, f"{header_b64}.{claims_b64}".encode('ascii'),
+                          _PSS, hashes.SHA256())
+    except InvalidSignature:
+        raise ReceiptError('Invalid receipt signature')
+
+    now = now if now is not None else time.time()
+    if not isinstance(claims.get('exp'), int) or now > claims['exp'] + leeway:
+        raise ReceiptError('Receipt expired')
+    if file_sha256 and claims.get('sub') != str(file_sha256).lower():
+        raise ReceiptError('Receipt is for a different file')
+    return claims
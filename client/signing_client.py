@@ -0,0 +1,402 @@
+# client/signing_client.py - Pooled HTTP client for the signing service, built on requests
+
+import io
+import os
+import json
+import time
+import random
+import hashlib
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+READ_SIZE = 1024 * 1024  # 1MB
+# 503: the server's executor rejected the job before doing any work, always safe to repeat
+RETRY_ALWAYS = (429, 503)
+# The request may have been processed: repeat only idempotent calls
+RETRY_IDEMPOTENT = (502, 504)
+
+
+class SigningClientError(Exception):
+    """Non-2xx response (after retries); response is the parsed JSON body when there is one"""
+
+    def __init__(self, status_code, message, response=None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.response = response
+
+
+def hash_file(file, algorithm='sha256'):
+    """
+    Hex digest of a path or binary file object, read in 1MB blocks.
+    A file object is hashed from its current position, which is restored.
+    """
+    hasher = hashlib.new(algorithm)
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return hash_file(f, algorithm)
+    start = file.tell()
+    try:
+        while True:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    finally:
+        file.seek(start)
+    return hasher.hexdigest()
+
+
+class _MultipartBody:
+    """
+    multipart/form-data body read straight from a file object: the form fields
+    and part headers are built up front, the file itself is never held in
+    memory. For a seekable file the body has a length, so requests sends
+    Content-Length; otherwise send chunks() (chunked transfer encoding).
+    """
+
+    def __init__(self, fields, file_field, fileobj, filename, content_type='application/pdf',
+                 seekable=True):
+        boundary = secrets.token_hex(16)
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = io.BytesIO()
+        for name, value in fields.items():
+            if value is None:
+                continue
+            head.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                       f'{value}\r\n'.encode('utf-8'))
+        filename = filename.replace('"', '%22')
+        head.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                   f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'.encode('utf-8'))
+        tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+        self._length = 0
+        if seekable:
+            start = fileobj.tell()
+            fileobj.seek(0, os.SEEK_END)
+            self._length = head.tell() + fileobj.tell() - start + len(tail)
+            fileobj.seek(start)
+        head.seek(0)
+        self._parts = deque([head, fileobj, io.BytesIO(tail)])
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.popleft()
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def chunks(self):
+        while True:
+            chunk = self.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class _Upload:
+    """A path (opened per call) or a caller's file object (rewound per attempt)"""
+
+    def __init__(self, file, filename=None):
+        self._owned = isinstance(file, (str, os.PathLike))
+        self.fileobj = open(file, 'rb') if self._owned else file
+        name = os.fspath(file) if self._owned else getattr(file, 'name', None)
+        self.filename = filename or (os.path.basename(name) if isinstance(name, str) and name
+                                     else 'document.pdf')
+        try:
+            self.start = self.fileobj.tell()
+            self.seekable = self.fileobj.seekable()
+        except (AttributeError, OSError):
+            self.start, self.seekable = 0, False
+
+    def body(self, fields, attempt):
+        """(request body, content type) for one attempt"""
+        if attempt:
+            if not self.seekable:
+                raise _NotReplayable()
+            self.fileobj.seek(self.start)
+        body = _MultipartBody(fields, 'file', self.fileobj, self.filename, seekable=self.seekable)
+        return (body if self.seekable else body.chunks()), body.content_type
+
+    def close(self):
+        if self._owned:
+            self.fileobj.close()
+
+
+class _NotReplayable(Exception):
+    """The request body (a non-seekable stream) cannot be sent a second time"""
+
+
+class SigningClient:
+    """
+    Client for /sign-document, /verify-document, /verify-reference,
+    /verify-qr-data, /verify-signature-only, /verify-stream and
+    /receipts/validate.
+
+    One requests.Session with a keep-alive pool of max_connections
+    connections is shared by all calls and threads; batch helpers run at most
+    max_connections requests at once and yield results in input order.
+    Documents are streamed from disk (or a caller's file object), never read
+    into memory.
+
+    Retries (max_retries, exponential backoff with jitter, Retry-After
+    honoured) apply to connection failures and 429/502/503/504, but only
+    where repeating cannot double an effect: verifications always; a sign
+    call only with a transaction_id (the server replays the stored result),
+    otherwise only when the request never reached the server or the server
+    refused it with 429/503 before doing any work.
+
+        with SigningClient('http://localhost:5000') as client:
+            signed = client.sign('invoice.pdf', transaction_id='INV-1')
+            result = client.verify_document('signed_invoice.pdf')
+    """
+
+    def __init__(self, base_url='http://localhost:5000', max_connections=8, timeout=(5, 300),
+                 max_retries=3, backoff=0.5, max_backoff=30.0, headers=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        # pool_block: beyond max_connections, calls wait for a free connection
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- transport --------------------------------------------------------------
+
+    @staticmethod
+    def _never_sent(error):
+        """True if the connection failed before any of the request reached the server"""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+    def _delay(self, attempt, response=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.max_backoff, float(retry_after)))
+        return delay
+
+    def _request(self, method, path, idempotent, upload=None, fields=None, stream=False, **kwargs):
+        """Send with retries; returns the requests.Response of the last attempt"""
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            if upload is not None:
+                try:
+                    kwargs['data'], content_type = upload.body(fields or {}, attempt)
+                except _NotReplayable:
+                    raise last_error
+                kwargs['headers'] = {**kwargs.get('headers', {}), 'Content-Type': content_type}
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['retries'] += attempt > 0
+            try:
+                response = self.session.request(method, url, timeout=self.timeout,
+                                                stream=stream, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retryable = idempotent or self._never_sent(e)
+                if not retryable or attempt >= self.max_retries:
+                    with self._lock:
+                        self.stats['failures'] += 1
+                    raise
+                last_error = e
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+
+            retryable = (response.status_code in RETRY_ALWAYS
+                         or (idempotent and response.status_code in RETRY_IDEMPOTENT))
+            if not retryable or attempt >= self.max_retries:
+                return response
+            last_error = SigningClientError(response.status_code, response.reason)
+            response.close()
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    @staticmethod
+    def _json(response):
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if response.status_code >= 300:
+            message = body.get('error') if isinstance(body, dict) else response.reason
+            raise SigningClientError(response.status_code, message, body)
+        return body
+
+    # --- single calls -----------------------------------------------------------
+
+    def sign(self, file, transaction_id=None, filename=None, **fields):
+        """
+        Sign a PDF (path or binary file object). fields are the other
+        /sign-document form fields (customer_name, transaction_date, digest_alg,
+        output_profile, tenant, stamp_position, ...). Returns the JSON result.
+        """
+        upload = _Upload(file, filename)
+        try:
+            response = self._request(
+                'POST', '/sign-document', idempotent=bool(transaction_id), upload=upload,
+                fields={'transaction_id': transaction_id, **fields},
+                headers={'Accept': 'application/json'}
+            )
+            return self._json(response)
+        finally:
+            upload.close()
+
+    def upload_verify(self, file, filename=None, receipt=False):
+        """Upload a signed PDF to /verify-document (receipt: also return a signed receipt)"""
+        upload = _Upload(file, filename)
+        try:
+            return self._json(self._request('POST', '/verify-document', idempotent=True,
+                                            upload=upload,
+                                            fields={'receipt': '1' if receipt else None}))
+        finally:
+            upload.close()
+
+    def verify_reference(self, transaction_id=None, document_hash=None, signed_file_sha256=None,
+                         check_file=False):
+        """Verify a registered document by id or hash, without uploading it"""
+        body = {'transaction_id': transaction_id, 'document_hash': document_hash,
+                'signed_file_sha256': signed_file_sha256, 'check_file': check_file}
+        return self._json(self._request('POST', '/verify-reference', idempotent=True,
+                                        json={k: v for k, v in body.items() if v}))
+
+    def verify_document(self, file, filename=None, prefer_hash=True, receipt=False):
+        """
+        Verify a signed PDF. With prefer_hash the file is hashed locally and
+        checked against the registry first; it is only uploaded when the
+        service has no record of that exact file. receipt=True always uploads
+        and returns a signed receipt (see check_receipt) with the result.
+        """
+        if receipt:
+            return self.upload_verify(file, filename, receipt=True)
+        if prefer_hash:
+            result = self.verify_reference(signed_file_sha256=hash_file(file))
+            if result.get('verification', {}).get('registered'):
+                return result
+        return self.upload_verify(file, filename)
+
+    def verify_qr_data(self, qr_data):
+        """Verify a scanned QR payload (the JSON string, or the parsed dict)"""
+        if not isinstance(qr_data, str):
+            qr_data = json.dumps(qr_data)
+        return self._json(self._request('POST', '/verify-qr-data', idempotent=True,
+                                        json={'qr_data': qr_data}))
+
+    def verify_signature(self, document_hash, signature, **payload):
+        """Verify a hash/signature pair (plus digest_alg, Merkle fields...) without a document"""
+        return self._json(self._request(
+            'POST', '/verify-signature-only', idempotent=True,
+            json={'document_hash': document_hash, 'signature': signature, **payload}))
+
+    def jwks(self):
+        """The service's public keys (JWK Set), for check_receipt()"""
+        return self._json(self._request('GET', '/.well-known/jwks.json', idempotent=True))
+
+    def validate_receipts(self, receipts):
+        """
+        Check receipts with the service, which also reports revocations made
+        since each was issued. Items are tokens or {'receipt', 'file_sha256'}
+        dicts; returns one result per item, in order.
+        """
+        return self._json(self._request('POST', '/receipts/validate', idempotent=True,
+                                        json={'receipts': list(receipts)}))['results']
+
+    def verify_payloads(self, payloads):
+        """
+        Verify many {document_hash, signature, ...} payloads (or {qr_data})
+        in one /verify-stream request; yields one result per payload, in order.
+        """
+        body = ''.join(json.dumps(p) + '\n' for p in payloads).encode('utf-8')
+        response = self._request('POST', '/verify-stream', idempotent=True, data=body,
+                                 stream=True, headers={'Content-Type': 'application/x-ndjson'})
+        if response.status_code >= 300:
+            self._json(response)
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    # --- batches ----------------------------------------------------------------
+
+    def _map(self, fn, items, max_workers=None):
+        """
+        fn over items on up to max_workers threads (default: the pool size),
+        at most twice that many submitted ahead; yields results in input order.
+        A failed item yields {'success': False, 'error', 'status_code'}.
+        """
+        def call(item):
+            try:
+                return fn(item)
+            except SigningClientError as e:
+                return e.response or {'success': False, 'error': str(e),
+                                      'status_code': e.status_code}
+            except (requests.RequestException, OSError) as e:
+                return {'success': False, 'error': str(e), 'status_code': None}
+
+        workers = max_workers or self.max_connections
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='signing-client') as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.submit(call, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def sign_many(self, documents, max_workers=None):
+        """
+        Sign many documents: each item is a path/file object, or a dict with
+        'file' and the sign() keyword arguments. Yields results in order.
+        """
+        def sign_one(item):
+            if isinstance(item, dict):
+                item = dict(item)
+                return self.sign(item.pop('file'), **item)
+            return self.sign(item)
+        return self._map(sign_one, documents, max_workers)
+
+    def verify_many(self, files, max_workers=None, prefer_hash=True, receipt=False):
+        """verify_document() over many signed PDFs; yields results in order"""
+        return self._map(lambda f: self.verify_document(f, prefer_hash=prefer_hash, receipt=receipt),
+                         files, max_workers)
+
+    def verify_qr_many(self, qr_payloads, max_workers=None):
+        """verify_qr_data() over many scanned payloads; yields results in order"""
+        return self._map(self.verify_qr_data, qr_payloads, max_workers)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,456 @@
+# services/audit_log_service.py - Append-only, hash-chained audit log of sign/verify events
+
+import os
+import json
+import time
+import fcntl
+import queue
+import hashlib
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'batch', 'interval', 'never')
+GENESIS_HASH = '0' * 64
+
+
+def _record_hash(prev_hash, body):
+    return hashlib.sha256((prev_hash + body).encode('utf-8')).hexdigest()
+
+
+def _canonical(record):
+    return json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class AuditLogLocked(RuntimeError):
+    """The log directory is owned by another process (or this AuditLog is read-only)"""
+
+
+class _Pending:
+    """Completion of a queued record or flush() marker; error is set if its batch failed"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class AuditLog:
+    """
+    Append-only audit log. Records are JSON lines in size/time-rotated segment
+    files (audit-<first seq>.log); every record carries the hash of the one
+    before it, across segment boundaries, so any edit or deletion breaks the
+    chain from that point on.
+
+    append() only enqueues: a single writer thread drains the queue every
+    flush_interval_ms (or max_batch records), writes the whole batch with one
+    write() and at most one fsync (group commit), then indexes it in a SQLite
+    sidecar (transaction_id, timestamp -> segment offset) for queries.
+
+    fsync policy:
+      always   - like batch, and append() waits until its record is on disk
+      batch    - fsync after every batch
+      interval - fsync at most every fsync_interval seconds
+      never    - leave it to the OS
+
+    A batch is all or nothing: if its write or fsync fails the segment is cut
+    back to where the batch started, the chain head stays put and waiting
+    append() calls raise the error.
+
+    One process owns a log directory at a time: the owner holds an exclusive
+    flock on <directory>/.lock for its lifetime, and opening a writable log
+    that another process owns raises AuditLogLocked. read_only=True opens it
+    for inspection - query(), verify_chain() and get_stats() work, but it
+    never recovers (truncates) segments, starts no writer and append()
+    raises AuditLogLocked.
+    """
+
+    def __init__(self, directory='data/audit', fsync='batch', flush_interval_ms=50,
+                 fsync_interval=1.0, segment_max_bytes=64 * 1024 * 1024,
+                 segment_max_age=86400, max_batch=1000, read_only=False):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory = directory
+        self.fsync = fsync
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync_interval = fsync_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.max_batch = max_batch
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._index_path = os.path.join(directory, 'index.db')
+        self._init_index()
+
+        self._segment = None
+        self._segment_file = None
+        self._segment_opened = 0.0
+        self._last_fsync = 0.0
+        self.stats = {'appended': 0, 'batches': 0, 'fsyncs': 0, 'max_batch': 0,
+                      'write_errors': 0, 'failed_records': 0}
+        self._stopped = threading.Event()
+        self._writer = None
+        self._lock_file = None
+
+        self.read_only = read_only
+        if read_only:
+            segments = self.segments()
+            self._seq, self._last_hash = (self._last_record(segments[-1]) if segments
+                                          else (0, GENESIS_HASH))
+            return
+
+        self._lock_file = self._acquire_ownership()
+        if self._lock_file is None:
+            raise AuditLogLocked(f"Audit log {directory} is owned by another process")
+        self._seq, self._last_hash = self._recover()
+        self._writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._writer.start()
+
+    def _acquire_ownership(self):
+        """Exclusive, non-blocking flock on the directory's .lock file; None if another process holds it"""
+        lock_file = open(os.path.join(self.directory, '.lock'), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    # ---- index ---------------------------------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._index_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_index(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                seq INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                event TEXT NOT NULL,
+                transaction_id TEXT,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_txn ON entries (transaction_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_ts ON entries (ts)')
+
+    def _index(self, rows):
+        conn = self._conn()
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT OR REPLACE INTO entries (seq, ts, event, transaction_id, segment, offset, length) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        conn.execute('COMMIT')
+
+    # ---- segments ------------------------------------------------------------------------
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith('audit-') and name.endswith('.log'))
+
+    def _segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _recover(self):
+        """Find the chain head, drop a torn final line and index anything the index missed"""
+        segments = self.segments()
+        if not segments:
+            return 0, GENESIS_HASH
+
+        name = segments[-1]
+        path = self._segment_path(name)
+        row = self._conn().execute(
+            'SELECT offset, length FROM entries WHERE segment = ? ORDER BY seq DESC LIMIT 1',
+            (name,)
+        ).fetchone()
+        start = row['offset'] + row['length'] if row else 0
+
+        seq, last_hash = 0, GENESIS_HASH
+        rows = []
+        with open(path, 'r+b') as f:
+            first = f.readline()
+            # Segment age counts from its first record
+            opened = json.loads(first)['epoch'] if first.endswith(b'\n') else time.time()
+            if start:
+                # Chain head = last indexed record of this segment
+                f.seek(row['offset'])
+                record = json.loads(f.readline())
+                seq, last_hash = record['seq'], record['hash']
+            elif len(segments) > 1:
+                seq, last_hash = self._last_record(segments[-2])
+            offset = start
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                record = json.loads(line)
+                rows.append(self._index_row(record, name, offset, len(line)))
+                seq, last_hash = record['seq'], record['hash']
+                offset += len(line)
+            f.truncate(offset)
+
+        if rows:
+            self._index(rows)
+            logger.info(f"✅ Audit log recovered {len(rows)} unindexed records")
+        self._open_segment(name, opened)
+        return seq, last_hash
+
+    def _last_record(self, name):
+        """(seq, hash) of the segment's last readable record; verify_chain() reports unreadable ones"""
+        last = None
+        with open(self._segment_path(name), 'rb') as f:
+            for line in f:
+                if line.endswith(b'\n'):
+                    last = line
+            if last is None:
+                return 0, GENESIS_HASH
+            try:
+                record = json.loads(last)
+                return record['seq'], record['hash']
+            except (ValueError, KeyError):
+                pass
+            # Damaged tail: slow path, parse every line
+            head = 0, GENESIS_HASH
+            f.seek(0)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    head = record['seq'], record['hash']
+                except (ValueError, KeyError):
+                    continue
+            return head
+
+    def _open_segment(self, name, opened=None):
+        if self._segment_file is not None:
+            self._sync(force=True)
+            self._segment_file.close()
+        self._segment = name
+        self._segment_file = open(self._segment_path(name), 'ab')
+        self._segment_opened = opened or time.time()
+
+    def _maybe_rotate(self, now):
+        if self._segment_file is None:
+            self._open_segment(f"audit-{self._seq + 1:012d}.log", now)
+            return
+        if (self._segment_file.tell() >= self.segment_max_bytes
+                or now - self._segment_opened >= self.segment_max_age):
+            self._open_segment(f"audit-{self._seq + 1:012d}.log", now)
+            logger.info(f"✅ Audit log rotated to {self._segment}")
+
+    def _sync(self, force=False):
+        self._segment_file.flush()
+        now = time.monotonic()
+        if force or self.fsync in ('always', 'batch') or (
+                self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+            if self.fsync != 'never':
+                os.fsync(self._segment_file.fileno())
+                self.stats['fsyncs'] += 1
+                self._last_fsync = now
+
+    # ---- writer --------------------------------------------------------------------------
+
+    @staticmethod
+    def _index_row(record, segment, offset, length):
+        return (record['seq'], record['epoch'], record['event'], record.get('transaction_id'),
+                segment, offset, length)
+
+    def _write_batch(self, batch):
+        records = [fields for fields, _ in batch if fields is not None]  # None: flush() marker
+        if not records:
+            return
+        self._maybe_rotate(time.time())
+        lines, rows = [], []
+        seq, last_hash = self._seq, self._last_hash
+        start = offset = self._segment_file.tell()
+        for fields in records:
+            seq += 1
+            record = {'seq': seq, **fields, 'prev': last_hash}
+            record['hash'] = _record_hash(last_hash, _canonical(record))
+            line = (_canonical(record) + '\n').encode('utf-8')
+            lines.append(line)
+            rows.append(self._index_row(record, self._segment, offset, len(line)))
+            offset += len(line)
+            last_hash = record['hash']
+
+        try:
+            self._segment_file.write(b''.join(lines))
+            self._sync()
+        except Exception:
+            self._discard_from(start)
+            raise
+        # On disk: the chain head moves. The index is derived data - _recover() redoes it
+        self._seq, self._last_hash = seq, last_hash
+        try:
+            self._index(rows)
+        except Exception as e:
+            logger.error(f"❌ Audit log index update failed: {e}")
+
+        self.stats['appended'] += len(lines)
+        self.stats['batches'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(lines))
+
+    def _discard_from(self, offset):
+        """Cut a failed batch off the segment so no torn line or orphan records stay in the chain"""
+        try:
+            self._segment_file.close()  # flushes what is buffered, or fails trying; closed either way
+        except OSError:
+            pass
+        path = self._segment_path(self._segment)
+        os.truncate(path, offset)
+        self._segment_file = open(path, 'ab')
+
+    def _run(self):
+        while not self._stopped.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            error = None
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                error = e
+                self.stats['write_errors'] += 1
+                self.stats['failed_records'] += sum(1 for fields, _ in batch if fields is not None)
+                logger.error(f"❌ Audit log write failed: {e}")
+            for _, pending in batch:
+                if pending is not None:
+                    pending.error = error
+                    pending.done.set()
+
+    # ---- public API ----------------------------------------------------------------------
+
+    def append(self, event, transaction_id=None, wait=None, **fields):
+        """
+        Queue an audit record. With wait=True (default when fsync='always')
+        block until the batch holding it has been written and synced, and raise
+        the write error if that batch failed.
+        """
+        if self.read_only:
+            raise AuditLogLocked(f"Audit log {self.directory} was opened read-only")
+        now = time.time()
+        record = {
+            'epoch': now,
+            'timestamp': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            'event': event,
+            'transaction_id': transaction_id,
+            **fields,
+        }
+        if wait is None:
+            wait = self.fsync == 'always'
+        pending = _Pending() if wait else None
+        self._queue.put((record, pending))
+        if pending is not None:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+
+    def _read(self, segment, offset, length):
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def query(self, transaction_id=None, since=None, until=None, event=None, limit=100):
+        """Records matching the filters, oldest first, read straight from the segments via the index"""
+        clauses, params = [], []
+        if transaction_id:
+            clauses.append('transaction_id = ?')
+            params.append(transaction_id)
+        if since is not None:
+            clauses.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('ts <= ?')
+            params.append(until)
+        if event:
+            clauses.append('event = ?')
+            params.append(event)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._conn().execute(
+            f'SELECT segment, offset, length FROM entries {where} ORDER BY seq LIMIT ?',
+            (*params, limit)
+        ).fetchall()
+        return [self._read(row['segment'], row['offset'], row['length']) for row in rows]
+
+    def verify_chain(self):
+        """Recompute the hash chain over every segment"""
+        prev_hash, expected_seq, checked = GENESIS_HASH, None, 0
+        for name in self.segments():
+            with open(self._segment_path(name), 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                        stored_hash = record.pop('hash')
+                    except (ValueError, KeyError):
+                        return {'valid': False, 'records': checked, 'segment': name,
+                                'seq': expected_seq, 'error': 'unreadable record'}
+                    if expected_seq is not None and record['seq'] != expected_seq:
+                        return {'valid': False, 'records': checked, 'segment': name,
+                                'seq': record['seq'], 'error': 'sequence gap'}
+                    if (record['prev'] != prev_hash
+                            or _record_hash(prev_hash, _canonical(record)) != stored_hash):
+                        return {'valid': False, 'records': checked, 'segment': name,
+                                'seq': record['seq'], 'error': 'hash mismatch'}
+                    prev_hash, expected_seq = stored_hash, record['seq'] + 1
+                    checked += 1
+        return {'valid': True, 'records': checked, 'head': prev_hash}
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        if self.read_only:
+            return True
+        pending = _Pending()
+        self._queue.put((None, pending))
+        return pending.done.wait(timeout)
+
+    def get_stats(self):
+        return {
+            'directory': self.directory,
+            'fsync': self.fsync,
+            'read_only': self.read_only,
+            'flush_interval_ms': self.flush_interval * 1000,
+            'segment': self._segment,
+            'segments': len(self.segments()),
+            'queued': self._queue.qsize(),
+            'last_seq': self._seq,
+            'head': self._last_hash,
+            **self.stats,
+        }
+
+    def close(self):
+        if self.read_only:
+            return
+        self._stopped.set()
+        self._writer.join()
+        if self._segment_file is not None:
+            self._sync(force=True)
+            self._segment_file.close()
+        self._lock_file.close()
@@ -0,0 +1,157 @@
+# services/batch_signing_service.py - Merkle batch signing (one RSA operation per window)
+
+import hashlib
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_MODE_MERKLE = 'merkle-sha256'
+
+
+def merkle_leaf(document_hash):
+    """Leaf and node hashes use different prefixes so a node can't pose as a leaf"""
+    return hashlib.sha256(b'\x00' + document_hash.encode('utf-8')).digest()
+
+
+def merkle_node(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_signing_message(root_hex):
+    """String that is actually RSA-signed for a batch, distinct from any document hash"""
+    return f"{SIGNATURE_MODE_MERKLE}:{root_hex}"
+
+
+def build_merkle_tree(document_hashes):
+    """
+    Return (root_hex, proofs) where proofs[i] is the inclusion proof of
+    document_hashes[i]: a list of 'L<hex>' / 'R<hex>' siblings from leaf to root.
+    An odd node at the end of a level is promoted unchanged.
+    """
+    level = [merkle_leaf(h) for h in document_hashes]
+    positions = list(range(len(level)))
+    proofs = [[] for _ in level]
+
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level), 2):
+            if i + 1 < len(level):
+                next_level.append(merkle_node(level[i], level[i + 1]))
+            else:
+                next_level.append(level[i])
+
+        for doc_index, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                side = 'L' if sibling < pos else 'R'
+                proofs[doc_index].append(side + level[sibling].hex())
+            positions[doc_index] = pos // 2
+        level = next_level
+
+    return level[0].hex(), proofs
+
+
+def merkle_root_from_proof(document_hash, proof):
+    """Recompute the root hex for a document hash and its inclusion proof"""
+    node = merkle_leaf(document_hash)
+    for step in proof:
+        side, sibling = step[0], bytes.fromhex(step[1:])
+        if side == 'L':
+            node = merkle_node(sibling, node)
+        elif side == 'R':
+            node = merkle_node(node, sibling)
+        else:
+            raise ValueError(f"Invalid proof step: {step[:8]}")
+    return node.hex()
+
+
+class _Batch:
+    def __init__(self):
+        self.hashes = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.root = None
+        self.proofs = None
+        self.signature = None
+        self.error = None
+
+
+class MerkleBatchSigner:
+    """
+    Collects document hashes arriving within max_delay_ms (or until max_batch_size
+    are waiting), builds a Merkle tree and signs only the root. The first caller
+    of a window acts as leader and performs the signing; the rest wait for it.
+    """
+
+    def __init__(self, sign_fn, max_delay_ms=20, max_batch_size=64):
+        self.sign_fn = sign_fn
+        self.max_delay_ms = max_delay_ms
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._current = None
+        self._stats = {'batches': 0, 'documents': 0, 'max_batch': 0, 'total_sign_ms': 0.0}
+
+    def sign(self, document_hash):
+        """Return {'signature', 'merkle_root', 'merkle_proof', 'signature_mode'}"""
+        with self._lock:
+            batch = self._current
+            leader = batch is None
+            if leader:
+                batch = self._current = _Batch()
+            index = len(batch.hashes)
+            batch.hashes.append(document_hash)
+            if len(batch.hashes) >= self.max_batch_size:
+                self._current = None
+                batch.full.set()
+
+        if leader:
+            self._seal(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+
+        return {
+            'signature': batch.signature,
+            'signature_mode': SIGNATURE_MODE_MERKLE,
+            'merkle_root': batch.root,
+            'merkle_proof': batch.proofs[index],
+        }
+
+    def _seal(self, batch):
+        batch.full.wait(self.max_delay_ms / 1000)
+        with self._lock:
+            if self._current is batch:
+                self._current = None
+        try:
+            started = time.perf_counter()
+            batch.root, batch.proofs = build_merkle_tree(batch.hashes)
+            batch.signature = self.sign_fn(merkle_signing_message(batch.root))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['documents'] += len(batch.hashes)
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(batch.hashes))
+                self._stats['total_sign_ms'] += elapsed_ms
+            logger.info(f"✍️  Signed Merkle batch of {len(batch.hashes)} documents")
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats['batches']
+        return {
+            'max_delay_ms': self.max_delay_ms,
+            'max_batch_size': self.max_batch_size,
+            'batches': batches,
+            'documents': stats['documents'],
+            'max_batch': stats['max_batch'],
+            'mean_batch': round(stats['documents'] / batches, 2) if batches else 0.0,
+            'mean_sign_ms': round(stats['total_sign_ms'] / batches, 3) if batches else 0.0,
+        }
@@ -0,0 +1,180 @@
+# services/cpu_tasks.py - CPU-heavy pipeline stages run inside executor worker processes
+#
+# Every function here must be a picklable top-level function. Service objects are
+# created once per worker process and reused across jobs.
+
+_config = {}
+_services = {}
+
+
+def init_worker(config):
+    """Called once when a worker process starts"""
+    _config.clear()
+    _config.update(config or {})
+    _services.clear()
+    from services import digest_service
+    digest_service.configure(_config.get('tree_hash_threads'))
+    configure_memory(_config)
+
+
+def configure_memory(config):
+    """Set up this process's memory governor from the worker config"""
+    from services import memory_governor
+    memory_governor.configure(
+        budget_bytes=config.get('memory_budget_bytes'),
+        store_max_bytes=config.get('mupdf_store_max_bytes'),
+        store_idle_bytes=config.get('mupdf_store_idle_bytes'),
+        high_dpi_bytes=config.get('high_dpi_bytes'),
+        max_high_dpi_renders=config.get('max_high_dpi_renders'),
+        render_slots_dir=config.get('render_slots_dir'),
+        queue_timeout=config.get('render_queue_timeout'),
+    )
+
+
+def after_job():
+    """Run by the executor after every job: shrink MuPDF's store, report memory use"""
+    from services import memory_governor
+    return memory_governor.get().between_jobs()
+
+
+def _large_document_kwargs():
+    if 'large_document_bytes' in _config:
+        return {'large_document_bytes': _config['large_document_bytes']}
+    return {}
+
+
+def _service(name):
+    service = _services.get(name)
+    if service is None:
+        if name == 'signature':
+            from services.signature_service import SignatureService
+            service = SignatureService(digest_alg=_config.get('digest_alg', 'sha256'),
+                                       **_large_document_kwargs())
+        elif name == 'qr':
+            from services.qr_service import QRService
+            from services.qr_template_service import QRTemplateMemory
+            template_db_path = _config.get('qr_template_db_path')
+            service = QRService(decoders=_config.get('qr_decoders'),
+                                auto_order_decoders=_config.get('qr_decoders_auto_order', False),
+                                locator_zoom=_config.get('qr_locator_zoom', 1.5),
+                                template_memory=QRTemplateMemory(
+                                    template_db_path, max_misses=_config.get('qr_template_max_misses', 3)
+                                ) if template_db_path else None,
+                                **_large_document_kwargs())
+        elif name == 'image':
+            from services.image_qr_service import ImageQRService
+            service = ImageQRService(
+                _service('qr').decoders,
+                work_size=_config.get('image_verify_work_size', 1024),
+                target_ms_per_megapixel=_config.get('image_verify_target_ms_per_mp', 50),
+                max_pixels=_config.get('image_verify_max_pixels', 50_000_000)
+            )
+        elif name == 'pdf':
+            from services.pdf_service import PDFService
+            from services.stamp_template_service import StampTemplateService
+            service = PDFService(
+                default_profile=_config.get('pdf_output_profile', 'fastest-save'),
+                stamp_templates=StampTemplateService(
+                    cache_size=_config.get('stamp_template_cache_size', 64),
+                    tenants_path=_config.get('stamp_templates_path')
+                ),
+                **_large_document_kwargs()
+            )
+        else:
+            raise ValueError(f"Unknown service: {name}")
+        _services[name] = service
+    return service
+
+
+def generate_document_hash(file_path, digest_alg=None):
+    return _service('signature').generate_document_hash(file_path, digest_alg)
+
+
+def generate_document_hash_for_verification(file_path, digest_alg=None):
+    return _service('signature').generate_document_hash_for_verification(file_path, digest_alg)
+
+
+def sign_document(document_hash):
+    return _service('signature').sign_document(document_hash)
+
+
+def extract_qr_from_pdf(file_path):
+    return _service('qr').extract_qr_from_pdf(file_path)
+
+
+def extract_qr_from_image(image_bytes):
+    return _service('image').extract_qr_from_image(image_bytes)
+
+
+def add_qr_to_pdf(input_pdf_path, qr_image_path, output_pdf_path, profile=None, stamp=None):
+    return _service('pdf').add_qr_to_pdf(input_pdf_path, qr_image_path, output_pdf_path,
+                                         profile, stamp)
+
+
+def _document_session(file_path):
+    from services.document_session import DocumentSession
+    return DocumentSession(file_path, **_large_document_kwargs())
+
+
+def _stamp(session, qr_data, output_pdf_path, profile, stamp):
+    qr_png = _service('qr').generate_qr_png(qr_data)
+    return _service('pdf').add_qr_to_pdf(session, None, output_pdf_path, profile, stamp,
+                                         qr_stream=qr_png)
+
+
+def sign_pipeline(file_path, qr_fields, output_pdf_path, digest_alg=None, profile=None,
+                  stamp=None, key_id=None, base_url='', upload_sha256=None):
+    """
+    Hash, sign, build the QR payload, stamp and save in one job, on one parse
+    of the document. qr_fields: transaction_id and timestamp for the payload.
+    Returns document_hash, signature (hex), qr_data and signed_file_sha256;
+    the signed PDF itself stays in output_pdf_path.
+    """
+    from services.digest_service import signing_message
+    from services.verification_service import build_qr_payload
+    signature_service = _service('signature')
+    with _document_session(file_path) as session:
+        if upload_sha256:
+            session.set_file_digest('sha256', upload_sha256)
+        document_hash = signature_service.generate_document_hash(session, digest_alg)
+        signature = signature_service.sign_document(signing_message(document_hash, digest_alg))
+        qr_data = build_qr_payload(qr_fields.get('transaction_id'), document_hash, digest_alg,
+                                   signature.hex(), qr_fields.get('timestamp'),
+                                   key_id=key_id, base_url=base_url)
+        signed_file_sha256 = _stamp(session, qr_data, output_pdf_path, profile, stamp)
+    return {
+        'document_hash': document_hash,
+        'signature': signature.hex(),
+        'qr_data': qr_data,
+        'signed_file_sha256': signed_file_sha256,
+    }
+
+
+def stamp_document(file_path, qr_data, output_pdf_path, profile=None, stamp=None):
+    """
+    Render the QR payload, stamp it and save to output_pdf_path; returns the
+    signed file's SHA-256
+    """
+    with _document_session(file_path) as session:
+        return _stamp(session, qr_data, output_pdf_path, profile, stamp)
+
+
+def inspect_document(file_path, upload_sha256=None):
+    """
+    QR extraction and the current hash (using the digest named in the QR) on
+    one parse of the document. Returns (qr_data, current_hash); current_hash
+    is None when no QR was found or its digest is unknown.
+    """
+    from services.digest_service import DIGEST_ALGORITHMS
+    with _document_session(file_path) as session:
+        if upload_sha256:
+            session.set_file_digest('sha256', upload_sha256)
+        qr_data = _service('qr').extract_qr_from_pdf(session)
+        if not qr_data:
+            return qr_data, None
+        digest_alg = qr_data.get('digest_alg') or 'sha256'
+        if digest_alg not in DIGEST_ALGORITHMS:
+            return qr_data, None
+        current_hash = _service('signature').generate_document_hash_for_verification(
+            session, digest_alg)
+    return qr_data, current_hash
@@ -0,0 +1,155 @@
+# services/digest_service.py - Pluggable document digests, including a multi-threaded tree hash
+
+import os
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+LEGACY_DIGEST = 'sha256'
+TREE_SUFFIX = '-tree'
+TREE_LEAF_SIZE = 4 * 1024 * 1024  # 4MiB leaves; part of the tree format, never change it
+READ_SIZE = 4 * 1024 * 1024       # sequential reads, a multiple of the page size
+
+BASE_DIGESTS = {
+    'sha256': hashlib.sha256,
+    'sha512-256': lambda: hashlib.new('sha512_256'),
+    'blake2b-256': lambda: hashlib.blake2b(digest_size=32),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_threads = os.cpu_count() or 2
+
+
+def configure(threads=None):
+    """Set the leaf-hashing thread count (before the first tree hash in this process)"""
+    global _pool_threads
+    if threads:
+        _pool_threads = max(1, int(threads))
+
+
+def _leaf_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=_pool_threads,
+                                           thread_name_prefix='tree-hash')
+    return _pool
+
+
+def _hash_leaf(factory, chunk):
+    # hashlib releases the GIL for large buffers, so leaves hash in parallel
+    h = factory()
+    h.update(b'\x00')
+    h.update(chunk)
+    return h.digest()
+
+
+class TreeHasher:
+    """
+    hashlib-style object for the '<alg>-tree' digests: input is cut into
+    TREE_LEAF_SIZE leaves hashed concurrently on a shared thread pool, and the
+    result is H(0x01 || leaf size || leaf digests...). At most max_pending
+    leaves are in flight, so memory stays bounded.
+    """
+
+    def __init__(self, factory, max_pending=None):
+        self.factory = factory
+        self.max_pending = max_pending or _pool_threads * 2
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._leaves = []
+        self._result = None
+
+    def _submit(self, chunk):
+        self._pending.append(_leaf_pool().submit(_hash_leaf, self.factory, chunk))
+        while len(self._pending) > self.max_pending:
+            self._leaves.append(self._pending.popleft().result())
+
+    def update(self, data):
+        if self._result is not None:
+            raise ValueError('update() after digest()')
+        if not self._buffer and isinstance(data, bytes) and len(data) == TREE_LEAF_SIZE:
+            self._submit(data)  # whole aligned leaf: hand over without copying
+            return
+        view = memoryview(data)
+        while len(view):
+            take = min(len(view), TREE_LEAF_SIZE - len(self._buffer))
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) == TREE_LEAF_SIZE:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+
+    def digest(self):
+        if self._result is None:
+            if self._buffer or not (self._leaves or self._pending):
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._leaves.append(self._pending.popleft().result())
+            root = self.factory()
+            root.update(b'\x01' + TREE_LEAF_SIZE.to_bytes(8, 'big'))
+            for leaf in self._leaves:
+                root.update(leaf)
+            self._result = root.digest()
+        return self._result
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+DIGEST_ALGORITHMS = tuple(BASE_DIGESTS) + tuple(f"{name}{TREE_SUFFIX}" for name in BASE_DIGESTS)
+
+
+def normalize_digest(name):
+    """Digest id from a payload; documents signed before digests were recorded are SHA-256"""
+    name = name or LEGACY_DIGEST
+    if name not in DIGEST_ALGORITHMS:
+        raise ValueError(f"Unknown digest algorithm: {name}")
+    return name
+
+
+def new_hasher(name=None):
+    name = normalize_digest(name)
+    if name.endswith(TREE_SUFFIX):
+        return TreeHasher(BASE_DIGESTS[name[:-len(TREE_SUFFIX)]])
+    return BASE_DIGESTS[name]()
+
+
+def file_digest(file_path, name=None):
+    """Digest of the raw file using large aligned reads"""
+    hasher = new_hasher(name)
+    if isinstance(hasher, TreeHasher):
+        # Fresh leaf-sized reads go to the pool as-is
+        with open(file_path, 'rb', buffering=0) as f:
+            while True:
+                chunk = f.read(TREE_LEAF_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+
+
+def signing_message(document_hash, digest_alg=None):
+    """
+    String that gets signed for a document hash. Legacy SHA-256 documents sign
+    the bare hash; every other digest is bound into the message so a hash
+    cannot be re-labelled with a different algorithm.
+    """
+    digest_alg = normalize_digest(digest_alg)
+    if digest_alg == LEGACY_DIGEST:
+        return document_hash
+    return f"{digest_alg}:{document_hash}"
@@ -0,0 +1,180 @@
+# services/document_session.py - One parse of a PDF shared by every stage of a request
+
+import os
+import hashlib
+import fitz  # PyMuPDF
+from services import digest_service, memory_governor
+
+
+class DocumentSession:
+    """
+    Request-scoped view of one PDF. The file is read and parsed once; the raw
+    bytes, the fitz document, page objects, extracted page text, renders and
+    raw-file digests are kept for later stages of the same request.
+
+    Large documents (above large_document_bytes) keep the bounded-memory
+    behaviour: the document is opened from the file instead of from bytes, and
+    pages and renders are not cached (MuPDF's store is shrunk instead), so
+    only page text and digests are reused.
+
+    Services accept either a path or a session; DocumentSession.use() gives a
+    stage its session and closes it afterwards only if the stage opened it.
+    """
+
+    def __init__(self, path, large_document_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.large = self.size > large_document_bytes
+        self._data = None
+        self._document = None
+        self._pages = {}
+        self._texts = {}
+        self._renders = {}
+        self._render_bytes = 0
+        self._digests = {}
+
+    @classmethod
+    def use(cls, source, **kwargs):
+        """Context manager yielding a session for source (a path or an existing session)"""
+        if isinstance(source, DocumentSession):
+            return _Borrowed(source)
+        return cls(source, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def data(self):
+        """Raw file bytes (read once); None for large documents"""
+        if self._data is None and not self.large:
+            with open(self.path, 'rb') as f:
+                self._data = f.read()
+        return self._data
+
+    @property
+    def document(self):
+        if self._document is None:
+            data = self.data
+            if data is not None:
+                self._document = fitz.open(stream=data, filetype='pdf')
+            else:
+                self._document = fitz.open(self.path)
+        return self._document
+
+    @property
+    def page_count(self):
+        return len(self.document)
+
+    @property
+    def metadata(self):
+        return self.document.metadata
+
+    def page(self, page_num):
+        page = self._pages.get(page_num)
+        if page is None:
+            page = self.document.load_page(page_num)
+            if not self.large:
+                self._pages[page_num] = page
+        return page
+
+    def release_page(self, page_num):
+        """Drop a page (large documents) so MuPDF can free its resources"""
+        self._pages.pop(page_num, None)
+        if self.large:
+            fitz.TOOLS.store_shrink(100)
+
+    def page_text(self, page_num):
+        text = self._texts.get(page_num)
+        if text is None:
+            text = self._texts[page_num] = self.page(page_num).get_text()
+        return text
+
+    def render(self, page_num, zoom, convert, clip=None, gray=False):
+        """
+        Pixmap of a page (or of the clip rect, in page points) at zoom, passed
+        through convert (e.g. to a BGR array). Whole-page renders are cached per
+        (page, zoom, convert, gray) unless the document is large; clips never are.
+        The memory governor may render at a lower zoom than asked; callers that
+        map pixels back to page points should use the image size.
+        """
+        key = (page_num, zoom, convert, gray)
+        image = self._renders.get(key) if clip is None else None
+        if image is None:
+            page = self.page(page_num)
+            area = page.rect if clip is None else fitz.Rect(clip) & page.rect
+            governor = memory_governor.get()
+            with governor.render(area.width, area.height, zoom, 1 if gray else 3) as effective:
+                pix = page.get_pixmap(
+                    matrix=fitz.Matrix(effective, effective), clip=clip,
+                    colorspace=fitz.csGRAY if gray else fitz.csRGB
+                )
+                image = convert(pix)
+                pix = None
+            if self.large:
+                fitz.TOOLS.store_shrink(100)
+            elif clip is None:
+                self._renders[key] = image
+                nbytes = getattr(image, 'nbytes', 0)
+                self._render_bytes += nbytes
+                governor.account('render_cache', nbytes)
+        return image
+
+    def file_digest(self, digest_alg=None):
+        """Raw-file digest, from the bytes already in memory when possible"""
+        digest_alg = digest_service.normalize_digest(digest_alg)
+        digest = self._digests.get(digest_alg)
+        if digest is None:
+            data = self.data
+            if data is None:
+                digest = digest_service.file_digest(self.path, digest_alg)
+            else:
+                hasher = digest_service.new_hasher(digest_alg)
+                hasher.update(data)
+                digest = hasher.hexdigest()
+            self._digests[digest_alg] = digest
+        return digest
+
+    def set_file_digest(self, digest_alg, digest):
+        """Record a digest computed elsewhere (e.g. while the file was uploaded)"""
+        self._digests[digest_service.normalize_digest(digest_alg)] = digest
+
+    def to_bytes(self, **save_options):
+        """The (modified) document serialized in memory"""
+        return self.document.tobytes(**save_options)
+
+    def save(self, output_path, **save_options):
+        """Save the (modified) document; returns the SHA-256 of the written file"""
+        if self.large or save_options.get('linear'):
+            self.document.save(output_path, **save_options)
+            return digest_service.file_digest(output_path)
+        output = self.to_bytes(**save_options)
+        with open(output_path, 'wb') as f:
+            f.write(output)
+        return hashlib.sha256(output).hexdigest()
+
+    def close(self):
+        self._pages.clear()
+        self._renders.clear()
+        if self._render_bytes:
+            memory_governor.get().account('render_cache', -self._render_bytes)
+            self._render_bytes = 0
+        if self._document is not None:
+            self._document.close()
+            self._document = None
+        self._data = None
+
+
+class _Borrowed:
+    """Context manager around a session owned by the caller: never closes it"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def __enter__(self):
+        return self.session
+
+    def __exit__(self, *exc):
+        return False
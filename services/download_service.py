@@ -0,0 +1,97 @@
+# services/download_service.py - Safe paths and content-hash ETags for signed document downloads
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from werkzeug.security import safe_join
+
+READ_SIZE = 1024 * 1024  # 1MB
+OFFLOAD_MODES = ('x-accel', 'x-sendfile')
+
+
+class DownloadService:
+    """
+    Resolves download names inside the signed folder (no traversal, regular
+    files only) and keeps the SHA-256 of each served file as its ETag.
+    Digests are cached per (path, size, mtime), so a file replaced on disk is
+    re-hashed once; the sign path seeds the cache with the digest it already
+    computed, so downloads of fresh documents never read the file in Python.
+
+    offload: None (serve from Python via sendfile-capable send_file),
+    'x-accel' (nginx X-Accel-Redirect to accel_prefix + name) or
+    'x-sendfile' (Apache/lighttpd X-Sendfile with the absolute path).
+    """
+
+    def __init__(self, signed_folder='signed', offload=None, accel_prefix='/protected/signed/',
+                 cache_size=10000):
+        if offload and offload not in OFFLOAD_MODES:
+            raise ValueError(f"Unknown download offload mode: {offload}")
+        self.signed_folder = signed_folder
+        self.offload = offload or None
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_hashed': 0}
+
+    def resolve(self, filename):
+        """Absolute path of a signed file, or None if the name is unsafe or missing"""
+        path = safe_join(os.path.abspath(self.signed_folder), filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
+
+    def _key(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def remember(self, path, sha256):
+        """Record the digest of a file just written (e.g. by /sign-document)"""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._cache[path] = (self._key(path), sha256)
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def etag(self, path):
+        """SHA-256 of the file's current contents"""
+        key = self._key(path)
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == key:
+                self._cache.move_to_end(path)
+                self.stats['hits'] += 1
+                return cached[1]
+        self.stats['misses'] += 1
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                self.stats['bytes_hashed'] += len(chunk)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._cache[path] = (key, digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return digest
+
+    def offload_headers(self, path):
+        """Header handing the file body to the front proxy"""
+        if self.offload == 'x-accel':
+            return {'X-Accel-Redirect': self.accel_prefix + os.path.basename(path)}
+        return {'X-Sendfile': path}
+
+    def get_stats(self):
+        with self._lock:
+            cached = len(self._cache)
+        return {
+            'offload': self.offload,
+            'cached_etags': cached,
+            'cache_size': self.cache_size,
+            **self.stats,
+        }
@@ -0,0 +1,295 @@
+# services/executor_service.py - Bounded process pool for CPU-heavy stages
+
+import os
+import math
+import queue
+import threading
+import time
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the pool and its queue are full; callers should return 503"""
+
+    def __init__(self, retry_after):
+        super().__init__('Service is busy, please retry later')
+        self.retry_after = retry_after
+
+
+class JobTimeout(Exception):
+    """Raised when a job exceeds its timeout; the worker running it is killed"""
+
+
+class _SharedBytes:
+    """Handle for a bytes argument placed in shared memory instead of the pipe"""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+def _unwrap_args(args):
+    unwrapped = []
+    for arg in args:
+        if isinstance(arg, _SharedBytes):
+            shm = shared_memory.SharedMemory(name=arg.name)
+            try:
+                arg = bytes(shm.buf[:arg.size])
+            finally:
+                shm.close()
+        unwrapped.append(arg)
+    return unwrapped
+
+
+def _worker_main(conn, initializer, initargs, niceness=0, after_job=None):
+    if niceness:
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        fn, args, kwargs = message
+        try:
+            reply = ('ok', fn(*_unwrap_args(args), **kwargs))
+        except Exception as e:
+            reply = ('error', f"{type(e).__name__}: {e}")
+        report = None
+        if after_job is not None:
+            try:
+                report = after_job()
+            except Exception as e:
+                report = {'error': f"{type(e).__name__}: {e}"}
+        conn.send(reply + (report,))
+
+
+class _Worker:
+    def __init__(self, ctx, initializer, initargs, niceness=0, after_job=None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child_conn, initializer, initargs, niceness, after_job),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(1)
+        finally:
+            self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(1)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+
+
+class CPUExecutor:
+    """
+    Runs CPU-heavy stages (PyMuPDF rendering, QR decoding, RSA signing) in a
+    fixed set of worker processes so they don't contend with request threads.
+
+    At most max_workers jobs run and at most max_queue jobs wait; anything beyond
+    that is rejected immediately with ExecutorSaturated. Jobs exceeding their
+    timeout raise JobTimeout and the worker is killed and replaced.
+    Bytes arguments larger than shm_threshold are passed through shared memory.
+    after_job, if given, runs in the worker after every job; its return value
+    (e.g. the worker's memory stats) is kept per worker, see worker_reports().
+    """
+
+    def __init__(self, max_workers=2, max_queue=8, job_timeout=60,
+                 initializer=None, initargs=(), shm_threshold=1024 * 1024,
+                 enabled=True, niceness=0, name='cpu', after_job=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self.shm_threshold = shm_threshold
+        self.enabled = enabled
+        # Workers of a low-priority pool (e.g. the bulk lane) run at this nice level
+        self.niceness = niceness
+        self.name = name
+        self.after_job = after_job
+        self._reports = {}  # worker pid -> last after_job report
+
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._inflight = 0   # running + waiting
+        self._running = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'workers_restarted': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'total_run_ms': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.max_workers):
+                self._idle.put(self._new_worker())
+            self._started = True
+            logger.info(f"✅ CPU executor '{self.name}' started with {self.max_workers} workers")
+
+    def _retry_after(self):
+        mean_run = self._stats['total_run_ms'] / max(self._stats['completed'], 1) / 1000
+        backlog = self._inflight / max(self.max_workers, 1)
+        return max(1, math.ceil(mean_run * backlog))
+
+    def _wrap_args(self, args):
+        wrapped, segments = [], []
+        for arg in args:
+            if isinstance(arg, (bytes, bytearray, memoryview)) and len(arg) > self.shm_threshold:
+                shm = shared_memory.SharedMemory(create=True, size=len(arg))
+                shm.buf[:len(arg)] = arg
+                segments.append(shm)
+                arg = _SharedBytes(shm.name, len(arg))
+            wrapped.append(arg)
+        return wrapped, segments
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Run fn(*args, **kwargs) in a worker process and return its result"""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            if self._inflight >= self.max_workers + self.max_queue:
+                self._stats['rejected'] += 1
+                raise ExecutorSaturated(self._retry_after())
+            self._inflight += 1
+            self._stats['submitted'] += 1
+
+        try:
+            self._ensure_started()
+            queued_at = time.perf_counter()
+            worker = self._idle.get()
+            wait_ms = (time.perf_counter() - queued_at) * 1000
+            with self._lock:
+                self._running += 1
+                self._stats['total_wait_ms'] += wait_ms
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+
+            try:
+                return self._dispatch(worker, fn, args, kwargs, timeout or self.job_timeout)
+            finally:
+                with self._lock:
+                    self._running -= 1
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def _dispatch(self, worker, fn, args, kwargs, timeout):
+        wrapped, segments = self._wrap_args(args)
+        started = time.perf_counter()
+        try:
+            worker.conn.send((fn, wrapped, kwargs))
+            if not worker.conn.poll(timeout):
+                self._replace(worker)
+                worker = None
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise JobTimeout(f"{fn.__name__} exceeded {timeout}s")
+            status, value, report = worker.conn.recv()
+            if report is not None:
+                with self._lock:
+                    self._reports[worker.process.pid] = report
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            self._replace(worker)
+            worker = None
+            with self._lock:
+                self._stats['failed'] += 1
+            raise RuntimeError(f"Worker died while running {fn.__name__}")
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+            if worker is not None:
+                self._idle.put(worker)
+
+        run_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['total_run_ms'] += run_ms
+            if status == 'ok':
+                self._stats['completed'] += 1
+            else:
+                self._stats['failed'] += 1
+        if status != 'ok':
+            raise RuntimeError(value)
+        return value
+
+    def _new_worker(self):
+        return _Worker(self._ctx, self.initializer, self.initargs, self.niceness, self.after_job)
+
+    def _replace(self, worker):
+        """Kill a runaway or dead worker and put a fresh one in the pool"""
+        if worker is not None:
+            with self._lock:
+                self._reports.pop(worker.process.pid, None)
+            worker.kill()
+        self._idle.put(self._new_worker())
+        with self._lock:
+            self._stats['workers_restarted'] += 1
+        logger.warning("⚠️  CPU executor worker replaced")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            waited = stats['submitted']
+            return {
+                'name': self.name,
+                'enabled': self.enabled,
+                'niceness': self.niceness,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': self._running,
+                'queue_depth': self._inflight - self._running,
+                'mean_wait_ms': round(stats['total_wait_ms'] / waited, 3) if waited else 0.0,
+                'max_wait_ms': round(stats['max_wait_ms'], 3),
+                'mean_run_ms': round(stats['total_run_ms'] / stats['completed'], 3) if stats['completed'] else 0.0,
+                'submitted': stats['submitted'],
+                'completed': stats['completed'],
+                'failed': stats['failed'],
+                'rejected': stats['rejected'],
+                'timeouts': stats['timeouts'],
+                'workers_restarted': stats['workers_restarted'],
+            }
+
+    def worker_reports(self):
+        """Latest after_job report of each live worker, by pid"""
+        with self._lock:
+            return dict(self._reports)
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+        self._started = False
@@ -0,0 +1,137 @@
+# services/finder_locator.py - Vectorized QR finder-pattern locator for low-resolution page renders
+
+import cv2
+import numpy as np
+
+# A finder pattern crossed through its centre reads dark:light:dark:light:dark
+# in the ratio 1:1:3:1:1, horizontally and vertically
+FINDER_RATIOS = np.array([1, 1, 3, 1, 1], dtype=np.float32)
+FINDER_MODULES = 7
+QUIET_ZONE_MODULES = 4
+MAX_QR_MODULES = 177  # version 40
+
+
+def _runs(dark):
+    """
+    Run-length encode every row of a boolean image at once.
+    Returns (starts, lengths, is_dark) of the runs in row-major order; every
+    row starts a new run, so runs never span rows.
+    """
+    height, width = dark.shape
+    boundaries = np.ones((height, width), dtype=bool)
+    boundaries[:, 1:] = dark[:, 1:] != dark[:, :-1]
+    starts = np.flatnonzero(boundaries)
+    lengths = np.diff(np.append(starts, height * width))
+    return starts, lengths, dark.ravel()[starts]
+
+
+def finder_hits(dark, min_module=1.0, tolerance=0.5):
+    """
+    Scanline hits of the 1:1:3:1:1 signature along the rows of dark.
+    Returns arrays (row, centre column, module size) - one entry per row that
+    crosses a finder pattern centre.
+    """
+    height, width = dark.shape
+    starts, lengths, is_dark = _runs(dark)
+    if len(starts) < 5:
+        empty = np.empty(0, dtype=np.float32)
+        return empty, empty, empty
+
+    # Every window of five consecutive runs, as a (n, 5) view
+    window = np.lib.stride_tricks.sliding_window_view(lengths, 5).astype(np.float32)
+    first = starts[:-4]
+    rows = first // width
+    total = window.sum(axis=1)
+    module = total / FINDER_MODULES
+
+    ok = is_dark[:-4] & (rows == starts[4:] // width) & (module >= min_module)
+    # Each run within tolerance modules of its expected length (3x for the centre)
+    allowed = module[:, None] * tolerance * np.where(FINDER_RATIOS == 3, 2.0, 1.0)
+    ok &= np.all(np.abs(window - module[:, None] * FINDER_RATIOS) < allowed, axis=1)
+
+    idx = np.flatnonzero(ok)
+    columns = (first[idx] % width) + window[idx, :2].sum(axis=1) + window[idx, 2] / 2
+    return rows[idx].astype(np.float32), columns, module[idx]
+
+
+def locate_finder_patterns(gray, threshold=128, min_module=1.0, min_hits=2):
+    """
+    Finder pattern centres in a grayscale image: places where horizontal and
+    vertical 1:1:3:1:1 scans agree. Returns a list of (x, y, module size);
+    each centre needs at least min_hits scanlines in both directions (a real
+    pattern yields about three modules' worth of each).
+    """
+    dark = gray < threshold
+    h_rows, h_cols, h_mod = finder_hits(dark, min_module)
+    v_cols, v_rows, v_mod = finder_hits(np.ascontiguousarray(dark.T), min_module)
+    if not len(h_rows) or not len(v_rows):
+        return []
+
+    # Bucket the hits of each direction on a coarse grid; a centre is a
+    # connected group of cells hit (give or take one cell) in both directions
+    cell = max(2.0, float(np.median(np.concatenate([h_mod, v_mod]))))
+    grid_shape = (int(gray.shape[0] / cell) + 1, int(gray.shape[1] / cell) + 1)
+    h_y, h_x = (h_rows / cell).astype(np.intp), (h_cols / cell).astype(np.intp)
+    v_y, v_x = (v_rows / cell).astype(np.intp), (v_cols / cell).astype(np.intp)
+    h_grid = np.zeros(grid_shape, dtype=np.uint8)
+    v_grid = np.zeros(grid_shape, dtype=np.uint8)
+    h_grid[h_y, h_x] = 1
+    v_grid[v_y, v_x] = 1
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    both = cv2.dilate(h_grid, kernel) & cv2.dilate(v_grid, kernel)
+    count, labels = cv2.connectedComponents(both, connectivity=8)
+    if count < 2:
+        return []
+
+    h_label, v_label = labels[h_y, h_x], labels[v_y, v_x]
+    h_n = np.bincount(h_label, minlength=count)
+    v_n = np.bincount(v_label, minlength=count)
+    n = np.maximum(h_n + v_n, 1)
+    xs = (np.bincount(h_label, h_cols, count) + np.bincount(v_label, v_cols, count)) / n
+    ys = (np.bincount(h_label, h_rows, count) + np.bincount(v_label, v_rows, count)) / n
+    mods = (np.bincount(h_label, h_mod, count) + np.bincount(v_label, v_mod, count)) / n
+    keep = np.flatnonzero((h_n >= min_hits) & (v_n >= min_hits))
+    keep = keep[keep > 0]  # label 0: hits in only one direction
+    return [(float(xs[i]), float(ys[i]), float(mods[i])) for i in keep]
+
+
+def qr_candidate_boxes(gray, max_candidates=4, threshold=128, min_module=1.0):
+    """
+    Candidate QR boxes (x0, y0, x1, y1) in gray's pixel coordinates, best first,
+    with the module size in pixels. Finder patterns of similar module size that lie
+    within one QR symbol of each other are grouped; groups of three rank
+    first, lone patterns (the other two damaged or clipped) last.
+    """
+    centres = locate_finder_patterns(gray, threshold, min_module)
+    height, width = gray.shape[:2]
+    groups = []
+    for x, y, m in sorted(centres, key=lambda c: -c[2]):
+        for group in groups:
+            gx, gy, gm = group[0]
+            if (abs(gm - m) < 0.5 * max(gm, m)
+                    and max(abs(gx - x), abs(gy - y)) < MAX_QR_MODULES * gm):
+                group.append((x, y, m))
+                break
+        else:
+            groups.append([(x, y, m)])
+
+    boxes = []
+    for group in groups:
+        xs = [g[0] for g in group]
+        ys = [g[1] for g in group]
+        # Stray 1:1:3:1:1 runs inside the data area read as larger modules
+        module = float(min(g[2] for g in group))
+        if len(group) >= 3:
+            # Three corners of the symbol: pad by the half finder and the quiet zone
+            pad = (FINDER_MODULES / 2 + QUIET_ZONE_MODULES) * module
+            x0, y0, x1, y1 = min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad
+        else:
+            # Unknown extent: the symbol lies in some direction from the pattern(s)
+            # found; a box of the largest likely symbol around them
+            reach = min(MAX_QR_MODULES, 60) * module
+            x0, y0, x1, y1 = min(xs) - reach, min(ys) - reach, max(xs) + reach, max(ys) + reach
+        box = (max(0.0, x0), max(0.0, y0), min(float(width), x1), min(float(height), y1))
+        boxes.append((len(group), box, module))
+
+    boxes.sort(key=lambda b: (-min(b[0], 3), (b[1][2] - b[1][0]) * (b[1][3] - b[1][1])))
+    return [(box, module) for _, box, module in boxes[:max_candidates]]
@@ -0,0 +1,228 @@
+# services/image_qr_service.py - QR extraction from phone photos and image scans
+
+import io
+import json
+import threading
+import time
+import logging
+import warnings
+import cv2
+import numpy as np
+from PIL import Image
+
+from services import memory_governor
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('transaction_id', 'document_hash', 'signature')
+UNSUPPORTED_IMAGE = 'Unsupported or corrupted image'
+
+
+def image_dimensions(image_bytes):
+    """(width, height) read from the image header alone, or None if Pillow cannot identify it"""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+
+def check_image_size(image_bytes, max_pixels):
+    """Error message if the image is unidentifiable or over max_pixels, else None (nothing is decoded)"""
+    try:
+        with warnings.catch_warnings():
+            # The cap is max_pixels, not Pillow's own MAX_IMAGE_PIXELS warning threshold
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            size = image_dimensions(image_bytes)
+    except Image.DecompressionBombError:
+        return f"Image is over the {max_pixels} pixel limit"
+    if size is None:
+        return UNSUPPORTED_IMAGE
+    width, height = size
+    if width * height > max_pixels:
+        return f"Image is {width}x{height}, over the {max_pixels} pixel limit"
+    return None
+
+
+def order_quad(points):
+    """Order 4 points as top-left, top-right, bottom-right, bottom-left"""
+    pts = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).ravel()
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)],
+                     pts[np.argmax(s)], pts[np.argmax(d)]], dtype=np.float32)
+
+
+class ImageQRService:
+    """
+    Finds and decodes the QR in a large photo or scan without ever running the
+    decoder on the full-resolution image:
+
+    1. decode to grayscale and build a downscaled working image (pyramid)
+    2. locate candidates on the working image: dense square blobs from
+       adaptive binarization + morphology, then the detector's own quad
+    3. map each candidate back to full resolution, perspective-correct it
+       into a small square crop and hand only that crop to the decoders
+    """
+
+    def __init__(self, decoders, work_size=1024, max_crop=1200, upsample=3.0,
+                 max_candidates=4, target_ms_per_megapixel=50, max_pixels=50_000_000):
+        self.decoders = decoders
+        self.max_pixels = max_pixels
+        self.work_size = work_size
+        self.max_crop = max_crop
+        self.upsample = upsample
+        self.max_candidates = max_candidates
+        self.target_ms_per_megapixel = target_ms_per_megapixel
+        self._local = threading.local()
+
+    def _detector(self):
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            detector = self._local.detector = cv2.QRCodeDetector()
+        return detector
+
+    def _pyramid(self, gray):
+        """Downscale by halving (pyrDown) until within work_size, then resize exactly"""
+        small = gray
+        while max(small.shape[:2]) > self.work_size * 2:
+            small = cv2.pyrDown(small)
+        longest = max(small.shape[:2])
+        if longest > self.work_size:
+            factor = self.work_size / longest
+            small = cv2.resize(small, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        return small, small.shape[1] / gray.shape[1]
+
+    def _detector_candidates(self, small, scale):
+        try:
+            found, points = self._detector().detect(small)
+        except cv2.error:
+            return []
+        if not found or points is None:
+            return []
+        return [order_quad(points) / scale]
+
+    def _blob_candidates(self, small, scale):
+        h, w = small.shape[:2]
+        block = max(15, (min(h, w) // 40) | 1)
+        binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY_INV, block, 10)
+        k = max(3, min(h, w) // 100)
+        closed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (k, k)))
+        # Opening with a larger kernel strips text lines glued to the QR's edge
+        closed = cv2.morphologyEx(closed, cv2.MORPH_OPEN,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (2 * k, 2 * k)))
+        contours, _ = cv2.findContours(closed, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        image_area = h * w
+        scored = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < image_area * 0.002 or area > image_area * 0.6:
+                continue
+            rect = cv2.minAreaRect(contour)
+            (rw, rh) = rect[1]
+            if rw == 0 or rh == 0 or not 0.6 <= rw / rh <= 1.6:
+                continue
+            x, y, bw, bh = cv2.boundingRect(contour)
+            # QR modules are roughly half dark; text blocks and photos are not
+            density = float(np.count_nonzero(binary[y:y + bh, x:x + bw])) / (bw * bh)
+            if not 0.25 <= density <= 0.8:
+                continue
+            # Pad 10% so the finder patterns and some quiet zone stay inside
+            padded = (rect[0], (rw * 1.2, rh * 1.2), rect[2])
+            scored.append((area, order_quad(cv2.boxPoints(padded)) / scale))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [quad for _, quad in scored[:self.max_candidates]]
+
+    def _rectify(self, gray, quad):
+        """
+        Perspective-correct a quad from the full-resolution image into a small
+        square. Dense receipt QRs land at only 2-3 px per module in a phone
+        photo, so the crop is upsampled (up to max_crop) while warping.
+        """
+        edges = np.linalg.norm(quad - np.roll(quad, 1, axis=0), axis=1)
+        side = int(min(max(edges.max() * self.upsample, 64), self.max_crop))
+        border = side // 10
+        dst = np.array([[border, border], [border + side, border],
+                        [border + side, border + side], [border, border + side]],
+                       dtype=np.float32)
+        matrix = cv2.getPerspectiveTransform(quad.astype(np.float32), dst)
+        size = side + 2 * border
+        return cv2.warpPerspective(gray, matrix, (size, size), flags=cv2.INTER_CUBIC,
+                                   borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+    def _decode_crop(self, crop):
+        data, backend = self.decoders.decode(crop)
+        if data:
+            return data, backend
+        # Second chance on a locally binarized crop (uneven lighting, glare)
+        block = max(15, (crop.shape[0] // 20) | 1)
+        binary = cv2.adaptiveThreshold(crop, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY, block, 5)
+        return self.decoders.decode(binary)
+
+    @staticmethod
+    def _parse(data):
+        try:
+            qr_data = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(qr_data, dict) and all(f in qr_data for f in REQUIRED_FIELDS):
+            return qr_data
+        return None
+
+    def extract_qr_from_image(self, image_bytes):
+        """Return (qr_data or None, info) for an encoded image (JPEG, PNG, ...)"""
+        started = time.perf_counter()
+        # Size from the header first: imdecode would allocate whatever the header claims
+        error = check_image_size(image_bytes, self.max_pixels)
+        if error:
+            return None, {'error': error}
+        gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            # Returned rather than raised so the reason survives the worker pipe
+            return None, {'error': UNSUPPORTED_IMAGE}
+
+        megapixels = gray.shape[0] * gray.shape[1] / 1e6
+        info = {'width': gray.shape[1], 'height': gray.shape[0],
+                'megapixels': round(megapixels, 2), 'candidates': 0, 'method': None}
+
+        # The decoded image (and the pyramid/crops derived from it) count against the
+        # worker's memory budget while the search runs
+        with memory_governor.get().track('opencv', gray.nbytes):
+            small, scale = self._pyramid(gray)
+            # Blob search is a few ms; the detector is ~10x slower, so it runs second
+            attempts = (('blob', self._blob_candidates), ('detector', self._detector_candidates))
+
+            qr_data = None
+            for method, locate in attempts:
+                for quad in locate(small, scale):
+                    info['candidates'] += 1
+                    data, backend = self._decode_crop(self._rectify(gray, quad))
+                    qr_data = self._parse(data) if data else None
+                    if qr_data:
+                        info['method'] = f"{method}/{backend}"
+                        break
+                if qr_data:
+                    break
+
+            if qr_data is None and max(gray.shape) <= self.max_crop * 2:
+                # Small images (already-cropped scans) can go to the decoder directly
+                data, backend = self._decode_crop(gray)
+                qr_data = self._parse(data) if data else None
+                if qr_data:
+                    info['method'] = f"direct/{backend}"
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        info['elapsed_ms'] = round(elapsed_ms, 1)
+        info['ms_per_megapixel'] = round(elapsed_ms / max(megapixels, 0.01), 1)
+        info['within_target'] = info['ms_per_megapixel'] <= self.target_ms_per_megapixel
+        if not info['within_target']:
+            logger.warning(f"⚠️  Image QR extraction {info['ms_per_megapixel']}ms/MP "
+                           f"exceeds target {self.target_ms_per_megapixel}ms/MP")
+        return qr_data, info
@@ -0,0 +1,404 @@
+# services/integrity_scanner_service.py - Background re-verification of the signed document store
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024  # 1MB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS findings (
+    subject TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    detail TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    pass INTEGER NOT NULL,
+    resolved_at TEXT,
+    PRIMARY KEY (subject, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_findings_open ON findings(resolved_at, kind);
+"""
+
+# Finding kinds
+MISSING_FILE = 'missing_file'          # registry entry whose signed file is gone
+HASH_MISMATCH = 'hash_mismatch'        # file bytes differ from signed_file_sha256
+NO_REFERENCE_HASH = 'no_reference_hash'  # signed before signed_file_sha256 was recorded
+INVALID_SIGNATURE = 'invalid_signature'  # registry hash/signature no longer verify
+READ_ERROR = 'read_error'
+ORPHAN_FILE = 'orphan_file'            # file in the signed store with no registry entry
+
+RECORD_KINDS = (MISSING_FILE, HASH_MISMATCH, NO_REFERENCE_HASH, INVALID_SIGNATURE, READ_ERROR)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class IntegrityScanner:
+    """
+    Walks the signed store in the background and re-checks every registry
+    entry: the signed file must exist and hash to the recorded
+    signed_file_sha256, and the recorded hash/signature (single or Merkle)
+    must still verify under VerificationService. A final phase reports files
+    in the store that no entry points to; it only looks at files written
+    since the previous pass started, so each orphan is reported once and
+    files that predate the scanner's first pass (the store before the
+    registry) are left alone. An orphan finding resolves once its file is
+    gone or registered.
+
+    Progress (phase + last transaction_id / filename) is checkpointed in a
+    SQLite file next to the findings, so a restart resumes mid-pass. The scan
+    stays out of the way of requests: file reads are capped at
+    max_bytes_per_sec, the thread sleeps so that it is busy at most
+    max_cpu_fraction of the time, it waits while should_yield() reports
+    foreground work, and on Linux the thread runs at the lowest priority.
+    A finding stays open until a later pass sees the entry healthy again.
+    """
+
+    def __init__(self, registry, verification_service, signed_folder='signed',
+                 db_path='data/integrity.db', interval=86400, max_bytes_per_sec=8 * 1024 * 1024,
+                 max_cpu_fraction=0.1, batch_size=100, checkpoint_every=50,
+                 should_yield=None, on_finding=None):
+        self.registry = registry
+        self.verification_service = verification_service
+        self.signed_folder = signed_folder
+        self.db_path = db_path
+        self.interval = interval
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.max_cpu_fraction = max_cpu_fraction
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.should_yield = should_yield
+        self.on_finding = on_finding
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self.state = self._load_state()
+        self.stats = {'documents_checked': 0, 'files_checked': 0, 'bytes_read': 0,
+                      'findings_opened': 0, 'findings_resolved': 0, 'throttle_sleep_s': 0.0,
+                      'yields': 0, 'errors': 0, 'signatures_skipped_retired_key': 0}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    # ---- state ---------------------------------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _load_state(self):
+        row = self._conn().execute('SELECT state FROM scan_state WHERE id = 1').fetchone()
+        state = {'pass': 0, 'phase': None, 'cursor': '', 'pass_started': None,
+                 'files_since': None, 'last_pass_completed': None, 'last_pass_seconds': None}
+        if row:
+            state.update(json.loads(row['state']))
+        return state
+
+    def _checkpoint(self):
+        self._conn().execute(
+            'INSERT INTO scan_state (id, state) VALUES (1, ?) '
+            'ON CONFLICT(id) DO UPDATE SET state = excluded.state',
+            (json.dumps(self.state),)
+        )
+
+    def _report(self, subject, kind, detail=None):
+        conn = self._conn()
+        now = _now()
+        row = conn.execute('SELECT resolved_at FROM findings WHERE subject = ? AND kind = ?',
+                           (subject, kind)).fetchone()
+        if row is None:
+            conn.execute(
+                'INSERT INTO findings (subject, kind, detail, first_seen, last_seen, pass) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (subject, kind, detail, now, now, self.state['pass'])
+            )
+        else:
+            conn.execute(
+                'UPDATE findings SET detail = ?, last_seen = ?, pass = ?, resolved_at = NULL '
+                'WHERE subject = ? AND kind = ?',
+                (detail, now, self.state['pass'], subject, kind)
+            )
+        if row is None or row['resolved_at'] is not None:
+            # New or reopened (still-open findings only get last_seen bumped)
+            logger.warning(f"⚠️  Integrity finding [{kind}] {subject}: {detail or ''}")
+            self.stats['findings_opened'] += 1
+            if self.on_finding is not None:
+                self.on_finding(subject, kind, detail)
+
+    def _resolve(self, subject, kinds):
+        cursor = self._conn().execute(
+            f"UPDATE findings SET resolved_at = ? WHERE subject = ? AND resolved_at IS NULL "
+            f"AND kind IN ({', '.join('?' * len(kinds))})",
+            (_now(), subject, *kinds)
+        )
+        if cursor.rowcount:
+            logger.info(f"✅ Integrity findings resolved for {subject}")
+            self.stats['findings_resolved'] += cursor.rowcount
+
+    # ---- throttling ----------------------------------------------------------------------
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            self.stats['throttle_sleep_s'] += seconds
+            self._stopped.wait(seconds)
+
+    def _yield_to_foreground(self):
+        while self.should_yield is not None and not self._stopped.is_set():
+            try:
+                busy = self.should_yield()
+            except Exception:
+                busy = False
+            if not busy:
+                return
+            self.stats['yields'] += 1
+            self._stopped.wait(0.5)
+
+    def _hash_file(self, path):
+        """SHA-256 of a file, read no faster than max_bytes_per_sec"""
+        hasher = hashlib.sha256()
+        start = time.monotonic()
+        total = 0
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                total += len(chunk)
+                self.stats['bytes_read'] += len(chunk)
+                if self.max_bytes_per_sec:
+                    self._sleep(total / self.max_bytes_per_sec - (time.monotonic() - start))
+                if self._stopped.is_set():
+                    return None
+        return hasher.hexdigest()
+
+    # ---- checks --------------------------------------------------------------------------
+
+    def check_record(self, record):
+        """Re-verify one registry entry; returns the finding kinds it has now (None if stopped)"""
+        subject = record['transaction_id']
+        found = []
+        path = record.get('signed_file_path')
+        if path:
+            if not os.path.exists(path):
+                found.append((MISSING_FILE, path))
+            elif not record.get('signed_file_sha256'):
+                found.append((NO_REFERENCE_HASH, path))
+            else:
+                try:
+                    digest = self._hash_file(path)
+                    if digest is None:
+                        return None  # stopping
+                    if digest != record['signed_file_sha256']:
+                        found.append((HASH_MISMATCH, f"expected {record['signed_file_sha256']}, got {digest}"))
+                except OSError as e:
+                    found.append((READ_ERROR, str(e)))
+
+        # Same check as /verify-document, without touching the request-path memo.
+        # Entries signed under a retired key cannot be checked against the current one.
+        if record.get('key_id') and record['key_id'] != self.verification_service.key_id:
+            self.stats['signatures_skipped_retired_key'] += 1
+        elif not self.verification_service.verify_payload(record, memo=False):
+            found.append((INVALID_SIGNATURE, record.get('key_id')))
+
+        for kind, detail in found:
+            self._report(subject, kind, detail)
+        healthy = [k for k in RECORD_KINDS if k not in {kind for kind, _ in found}]
+        self._resolve(subject, healthy)
+        self.stats['documents_checked'] += 1
+        return [kind for kind, _ in found]
+
+    def check_file(self, name):
+        if not self.registry.has_signed_filename(name):
+            self._report(name, ORPHAN_FILE, os.path.join(self.signed_folder, name))
+        else:
+            self._resolve(name, (ORPHAN_FILE,))
+        self.stats['files_checked'] += 1
+        return True
+
+    # ---- passes --------------------------------------------------------------------------
+
+    def _duty_cycle_sleep(self, cpu_seconds):
+        """Sleep long enough that cpu_seconds of work stay within max_cpu_fraction"""
+        if self.max_cpu_fraction and self.max_cpu_fraction < 1:
+            self._sleep(cpu_seconds * (1 - self.max_cpu_fraction) / self.max_cpu_fraction)
+
+    def _store_files_after(self, cursor, since):
+        """Next batch of store files after cursor, modified at or after since"""
+        try:
+            names = sorted(entry.name for entry in os.scandir(self.signed_folder)
+                           if entry.name > cursor and entry.is_file()
+                           and entry.stat().st_mtime >= since)
+        except FileNotFoundError:
+            return []
+        return names[:self.batch_size]
+
+    def _resolve_gone_orphans(self):
+        """Orphans are not re-checked every pass: resolve those deleted or registered since"""
+        rows = self._conn().execute(
+            'SELECT subject FROM findings WHERE kind = ? AND resolved_at IS NULL', (ORPHAN_FILE,)
+        ).fetchall()
+        for row in rows:
+            name = row['subject']
+            if (not os.path.exists(os.path.join(self.signed_folder, name))
+                    or self.registry.has_signed_filename(name)):
+                self._resolve(name, (ORPHAN_FILE,))
+
+    def run_pass(self):
+        """Run (or resume) one full pass; returns False if stopped midway"""
+        state = self.state
+        if state['phase'] is None:
+            started = time.time()
+            # Files older than the previous pass's start were looked at then (or predate
+            # the first pass)
+            state.update({'pass': state['pass'] + 1, 'phase': 'records', 'cursor': '',
+                          'pass_started': started, 'files_since': state['pass_started'] or started})
+            self._checkpoint()
+            logger.info(f"🔎 Integrity scan pass {state['pass']} started")
+        else:
+            logger.info(f"🔎 Integrity scan pass {state['pass']} resumed at "
+                        f"{state['phase']} after {state['cursor']!r}")
+
+        since_checkpoint = 0
+        while not self._stopped.is_set():
+            if state['phase'] == 'records':
+                batch = self.registry.iter_after(state['cursor'], self.batch_size)
+                check, key = self.check_record, (lambda record: record['transaction_id'])
+            else:
+                batch = self._store_files_after(state['cursor'], state.get('files_since') or 0)
+                check, key = self.check_file, (lambda name: name)
+
+            if not batch:
+                if state['phase'] == 'records':
+                    state.update({'phase': 'files', 'cursor': ''})
+                    self._checkpoint()
+                    continue
+                break
+
+            for item in batch:
+                self._yield_to_foreground()
+                if self._stopped.is_set():
+                    break
+                cpu_start = time.thread_time()  # this thread's CPU, not the throttled wall time
+                try:
+                    if check(item) is None:
+                        break  # stopped mid-item: resume before it
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.error(f"❌ Integrity check failed for {key(item)}: {e}")
+                state['cursor'] = key(item)
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    self._checkpoint()
+                    since_checkpoint = 0
+                self._duty_cycle_sleep(time.thread_time() - cpu_start)
+
+        if self._stopped.is_set():
+            self._checkpoint()
+            return False
+
+        # Every entry was visited: open record findings this pass did not see again
+        # belong to removed entries
+        cursor = self._conn().execute(
+            'UPDATE findings SET resolved_at = ? WHERE resolved_at IS NULL AND pass < ? AND kind != ?',
+            (_now(), state['pass'], ORPHAN_FILE)
+        )
+        self.stats['findings_resolved'] += cursor.rowcount
+        self._resolve_gone_orphans()
+        state.update({'phase': None, 'cursor': '', 'last_pass_completed': time.time(),
+                      'last_pass_seconds': round(time.time() - state['pass_started'], 3)})
+        self._checkpoint()
+        logger.info(f"✅ Integrity scan pass {state['pass']} finished in {state['last_pass_seconds']}s")
+        return True
+
+    def _run(self):
+        try:
+            # Lowest scheduling priority for this thread (Linux threads are tasks)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while not self._stopped.is_set():
+            state = self.state
+            due = (self._wake.is_set() or state['phase'] is not None
+                   or state['last_pass_completed'] is None
+                   or time.time() - state['last_pass_completed'] >= self.interval)
+            if due:
+                self._wake.clear()
+                try:
+                    self.run_pass()
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.error(f"❌ Integrity scan pass failed: {e}")
+                    self._stopped.wait(60)
+                continue
+            self._wake.wait(max(1.0, self.interval - (time.time() - state['last_pass_completed'])))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='integrity-scanner', daemon=True)
+            self._thread.start()
+
+    def request_scan(self):
+        """Start a new pass now (no-op while one is running)"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # ---- reporting -----------------------------------------------------------------------
+
+    def findings(self, kind=None, include_resolved=False, limit=100):
+        clauses, params = [], []
+        if not include_resolved:
+            clauses.append('resolved_at IS NULL')
+        if kind:
+            clauses.append('kind = ?')
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._conn().execute(
+            f'SELECT * FROM findings {where} ORDER BY last_seen DESC LIMIT ?',
+            (*params, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_stats(self):
+        open_by_kind = {row['kind']: row['n'] for row in self._conn().execute(
+            'SELECT kind, COUNT(*) AS n FROM findings WHERE resolved_at IS NULL GROUP BY kind'
+        )}
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'pass': self.state['pass'],
+            'phase': self.state['phase'],
+            'cursor': self.state['cursor'],
+            'last_pass_completed': self.state['last_pass_completed'],
+            'last_pass_seconds': self.state['last_pass_seconds'],
+            'interval': self.interval,
+            'max_bytes_per_sec': self.max_bytes_per_sec,
+            'max_cpu_fraction': self.max_cpu_fraction,
+            'open_findings': open_by_kind,
+            **self.stats,
+        }
@@ -0,0 +1,273 @@
+# services/memory_governor.py - Per-process memory budget for MuPDF's store, page renders and OpenCV buffers
+
+import os
+import math
+import time
+import fcntl
+import threading
+import logging
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+SUBSYSTEMS = ('mupdf_store', 'pixmaps', 'render_cache', 'opencv')
+# A page render holds the pixmap and its NumPy conversion at the same time
+RENDER_COPIES = 2
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def process_rss():
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RenderSlots:
+    """
+    count slots shared by every process using the same directory: one flock()ed
+    file per slot. The kernel drops a dead (e.g. timed-out and killed) worker's
+    locks, so slots never leak.
+    """
+
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, directory, count):
+        self.directory = directory
+        self.count = count
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, timeout=0):
+        """File descriptor of the slot taken, or None after timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            for i in range(self.count):
+                fd = os.open(os.path.join(self.directory, f"slot-{i}.lock"),
+                             os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except OSError:
+                    os.close(fd)
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    def release(self, fd):
+        os.close(fd)  # closing the descriptor drops the lock
+
+
+class _LocalSlots:
+    """Slots for this process only (no shared directory configured)"""
+
+    def __init__(self, count):
+        self._semaphore = threading.BoundedSemaphore(count)
+
+    def acquire(self, timeout=0):
+        return True if self._semaphore.acquire(timeout=timeout) else None
+
+    def release(self, token):
+        self._semaphore.release()
+
+
+class MemoryGovernor:
+    """
+    Keeps one process (an executor worker, or the app process when the
+    executor is disabled) within budget_bytes of RSS.
+
+    - MuPDF store: this PyMuPDF build cannot change the store limit, so the
+      store is shrunk back under store_max_bytes after every render and down
+      to store_idle_bytes between jobs.
+    - Renders: render() sizes a page render before it happens (clip width x
+      height x zoom^2 x channels, times RENDER_COPIES). Renders larger than
+      high_dpi_bytes, whatever their zoom, wait for one of
+      max_high_dpi_renders slots (shared by all processes configured with the
+      same render_slots_dir) for up to queue_timeout seconds, then run at the
+      zoom that fits high_dpi_bytes instead. When RSS plus the render would
+      pass soft_limit of the budget, the store is emptied first and the zoom
+      is lowered (not below min_zoom) to what fits.
+    - Accounting: current and peak bytes per subsystem (MuPDF store, in-flight
+      pixmaps, session render caches, OpenCV buffers) and RSS.
+    """
+
+    def __init__(self, budget_bytes=1024 * MIB, store_max_bytes=128 * MIB,
+                 store_idle_bytes=16 * MIB, high_dpi_bytes=12 * MIB, max_high_dpi_renders=2,
+                 render_slots_dir=None, soft_limit=0.85, min_zoom=1.0, queue_timeout=2):
+        self.budget_bytes = budget_bytes
+        self.store_max_bytes = store_max_bytes
+        self.store_idle_bytes = store_idle_bytes
+        self.high_dpi_bytes = high_dpi_bytes
+        self.max_high_dpi_renders = max_high_dpi_renders
+        self.soft_limit = soft_limit
+        self.min_zoom = min_zoom
+        self.queue_timeout = queue_timeout
+        self._slots = (RenderSlots(render_slots_dir, max_high_dpi_renders) if render_slots_dir
+                       else _LocalSlots(max_high_dpi_renders))
+        self._lock = threading.Lock()
+        self._current = dict.fromkeys(SUBSYSTEMS, 0)
+        self._peak = dict.fromkeys(SUBSYSTEMS, 0)
+        self._peak_rss = 0
+        self.stats = {'renders': 0, 'high_dpi_renders': 0, 'degraded_renders': 0,
+                      'queued_renders': 0, 'queue_timeouts': 0, 'total_queue_ms': 0.0,
+                      'store_trims': 0, 'bytes_trimmed': 0, 'over_budget': 0}
+
+    # --- accounting -------------------------------------------------------------
+
+    def account(self, subsystem, delta):
+        with self._lock:
+            value = self._current[subsystem] = max(0, self._current[subsystem] + delta)
+            self._peak[subsystem] = max(self._peak[subsystem], value)
+
+    @contextmanager
+    def track(self, subsystem, nbytes):
+        """Count nbytes against subsystem for the duration of the block"""
+        self.account(subsystem, nbytes)
+        try:
+            yield
+        finally:
+            self.account(subsystem, -nbytes)
+
+    def _sample(self):
+        rss = process_rss()
+        store = fitz.TOOLS.store_size
+        with self._lock:
+            self._peak_rss = max(self._peak_rss, rss)
+            self._current['mupdf_store'] = store
+            self._peak['mupdf_store'] = max(self._peak['mupdf_store'], store)
+            if rss > self.budget_bytes:
+                self.stats['over_budget'] += 1
+        return rss
+
+    # --- MuPDF store ------------------------------------------------------------
+
+    def trim_store(self, target=None):
+        """Shrink MuPDF's store to at most target bytes (default store_max_bytes)"""
+        target = self.store_max_bytes if target is None else target
+        size = fitz.TOOLS.store_size
+        if size <= target:
+            return 0
+        percent = 100 if target <= 0 else min(100, math.ceil(100 * (size - target) / size))
+        fitz.TOOLS.store_shrink(percent)
+        freed = size - fitz.TOOLS.store_size
+        with self._lock:
+            self.stats['store_trims'] += 1
+            self.stats['bytes_trimmed'] += max(0, freed)
+        return freed
+
+    def between_jobs(self):
+        """Trim the store to its idle size; returns this process's stats for the executor"""
+        self.trim_store(self.store_idle_bytes)
+        self._sample()
+        return self.get_stats()
+
+    # --- renders ----------------------------------------------------------------
+
+    @staticmethod
+    def render_bytes(width_pt, height_pt, zoom, channels=3):
+        """Estimated memory of a width_pt x height_pt render at zoom"""
+        return width_pt * height_pt * zoom * zoom * channels * RENDER_COPIES
+
+    def plan_zoom(self, width_pt, height_pt, zoom, channels=3):
+        """Zoom at which a width_pt x height_pt render fits the remaining budget"""
+        needed = self.render_bytes(width_pt, height_pt, zoom, channels)
+        soft = self.budget_bytes * self.soft_limit
+        rss = self._sample()
+        if rss + needed <= soft:
+            return zoom
+        self.trim_store(0)
+        headroom = soft - self._sample()
+        if headroom >= needed:
+            return zoom
+        fitted = zoom * math.sqrt(max(headroom, 0) / needed)
+        return max(self.min_zoom, min(zoom, fitted))
+
+    @contextmanager
+    def render(self, width_pt, height_pt, zoom, channels=3):
+        """
+        Admit a page render; yields the zoom to render at (possibly lower than
+        asked). The block should create and release the pixmap.
+        """
+        effective = self.plan_zoom(width_pt, height_pt, zoom, channels)
+        slot = None
+        if self.render_bytes(width_pt, height_pt, effective, channels) > self.high_dpi_bytes:
+            started = time.perf_counter()
+            slot = self._slots.acquire()
+            if slot is None:
+                with self._lock:
+                    self.stats['queued_renders'] += 1
+                slot = self._slots.acquire(timeout=self.queue_timeout)
+                with self._lock:
+                    self.stats['total_queue_ms'] += (time.perf_counter() - started) * 1000
+                if slot is None:
+                    with self._lock:
+                        self.stats['queue_timeouts'] += 1
+                    # 1 pt at zoom 1 is 1 px, so this is the zoom whose render is high_dpi_bytes
+                    fitted = math.sqrt(self.high_dpi_bytes / self.render_bytes(width_pt, height_pt, 1, channels))
+                    effective = max(self.min_zoom, min(effective, fitted))
+        if effective < zoom:
+            logger.info(f"🪫 Render at zoom {effective:.2f} instead of {zoom} (memory budget)")
+        nbytes = int(self.render_bytes(width_pt, height_pt, effective, channels))
+        with self._lock:
+            self.stats['renders'] += 1
+            self.stats['high_dpi_renders'] += slot is not None
+            self.stats['degraded_renders'] += effective < zoom
+        try:
+            with self.track('pixmaps', nbytes):
+                yield effective
+        finally:
+            if slot is not None:
+                self._slots.release(slot)
+            self.trim_store()
+
+    def get_stats(self):
+        rss = self._sample()
+        with self._lock:
+            stats = dict(self.stats)
+            current = dict(self._current)
+            peak = dict(self._peak)
+            peak_rss = self._peak_rss
+        renders = stats['queued_renders']
+        return {
+            'pid': os.getpid(),
+            'budget_bytes': self.budget_bytes,
+            'rss_bytes': rss,
+            'peak_rss_bytes': peak_rss,
+            'store_max_bytes': self.store_max_bytes,
+            'store_idle_bytes': self.store_idle_bytes,
+            'high_dpi_bytes': self.high_dpi_bytes,
+            'max_high_dpi_renders': self.max_high_dpi_renders,
+            'queue_timeout': self.queue_timeout,
+            'subsystems': {name: {'current_bytes': current[name], 'peak_bytes': peak[name]}
+                           for name in SUBSYSTEMS},
+            'mean_queue_ms': round(stats.pop('total_queue_ms') / renders, 3) if renders else 0.0,
+            **stats,
+        }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Replace this process's governor (call before the first render)"""
+    global _governor
+    with _governor_lock:
+        _governor = MemoryGovernor(**{k: v for k, v in kwargs.items() if v is not None})
+    return _governor
+
+
+def get():
+    """This process's governor (default budget if configure() was never called)"""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = MemoryGovernor()
+    return _governor
@@ -1,50 +1,56 @@
-import fitz  # PyMuPDF
 from PIL import Image
+from services.document_session import DocumentSession
+from services.stamp_template_service import StampTemplateService
+
+# Document.save() options per output profile; see benchmarks/pdf_output_profiles.py
+OUTPUT_PROFILES = {
+    # Write objects as they are: quickest save, largest file (previous behaviour)
+    'fastest-save': {},
+    # Drop unused objects and compress uncompressed streams
+    'balanced': {'garbage': 1, 'deflate': True},
+    # Merge duplicate objects, compact xref, compress everything
+    'smallest-file': {'garbage': 4, 'clean': True, 'deflate': True,
+                      'deflate_images': True, 'deflate_fonts': True},
+    # Linearized ("fast web view") so /download can render page 1 before the rest arrives
+    'web-linearized': {'garbage': 3, 'deflate': True, 'linear': True},
+}
 
 class PDFService:
-    def add_qr_to_pdf(self, input_pdf_path, qr_image_path, output_pdf_path):
-        """Add QR code to PDF document"""
+    def __init__(self, default_profile='fastest-save', stamp_templates=None,
+                 large_document_bytes=64 * 1024 * 1024):
+        if default_profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile: {default_profile}")
+        self.default_profile = default_profile
+        self.stamp_templates = stamp_templates or StampTemplateService()
+        self.large_document_bytes = large_document_bytes
+
+    def add_qr_to_pdf(self, input_pdf_path, qr_image_path, output_pdf_path, profile=None,
+                      stamp=None, qr_stream=None):
+        """
+        Add QR code to PDF document.
+        input_pdf_path: a path or a DocumentSession already opened by an earlier stage
+        qr_image_path / qr_stream: the QR as a PNG file or as PNG bytes
+        stamp: optional {'tenant', 'position', 'qr_size', ...} layout selection
+        Returns the SHA-256 of the signed file, or the signed PDF bytes when
+        output_pdf_path is None (nothing is written to disk).
+        """
         try:
-            # Open PDF
-            pdf_document = fitz.open(input_pdf_path)
-            
-            # Get first page
-            page = pdf_document.load_page(0)
-            
-            # Get page dimensions
-            page_rect = page.rect
-            
-            # Define QR code position (bottom right corner)
-            qr_size = 100
-            qr_rect = fitz.Rect(
-                page_rect.width - qr_size - 20,  # x0
-                page_rect.height - qr_size - 20,  # y0
-                page_rect.width - 20,             # x1
-                page_rect.height - 20             # y1
-            )
-            
-            # Insert QR code image
-            page.insert_image(qr_rect, filename=qr_image_path)
-            
-            # Add verification text
-            text_rect = fitz.Rect(
-                page_rect.width - 200,
-                page_rect.height - qr_size - 40,
-                page_rect.width - 20,
-                page_rect.height - qr_size - 20
-            )
-            
-            page.insert_textbox(
-                text_rect,
-                "Dokumen Tersertifikasi Digital\nScan QR untuk verifikasi",
-                fontsize=8,
-                color=(0, 0, 0),
-                align=1  # Center align
-            )
-            
-            # Save modified PDF
-            pdf_document.save(output_pdf_path)
-            pdf_document.close()
+            save_options = OUTPUT_PROFILES[profile or self.default_profile]
+            layout = self.stamp_templates.get_layout(**(stamp or {}))
+            
+            # Open PDF (or reuse the caller's session)
+            with DocumentSession.use(input_pdf_path,
+                                     large_document_bytes=self.large_document_bytes) as session:
+                # Get first page
+                page = session.page(0)
+                
+                # Overlay the cached caption template and the QR code
+                self.stamp_templates.apply(page, layout, qr_image_path, qr_stream)
+                
+                # Save modified PDF with the selected output profile
+                if output_pdf_path is None:
+                    return session.to_bytes(**save_options)
+                return session.save(output_pdf_path, **save_options)
             
         except Exception as e:
-            raise Exception(f"Error adding QR code to PDF: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error adding QR code to PDF: {str(e)}")
@@ -0,0 +1,101 @@
+# services/preflight_service.py - Cheap PDF preflight and interactive/bulk lane routing
+
+import os
+import time
+import threading
+import logging
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+
+class PreflightService:
+    """
+    Sizes up a PDF from its trailer and xref before any real work is queued.
+    MuPDF opens documents lazily: opening reads the trailer and xref, the page
+    count comes from the page tree root's /Count, and the image count reads
+    only object dictionaries (/Subtype), never page content or image streams.
+    At most max_objects dictionaries are inspected; beyond that the count is
+    extrapolated. A broken xref forces MuPDF to repair (scan) the file, which
+    is reported and routes the document to the bulk lane.
+
+    route() puts a document in the bulk lane when any of its page count,
+    file size or image count reaches the configured thresholds.
+    """
+
+    def __init__(self, bulk_pages=50, bulk_bytes=20 * 1024 * 1024, bulk_images=200,
+                 max_objects=20000):
+        self.bulk_pages = bulk_pages
+        self.bulk_bytes = bulk_bytes
+        self.bulk_images = bulk_images
+        self.max_objects = max_objects
+        self._lock = threading.Lock()
+        self.stats = {'preflights': 0, 'failed': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                      INTERACTIVE: 0, BULK: 0}
+
+    def inspect(self, file_path):
+        """Page count, size, image count and encryption of a PDF, without parsing pages"""
+        start = time.perf_counter()
+        info = {'file_size': os.path.getsize(file_path)}
+        try:
+            doc = fitz.open(file_path)
+            try:
+                info['encrypted'] = doc.is_encrypted
+                info['needs_password'] = doc.needs_pass
+                info['repaired'] = doc.is_repaired
+                info['page_count'] = doc.page_count if not doc.needs_pass else None
+                objects = doc.xref_length() - 1
+                inspected = min(objects, self.max_objects)
+                images = 0
+                if not doc.needs_pass:
+                    for xref in range(1, inspected + 1):
+                        if doc.xref_get_key(xref, 'Subtype')[1] == '/Image':
+                            images += 1
+                    if inspected < objects:
+                        images = round(images * objects / max(inspected, 1))
+                info['objects'] = objects
+                info['image_count'] = images
+                info['image_count_estimated'] = inspected < objects
+            finally:
+                doc.close()
+        except Exception as e:
+            info['error'] = f"Unreadable PDF: {e}"
+        info['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        info['lane'] = self.route(info)
+
+        with self._lock:
+            self.stats['preflights'] += 1
+            self.stats['failed'] += 'error' in info
+            self.stats['total_ms'] += info['elapsed_ms']
+            self.stats['max_ms'] = max(self.stats['max_ms'], info['elapsed_ms'])
+            self.stats[info['lane']] += 1
+        return info
+
+    def route(self, info):
+        """Lane for a preflight result"""
+        if info.get('error') or info.get('repaired'):
+            return BULK
+        if ((info.get('page_count') or 0) >= self.bulk_pages
+                or info['file_size'] >= self.bulk_bytes
+                or (info.get('image_count') or 0) >= self.bulk_images):
+            return BULK
+        return INTERACTIVE
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        count = stats['preflights']
+        return {
+            'bulk_pages': self.bulk_pages,
+            'bulk_bytes': self.bulk_bytes,
+            'bulk_images': self.bulk_images,
+            'preflights': count,
+            'failed': stats['failed'],
+            'mean_ms': round(stats['total_ms'] / count, 3) if count else 0.0,
+            'max_ms': round(stats['max_ms'], 3),
+            'routed': {lane: stats[lane] for lane in LANES},
+        }
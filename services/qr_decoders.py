@@ -0,0 +1,287 @@
+# services/qr_decoders.py - Pluggable QR decoder backends
+
+import abc
+import threading
+import time
+import logging
+import cv2
+import numpy as np
+
+try:
+    from pyzbar import pyzbar
+except Exception:  # pyzbar installed but libzbar missing, or not installed at all
+    pyzbar = None
+
+logger = logging.getLogger(__name__)
+
+
+class QRDecoderBackend(abc.ABC):
+    """Base class for QR decoders. Detector objects are cached per thread."""
+
+    name = 'base'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def available(self):
+        return True
+
+    @abc.abstractmethod
+    def _create_detector(self):
+        """A new detector object for the calling thread"""
+
+    def _detector(self):
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            detector = self._create_detector()
+            self._local.detector = detector
+        return detector
+
+    @abc.abstractmethod
+    def decode(self, img):
+        """Return decoded text or None"""
+
+
+class OpenCVClassicDecoder(QRDecoderBackend):
+    name = 'opencv'
+
+    def _create_detector(self):
+        return cv2.QRCodeDetector()
+
+    def decode(self, img):
+        data, _, _ = self._detector().detectAndDecode(img)
+        return data or None
+
+
+class OpenCVArucoDecoder(QRDecoderBackend):
+    name = 'aruco'
+
+    def available(self):
+        return hasattr(cv2, 'QRCodeDetectorAruco')
+
+    def _create_detector(self):
+        return cv2.QRCodeDetectorAruco()
+
+    def decode(self, img):
+        data, _, _ = self._detector().detectAndDecode(img)
+        return data or None
+
+
+class ZbarDecoder(QRDecoderBackend):
+    name = 'zbar'
+
+    def available(self):
+        return pyzbar is not None
+
+    def _create_detector(self):
+        return pyzbar
+
+    def decode(self, img):
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        results = self._detector().decode(img, symbols=[pyzbar.ZBarSymbol.QRCODE])
+        for result in results:
+            try:
+                return result.data.decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+        return None
+
+
+DECODER_BACKENDS = {
+    OpenCVClassicDecoder.name: OpenCVClassicDecoder,
+    OpenCVArucoDecoder.name: OpenCVArucoDecoder,
+    ZbarDecoder.name: ZbarDecoder,
+}
+
+
+class DecoderCascade:
+    """
+    Tries the configured backends in order until one decodes.
+    Per-backend hit/latency stats only count images some backend decoded:
+    images without a QR (most page renders) say nothing about a backend. With
+    auto_order enabled, the cascade periodically moves the fastest backend
+    with a good hit rate to the front; backends that have not been measured
+    yet go before the ones known to miss.
+    """
+
+    def __init__(self, names=None, auto_order=False, min_hit_rate=0.9,
+                 reorder_every=50):
+        names = names or list(DECODER_BACKENDS)
+        self.backends = []
+        for name in names:
+            name = name.strip()
+            backend_cls = DECODER_BACKENDS.get(name)
+            if backend_cls is None:
+                logger.warning(f"⚠️  Unknown QR decoder backend: {name}")
+                continue
+            backend = backend_cls()
+            if not backend.available():
+                logger.warning(f"⚠️  QR decoder backend not available: {name}")
+                continue
+            self.backends.append(backend)
+
+        if not self.backends:
+            self.backends.append(OpenCVClassicDecoder())
+
+        self.auto_order = auto_order
+        self.min_hit_rate = min_hit_rate
+        self.reorder_every = reorder_every
+        self._lock = threading.Lock()
+        self._stats = {b.name: {'attempts': 0, 'hits': 0, 'total_ms': 0.0}
+                       for b in self.backends}
+        self._calls = 0   # images decoded
+        self._empty = 0   # images no backend decoded (not in the per-backend stats)
+
+    @property
+    def order(self):
+        return [b.name for b in self.backends]
+
+    def decode(self, img):
+        """Return (data, backend_name) or (None, None)"""
+        backends = self.backends
+        tried = []
+        for backend in backends:
+            start = time.perf_counter()
+            try:
+                data = backend.decode(img)
+            except Exception as e:
+                logger.debug(f"  💥 {backend.name} decoder error: {e}")
+                data = None
+            tried.append((backend.name, bool(data), (time.perf_counter() - start) * 1000))
+            if data:
+                self._record(tried)
+                return data, backend.name
+        with self._lock:
+            self._empty += 1
+        return None, None
+
+    def _record(self, tried):
+        """Stats of one decoded image: (backend, hit, elapsed_ms) for each backend tried"""
+        with self._lock:
+            for name, hit, elapsed_ms in tried:
+                stats = self._stats[name]
+                stats['attempts'] += 1
+                stats['hits'] += int(hit)
+                stats['total_ms'] += elapsed_ms
+            self._calls += 1
+            if self.auto_order and self._calls % self.reorder_every == 0:
+                self._reorder(self._stats)
+
+    def _reorder(self, stats):
+        def sort_key(backend):
+            s = stats[backend.name]
+            if not s['attempts']:
+                return (1, -1.0)
+            hit_rate = s['hits'] / s['attempts']
+            # Accurate backends first (fastest among them), then unmeasured
+            # ones, then the rest by hit rate
+            if hit_rate >= self.min_hit_rate:
+                return (0, s['total_ms'] / s['attempts'])
+            return (1, -hit_rate)
+
+        # Replace the list rather than sorting in place so concurrent decode()
+        # calls keep iterating over a consistent snapshot
+        self.backends = sorted(self.backends, key=sort_key)
+
+    def apply_benchmark(self, results):
+        """Reorder from benchmark() output"""
+        stats = {name: {'attempts': r['samples'], 'hits': r['hits'],
+                        'total_ms': r['mean_ms'] * r['samples']}
+                 for name, r in results.items()}
+        with self._lock:
+            for backend in self.backends:
+                stats.setdefault(backend.name, {'attempts': 0, 'hits': 0, 'total_ms': 0.0})
+            self._reorder(stats)
+        return self.order
+
+    def benchmark(self, samples):
+        """
+        Measure hit rate and latency of every backend on the same samples.
+        samples: iterable of (category, image, expected_text or None)
+        """
+        samples = list(samples)
+        results = {}
+        for backend in self.backends:
+            hits = 0
+            timings = []
+            by_category = {}
+            for category, img, expected in samples:
+                start = time.perf_counter()
+                try:
+                    data = backend.decode(img)
+                except Exception:
+                    data = None
+                timings.append((time.perf_counter() - start) * 1000)
+                hit = bool(data) and (expected is None or data == expected)
+                hits += int(hit)
+                cat = by_category.setdefault(category, {'samples': 0, 'hits': 0})
+                cat['samples'] += 1
+                cat['hits'] += int(hit)
+
+            timings.sort()
+            count = len(timings)
+            results[backend.name] = {
+                'samples': count,
+                'hits': hits,
+                'hit_rate': hits / count if count else 0.0,
+                'mean_ms': sum(timings) / count if count else 0.0,
+                'p95_ms': timings[min(count - 1, int(count * 0.95))] if count else 0.0,
+                'by_category': by_category,
+            }
+        return results
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'order': self.order,
+                'auto_order': self.auto_order,
+                'decoded': self._calls,
+                'not_decoded': self._empty,
+                'backends': {
+                    name: {
+                        'attempts': s['attempts'],
+                        'hits': s['hits'],
+                        'mean_ms': round(s['total_ms'] / s['attempts'], 3) if s['attempts'] else None,
+                    }
+                    for name, s in self._stats.items()
+                }
+            }
+
+
+def make_benchmark_samples(image, expected=None, seed=0):
+    """
+    Derive stamped / rescanned / photographed variants from a clean render.
+    Used by benchmarks/qr_decoders.py.
+    """
+    rng = np.random.default_rng(seed)
+    samples = [('stamped', image, expected)]
+
+    # Rescanned: slight rotation, blur and sensor noise
+    h, w = image.shape[:2]
+    rot = cv2.getRotationMatrix2D((w / 2, h / 2), float(rng.uniform(-2, 2)), 1.0)
+    rescanned = cv2.warpAffine(image, rot, (w, h), borderValue=(255, 255, 255))
+    rescanned = cv2.GaussianBlur(rescanned, (3, 3), 0)
+    noise = rng.normal(0, 8, rescanned.shape)
+    rescanned = np.clip(rescanned.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    samples.append(('rescanned', rescanned, expected))
+
+    # Photographed: perspective skew, uneven lighting, JPEG artifacts
+    jitter = w * 0.06
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = np.float32([[rng.uniform(0, jitter), rng.uniform(0, jitter)],
+                      [w - rng.uniform(0, jitter), rng.uniform(0, jitter)],
+                      [w - rng.uniform(0, jitter), h - rng.uniform(0, jitter)],
+                      [rng.uniform(0, jitter), h - rng.uniform(0, jitter)]])
+    warp = cv2.getPerspectiveTransform(src, dst)
+    photo = cv2.warpPerspective(image, warp, (w, h), borderValue=(200, 200, 200))
+    gradient = np.linspace(0.7, 1.0, w, dtype=np.float32)[None, :]
+    if photo.ndim == 3:
+        gradient = gradient[..., None]
+    photo = np.clip(photo.astype(np.float32) * gradient, 0, 255).astype(np.uint8)
+    ok, jpeg = cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    if ok:
+        photo = cv2.imdecode(jpeg, cv2.IMREAD_UNCHANGED)
+    samples.append(('photographed', photo, expected))
+
+    return samples
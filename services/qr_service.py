@@ -1,6 +1,7 @@
 # services/qr_service.py - Debug version dengan extensive logging
 
 import qrcode
+import io
 import json
 import cv2
 import numpy as np
@@ -13,13 +14,53 @@ import hashlib
 import os
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from services.qr_decoders import DecoderCascade
+from services.document_session import DocumentSession
+from services.finder_locator import qr_candidate_boxes
 
 # Setup detailed logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+def pixmap_to_bgr(pix):
+    """Convert a PyMuPDF pixmap to a BGR array straight from its sample buffer (no PNG round trip)"""
+    arr = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    arr = arr[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return cv2.cvtColor(arr, cv2.COLOR_GRAY2BGR)
+    if pix.n == 2:  # gray + alpha
+        return cv2.cvtColor(np.ascontiguousarray(arr[:, :, 0]), cv2.COLOR_GRAY2BGR)
+    if pix.n == 3:
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(arr, cv2.COLOR_RGBA2BGR)
+
+def pixmap_to_gray(pix):
+    """Single-channel array from a grayscale pixmap"""
+    arr = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return arr[:, :pix.width].copy()  # own the memory: the pixmap is freed after this
+
 class QRService:
-    def __init__(self):
+    def __init__(self, decoders=None, auto_order_decoders=False,
+                 large_document_bytes=64 * 1024 * 1024, max_image_pixels=16 * 1024 * 1024,
+                 locator_zoom=1.5, locator_max_candidates=4, locator_module_px=5.0,
+                 template_memory=None, template_padding=0.25):
+        self.decoders = DecoderCascade(decoders, auto_order=auto_order_decoders)
+        # Finder-pattern locator: one grayscale render at locator_zoom is scanned for
+        # 1:1:3:1:1 runs, and only the candidate boxes are rendered again, at a zoom
+        # giving about locator_module_px pixels per QR module (0 disables it)
+        self.locator_zoom = locator_zoom
+        self.locator_max_candidates = locator_max_candidates
+        self.locator_module_px = locator_module_px
+        # Above this size, MuPDF's resource store is shrunk after every render and
+        # embedded images larger than max_image_pixels are not decoded at full size
+        # (the page renders in method 1 already cover them)
+        self.large_document_bytes = large_document_bytes
+        self.max_image_pixels = max_image_pixels
+        # Learned QR locations per document template (QRTemplateMemory, None disables):
+        # the learned box, grown by template_padding of its size on each side, is
+        # rendered and decoded before the full search
+        self.template_memory = template_memory
+        self.template_padding = template_padding
         self.private_key = rsa.generate_private_key(
             public_exponent=65537,
             key_size=2048
@@ -33,17 +74,13 @@ class QRService:
             import cv2
             logger.info(f"✅ OpenCV version: {cv2.__version__}")
             
-            # Test QR detector
-            detector = cv2.QRCodeDetector()
-            logger.info("✅ QRCodeDetector created successfully")
+            # Report decoder cascade
+            logger.info(f"✅ QR decoder cascade: {self.decoders.order}")
             
         except Exception as e:
             logger.error(f"❌ OpenCV test failed: {e}")
     
-    def generate_qr_code(self, data, filename_prefix):
-        """Generate QR code with verification data"""
-        logger.info(f"🎯 Generating QR code with prefix: {filename_prefix}")
-        
+    def _make_qr_image(self, data):
         # Convert data to JSON string
         qr_data = json.dumps(data)
         logger.info(f"📝 QR data: {qr_data}")
@@ -59,7 +96,18 @@ class QRService:
         qr.make(fit=True)
         
         # Create QR code image
-        qr_image = qr.make_image(fill_color="black", back_color="white")
+        return qr.make_image(fill_color="black", back_color="white")
+    
+    def generate_qr_png(self, data):
+        """QR code PNG as bytes, for stamping without a temporary file"""
+        buffer = io.BytesIO()
+        self._make_qr_image(data).save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    def generate_qr_code(self, data, filename_prefix):
+        """Generate QR code with verification data"""
+        logger.info(f"🎯 Generating QR code with prefix: {filename_prefix}")
+        qr_image = self._make_qr_image(data)
         
         # Save QR code
         qr_filename = f"{filename_prefix}_qr.png"
@@ -69,46 +117,63 @@ class QRService:
         return qr_filename
     
     def extract_qr_from_pdf(self, pdf_path):
-        """Extract QR code data from PDF - Debug version"""
+        """
+        Extract QR code data from PDF - Debug version.
+        pdf_path may also be a DocumentSession shared with other stages.
+        """
         logger.info(f"🔍 Starting QR extraction from: {pdf_path}")
         
         try:
             # Check file exists
-            if not os.path.exists(pdf_path):
+            if not isinstance(pdf_path, DocumentSession) and not os.path.exists(pdf_path):
                 logger.error(f"❌ File not found: {pdf_path}")
                 return None
             
-            file_size = os.path.getsize(pdf_path)
-            logger.info(f"📄 File size: {file_size} bytes")
-            
-            # Open PDF
-            logger.info("📖 Opening PDF...")
-            pdf_document = fitz.open(pdf_path)
-            logger.info(f"✅ PDF opened successfully. Pages: {len(pdf_document)}")
-            
-            for page_num in range(len(pdf_document)):
-                logger.info(f"🔍 Processing page {page_num + 1}")
-                page = pdf_document.load_page(page_num)
+            with DocumentSession.use(pdf_path, large_document_bytes=self.large_document_bytes) as session:
+                logger.info(f"📄 File size: {session.size} bytes")
+                large = session.large
+                if large:
+                    logger.info("📦 Large document mode: releasing each page eagerly")
                 
-                # Method 1: Try OpenCV QR detection
-                result = self._try_opencv_detection(page, page_num)
-                if result:
-                    pdf_document.close()
-                    return result
+                # Open PDF (once per session)
+                logger.info("📖 Opening PDF...")
+                pdf_document = session.document
+                logger.info(f"✅ PDF opened successfully. Pages: {len(pdf_document)}")
                 
-                # Method 2: Try manual image extraction
-                result = self._try_image_extraction(pdf_document, page, page_num)
-                if result:
-                    pdf_document.close()
-                    return result
+                # Method 0: Where this document's template had its QR last time
+                fingerprint = None
+                if self.template_memory is not None:
+                    fingerprint = self.template_memory.fingerprint(session)
+                    result = self._try_learned_location(session, fingerprint)
+                    if result:
+                        return result
                 
-                # Method 3: Try text extraction
-                result = self._try_text_extraction(page, page_num)
-                if result:
-                    pdf_document.close()
-                    return result
+                for page_num in range(len(pdf_document)):
+                    logger.info(f"🔍 Processing page {page_num + 1}")
+                    page = session.page(page_num)
+                    found = {}
+                    
+                    # Method 1: Try OpenCV QR detection
+                    result = self._try_opencv_detection(session, page_num, found)
+                    
+                    # Method 2: Try manual image extraction
+                    if not result:
+                        result = self._try_image_extraction(pdf_document, page, page_num, large, found)
+                    
+                    # Method 3: Try text extraction
+                    if not result:
+                        result = self._try_text_extraction(session, page_num)
+                        found.update(method='text', rect=page.rect, zoom=1)
+                    
+                    if result:
+                        if fingerprint:
+                            self._learn_location(session, fingerprint, page_num, found)
+                        return result
+                    
+                    page = None
+                    if large:
+                        session.release_page(page_num)
             
-            pdf_document.close()
             logger.error("❌ No QR code found with any method")
             
             # FOR TESTING: Return mock data temporarily
@@ -123,31 +188,129 @@ class QRService:
             logger.warning("🧪 RETURNING MOCK DATA DUE TO ERROR")
             return self._get_mock_qr_data()
     
-    def _try_opencv_detection(self, page, page_num):
-        """Try OpenCV QR detection method"""
+    def _try_learned_location(self, session, fingerprint):
+        """Decode only the page region (or page text) where this template's QR was found before"""
         try:
+            learned = self.template_memory.lookup(fingerprint)
+            if learned is None:
+                return None
+            page_num = learned['page'] + session.page_count if learned['page'] < 0 else learned['page']
+            logger.info(f"🧠 Method 0: Learned {learned['method']} location on page {page_num + 1}")
+            
+            qr_data = None
+            if 0 <= page_num < session.page_count:
+                if learned['method'] == 'text':
+                    qr_data = self._try_text_extraction(session, page_num)
+                else:
+                    rect = session.page(page_num).rect
+                    pad_x = (learned['x1'] - learned['x0']) * self.template_padding
+                    pad_y = (learned['y1'] - learned['y0']) * self.template_padding
+                    clip = fitz.Rect((learned['x0'] - pad_x) * rect.width, (learned['y0'] - pad_y) * rect.height,
+                                     (learned['x1'] + pad_x) * rect.width, (learned['y1'] + pad_y) * rect.height) & rect
+                    img = session.render(page_num, learned['zoom'], pixmap_to_bgr, clip=clip)
+                    data, backend = self.decoders.decode(img)
+                    img = None
+                    if data:
+                        try:
+                            qr_data = json.loads(data)
+                        except json.JSONDecodeError as e:
+                            logger.warning(f"  ❌ Not valid JSON: {e}")
+                    if not self._validate_qr_data(qr_data):
+                        qr_data = None
+            
+            if qr_data:
+                logger.info("  ✅ QR data found at the learned location")
+                self.template_memory.hit(fingerprint)
+                return qr_data
+            logger.info("  ❌ Learned location missed, falling back to the full search")
+            self.template_memory.miss(fingerprint)
+            return None
+            
+        except Exception as e:
+            logger.error(f"  💥 Learned location error: {e}")
+            return None
+    
+    def _learn_location(self, session, fingerprint, page_num, found):
+        """Remember where the full search found the QR (found: method, rect in points, zoom)"""
+        if not found:
+            return
+        try:
+            rect = session.page(page_num).rect
+            box = found['rect']
+            region = (box.x0 / rect.width, box.y0 / rect.height, box.x1 / rect.width, box.y1 / rect.height)
+            # The last page of a multi-page document is remembered as page -1
+            page = -1 if page_num == session.page_count - 1 and page_num > 0 else page_num
+            self.template_memory.learn(fingerprint, page, region, found['zoom'], found['method'])
+        except Exception as e:
+            logger.error(f"  💥 Could not record the QR location: {e}")
+    
+    def _try_finder_locator(self, session, page_num, found=None):
+        """Locate finder patterns on a low-resolution render and decode only those boxes"""
+        if not self.locator_zoom:
+            return None
+        try:
+            logger.info(f"🎯 Method 1a: Finder-pattern locator on page {page_num + 1}")
+            gray = session.render(page_num, self.locator_zoom, pixmap_to_gray, gray=True)
+            # Pixels per point actually rendered (the memory governor may lower the zoom)
+            zoom = gray.shape[1] / session.page(page_num).rect.width
+            candidates = qr_candidate_boxes(gray, self.locator_max_candidates)
+            gray = None
+            logger.info(f"  📋 {len(candidates)} candidate boxes")
+            
+            for (x0, y0, x1, y1), module in candidates:
+                # Candidate box back in page points, rendered at the zoom that
+                # gives locator_module_px pixels per module
+                clip = fitz.Rect(x0 / zoom, y0 / zoom, x1 / zoom, y1 / zoom)
+                clip_zoom = min(8.0, max(2.0, self.locator_module_px * zoom / module))
+                img = session.render(page_num, clip_zoom, pixmap_to_bgr, clip=clip)
+                logger.info(f"  🔍 Candidate {clip} at zoom {clip_zoom:.1f}: {img.shape}")
+                
+                data, backend = self.decoders.decode(img)
+                img = None
+                if not data:
+                    continue
+                try:
+                    qr_data = json.loads(data)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"  ❌ Not valid JSON: {e}")
+                    continue
+                if self._validate_qr_data(qr_data):
+                    logger.info(f"  ✅ QR data found ({backend}) via locator")
+                    if found is not None:
+                        found.update(method='locator', rect=clip, zoom=clip_zoom)
+                    return qr_data
+            
+            logger.info("  ❌ No QR found with the locator")
+            return None
+            
+        except Exception as e:
+            logger.error(f"  💥 Locator method error: {e}")
+            return None
+    
+    def _try_opencv_detection(self, session, page_num, found=None):
+        """Try OpenCV QR detection method (renders are cached in the session)"""
+        try:
+            # Candidate boxes first; full-page renders only if they all fail
+            result = self._try_finder_locator(session, page_num, found)
+            if result:
+                return result
+            
             logger.info(f"🔬 Method 1: OpenCV detection on page {page_num + 1}")
             
             # Convert page to image with multiple zoom levels
             for zoom in [1, 2, 3]:
                 logger.info(f"  🔍 Trying zoom level: {zoom}")
                 
-                mat = fitz.Matrix(zoom, zoom)
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                
-                # Convert to OpenCV format
-                nparr = np.frombuffer(img_data, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                # Render and convert to OpenCV format (pixmap released before decoding)
+                img = session.render(page_num, zoom, pixmap_to_bgr)
                 
                 logger.info(f"  📐 Image shape: {img.shape}")
                 
-                # Use OpenCV QR detector
-                detector = cv2.QRCodeDetector()
-                data, vertices_array, binary_qrcode = detector.detectAndDecode(img)
+                # Use the configured decoder cascade
+                data, backend = self.decoders.decode(img)
                 
                 if data:
-                    logger.info(f"  ✅ QR data found: {data[:100]}...")
+                    logger.info(f"  ✅ QR data found ({backend}): {data[:100]}...")
                     
                     # Try to parse as JSON
                     try:
@@ -163,13 +326,15 @@ class QRService:
                             logger.warning(f"  ⚠️  Missing fields: {missing}")
                         else:
                             logger.info("  ✅ All required fields present")
+                            if found is not None:
+                                found.update(method='page', rect=session.page(page_num).rect, zoom=zoom)
                             return qr_data
                             
                     except json.JSONDecodeError as e:
                         logger.warning(f"  ❌ Not valid JSON: {e}")
                         logger.info(f"  📝 Raw data: {data}")
                 
-                pix = None  # Cleanup
+                img = None  # Cleanup
             
             logger.info("  ❌ No QR found with OpenCV method")
             return None
@@ -178,7 +343,7 @@ class QRService:
             logger.error(f"  💥 OpenCV method error: {e}")
             return None
     
-    def _try_image_extraction(self, pdf_document, page, page_num):
+    def _try_image_extraction(self, pdf_document, page, page_num, large=False, found=None):
         """Try manual image extraction method"""
         try:
             logger.info(f"🖼️  Method 2: Image extraction on page {page_num + 1}")
@@ -191,6 +356,10 @@ class QRService:
                 logger.info(f"  🔍 Processing image {img_index + 1}")
                 
                 try:
+                    if large and img[2] * img[3] > self.max_image_pixels:
+                        logger.info(f"    ⏭️  Skipping {img[2]}x{img[3]} image in large document mode")
+                        continue
+                    
                     # Extract image
                     xref = img[0]
                     pix = fitz.Pixmap(pdf_document, xref)
@@ -199,19 +368,22 @@ class QRService:
                         logger.info(f"    📐 Image size: {pix.width}x{pix.height}")
                         
                         # Convert to OpenCV format
-                        img_data = pix.tobytes("png")
-                        nparr = np.frombuffer(img_data, np.uint8)
-                        img_cv = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                        img_cv = pixmap_to_bgr(pix)
+                        pix = None
                         
                         # Try QR detection
-                        detector = cv2.QRCodeDetector()
-                        data, _, _ = detector.detectAndDecode(img_cv)
+                        data, _ = self.decoders.decode(img_cv)
                         
                         if data:
                             logger.info(f"    ✅ QR found in image: {data[:50]}...")
                             try:
                                 qr_data = json.loads(data)
                                 logger.info("    ✅ Valid JSON found")
+                                rects = page.get_image_rects(xref) if found is not None else None
+                                if rects:
+                                    # Rendering the placed image at its own resolution decodes it again
+                                    found.update(method='image', rect=rects[0],
+                                                 zoom=min(8.0, max(2.0, img[2] / max(rects[0].width, 1))))
                                 return qr_data
                             except json.JSONDecodeError:
                                 logger.warning("    ❌ Not valid JSON")
@@ -229,12 +401,12 @@ class QRService:
             logger.error(f"  💥 Image extraction error: {e}")
             return None
     
-    def _try_text_extraction(self, page, page_num):
+    def _try_text_extraction(self, session, page_num):
         """Try text extraction method"""
         try:
             logger.info(f"📝 Method 3: Text extraction on page {page_num + 1}")
             
-            text = page.get_text()
+            text = session.page_text(page_num)
             logger.info(f"  📄 Text length: {len(text)} characters")
             
             if '{' in text and '}' in text:
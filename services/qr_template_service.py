@@ -0,0 +1,229 @@
+# services/qr_template_service.py - Learned QR locations per document template (SQLite, WAL mode)
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS qr_templates (
+    fingerprint TEXT PRIMARY KEY,
+    page INTEGER NOT NULL,
+    x0 REAL NOT NULL,
+    y0 REAL NOT NULL,
+    x1 REAL NOT NULL,
+    y1 REAL NOT NULL,
+    zoom REAL NOT NULL,
+    method TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    learned_at TEXT NOT NULL,
+    last_hit_at TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS qr_template_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+COUNTERS = ('lookups', 'known', 'hits', 'misses', 'learned', 'forgotten')
+
+_ADD_COUNTER = '''INSERT INTO qr_template_counters (name, value) VALUES (?, ?)
+                  ON CONFLICT(name) DO UPDATE SET value = value + excluded.value'''
+
+# Subset fonts are named ABCDEF+Name with a per-file random prefix
+_SUBSET_PREFIX = re.compile(r'^[A-Z]{6}\+')
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class QRTemplateMemory:
+    """
+    Remembers where the QR was found for each document template, so the next
+    document from the same template is decoded with one targeted render.
+
+    A template is identified by a fingerprint read without parsing any page
+    content: the first page's size and rotation, the producer and creator
+    metadata, and a layout hash of the first page's resources (font names
+    without subset prefixes, and the number of images). A hypothesis is the
+    page (negative = counted from the end), the QR box normalised to the page
+    size, the zoom it decoded at, and the method that found it.
+
+    Entries and the lookup/hit/miss counters are shared by every process
+    using db_path (the executor workers do the lookups) and survive
+    restarts; forget() without a fingerprint also resets the counters.
+    A hit resets the entry's miss count; an entry that misses max_misses
+    times in a row without the full search relearning it is forgotten.
+
+    Counters are kept in memory per process and added to the database in
+    the same transaction as the next hit/miss/learn write, or on their own
+    once counter_flush_interval seconds have passed, so an extraction costs
+    at most one write transaction. The shared totals lag by up to that
+    interval per process.
+    """
+
+    def __init__(self, db_path='data/qr_templates.db', max_misses=3, counter_flush_interval=5.0):
+        self.db_path = db_path
+        self.max_misses = max_misses
+        self.counter_flush_interval = counter_flush_interval
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, flush=True):
+        """Count in memory; flush=False when the caller's own write will carry it"""
+        with self._pending_lock:
+            self._pending[name] += 1
+            due = flush and time.monotonic() - self._last_flush >= self.counter_flush_interval
+        if due:
+            self.flush_counters()
+
+    def _take_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        return list(pending.items())
+
+    def _write(self, apply=None):
+        """Run apply(conn) and add this process's pending counters in one transaction"""
+        counters = self._take_pending()
+        if apply is None and not counters:
+            return None
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = apply(conn) if apply is not None else None
+            conn.executemany(_ADD_COUNTER, counters)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            with self._pending_lock:
+                self._pending.update(dict(counters))
+            raise
+        return result
+
+    def flush_counters(self):
+        """Write this process's pending counters now"""
+        self._write()
+
+    @staticmethod
+    def fingerprint(session):
+        """Template fingerprint of a DocumentSession (trailer, first page dictionary and resources only)"""
+        page = session.page(0)
+        metadata = session.metadata or {}
+        fonts = sorted({_SUBSET_PREFIX.sub('', font[3]) for font in page.get_fonts()})
+        layout = hashlib.sha1('|'.join(fonts + [str(len(page.get_images()))]).encode()).hexdigest()
+        rect = page.rect
+        key = '|'.join((
+            f"{round(rect.width)}x{round(rect.height)}r{page.rotation}",
+            metadata.get('producer') or '',
+            metadata.get('creator') or '',
+            layout,
+        ))
+        return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+    def lookup(self, fingerprint):
+        """Learned hypothesis for a template, or None"""
+        self._count('lookups')
+        row = self._conn().execute(
+            'SELECT * FROM qr_templates WHERE fingerprint = ?', (fingerprint,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._count('known')
+        return dict(row)
+
+    def learn(self, fingerprint, page, region, zoom, method):
+        """Record (or replace) where a template's QR was found; region is normalised (x0, y0, x1, y1)"""
+        x0, y0, x1, y1 = (round(float(v), 4) for v in region)
+        self._count('learned', flush=False)
+        self._write(lambda conn: conn.execute(
+            '''INSERT INTO qr_templates (fingerprint, page, x0, y0, x1, y1, zoom, method, learned_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(fingerprint) DO UPDATE SET
+                   page = excluded.page, x0 = excluded.x0, y0 = excluded.y0,
+                   x1 = excluded.x1, y1 = excluded.y1, zoom = excluded.zoom,
+                   method = excluded.method, misses = 0, learned_at = excluded.learned_at''',
+            (fingerprint, page, x0, y0, x1, y1, round(float(zoom), 3), method, _now())
+        ))
+        logger.info(f"🧠 Learned QR location for template {fingerprint}: page {page}, "
+                    f"{method} at zoom {zoom:.1f}")
+
+    def hit(self, fingerprint):
+        self._count('hits', flush=False)
+        self._write(lambda conn: conn.execute(
+            'UPDATE qr_templates SET hits = hits + 1, misses = 0, last_hit_at = ? WHERE fingerprint = ?',
+            (_now(), fingerprint)
+        ))
+
+    def miss(self, fingerprint):
+        """Count a failed hypothesis; forgets the entry after max_misses in a row"""
+        def apply(conn):
+            conn.execute('UPDATE qr_templates SET misses = misses + 1 WHERE fingerprint = ?', (fingerprint,))
+            forgotten = conn.execute(
+                'DELETE FROM qr_templates WHERE fingerprint = ? AND misses >= ?',
+                (fingerprint, self.max_misses)
+            ).rowcount
+            if forgotten:
+                conn.execute(_ADD_COUNTER, ('forgotten', forgotten))
+            return forgotten
+
+        self._count('misses', flush=False)
+        if self._write(apply):
+            logger.info(f"🧠 Forgot QR location for template {fingerprint}")
+
+    def forget(self, fingerprint=None):
+        """Drop one template (or all of them and the counters); returns the number of entries removed"""
+        if fingerprint is None:
+            self._take_pending()
+            conn = self._conn()
+            conn.execute('DELETE FROM qr_template_counters')
+            return conn.execute('DELETE FROM qr_templates').rowcount
+        return self._conn().execute(
+            'DELETE FROM qr_templates WHERE fingerprint = ?', (fingerprint,)
+        ).rowcount
+
+    def get_stats(self, top=10):
+        self.flush_counters()
+        conn = self._conn()
+        stats = dict.fromkeys(COUNTERS, 0)
+        stats.update(conn.execute('SELECT name, value FROM qr_template_counters').fetchall())
+        entries, total_hits = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM qr_templates'
+        ).fetchone()
+        templates = [dict(row) for row in conn.execute(
+            'SELECT * FROM qr_templates ORDER BY hits DESC LIMIT ?', (top,)
+        )]
+        return {
+            'db_path': self.db_path,
+            'max_misses': self.max_misses,
+            'templates': entries,
+            'total_hits': total_hits,
+            'counters': stats,
+            'hit_rate': round(stats['hits'] / stats['known'], 4) if stats['known'] else 0.0,
+            'top_templates': templates,
+        }
@@ -0,0 +1,156 @@
+# services/receipt_service.py - Signed verification receipts (compact JWS, checkable offline with the JWKS)
+
+import os
+import json
+import time
+import base64
+import secrets
+import threading
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.backends import default_backend
+
+RECEIPT_TYPE = 'verification-receipt+jwt'
+# Standard PS256 (salt length = digest length), so any JOSE library can check receipts
+_PSS = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH)
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64url_decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class ReceiptError(Exception):
+    """A receipt that is malformed, expired, for another file or not signed by us"""
+
+
+class ReceiptService:
+    """
+    Issues and checks verification receipts: JWS compact tokens
+    (header.claims.signature, PS256) signed with the service's private key.
+    The header carries the key id published at /.well-known/jwks.json, so
+    a holder can check a receipt offline with the public key alone.
+
+    Claims: iss, iat, exp, jti (receipt id), sub (SHA-256 of the verified
+    file's bytes), txn (transaction id), dh (signed document hash), dig
+    (digest algorithm), and the verdict: valid, integrity, signature,
+    revoked. A receipt states what verification found at iat; revocations
+    after that are only visible to the service (POST /receipts/validate).
+    """
+
+    def __init__(self, verification_service, private_key_path='keys/private_key.pem',
+                 issuer='', ttl=7 * 86400, leeway=60):
+        self.verification_service = verification_service
+        self.private_key_path = private_key_path
+        self.issuer = issuer
+        self.ttl = ttl
+        self.leeway = leeway
+        self._key_lock = threading.Lock()
+        self._private_key = None
+        self._key_mtime = None
+        self._lock = threading.Lock()
+        self.stats = {'issued': 0, 'validated': 0, 'valid': 0, 'invalid': 0,
+                      'total_issue_ms': 0.0, 'total_validate_ms': 0.0}
+
+    def _signing_key(self):
+        """Cached private key, reloaded when the key file changes"""
+        mtime = os.stat(self.private_key_path).st_mtime_ns
+        if self._private_key is None or mtime != self._key_mtime:
+            with self._key_lock:
+                if self._private_key is None or mtime != self._key_mtime:
+                    with open(self.private_key_path, 'rb') as f:
+                        self._private_key = serialization.load_pem_private_key(
+                            f.read(), password=None, backend=default_backend()
+                        )
+                    self._key_mtime = mtime
+        return self._private_key
+
+    def issue(self, file_sha256, verification, now=None):
+        """Receipt token for a /verify-document result; returns (token, claims)"""
+        start = time.perf_counter()
+        issued_at = int(now if now is not None else time.time())
+        header = {'alg': 'PS256', 'typ': RECEIPT_TYPE, 'kid': self.verification_service.key_id}
+        claims = {
+            'iss': self.issuer,
+            'iat': issued_at,
+            'exp': issued_at + self.ttl,
+            'jti': secrets.token_hex(8),
+            'sub': file_sha256,
+            'txn': verification.get('transaction_id'),
+            'dh': verification.get('original_hash'),
+            'dig': verification.get('security_details', {}).get('hash_algorithm'),
+            'valid': bool(verification.get('overall_valid')),
+            'integrity': bool(verification.get('document_integrity')),
+            'signature': bool(verification.get('signature_valid')),
+            'revoked': bool(verification.get('revoked')),
+        }
+        signing_input = '.'.join(
+            _b64url(json.dumps(part, separators=(',', ':')).encode('utf-8')) for part in (header, claims)
+        )
+        signature = self._signing_key().sign(signing_input.encode('ascii'), _PSS, hashes.SHA256())
+        with self._lock:
+            self.stats['issued'] += 1
+            self.stats['total_issue_ms'] += (time.perf_counter() - start) * 1000
+        return f"{signing_input}.{_b64url(signature)}", claims
+
+    def decode(self, token, file_sha256=None, now=None):
+        """Claims of a receipt we signed that is unexpired (and for file_sha256, if given); raises ReceiptError"""
+        try:
+            header_b64, claims_b64, signature_b64 = token.split('.')
+            header = json.loads(_b64url_decode(header_b64))
+            claims = json.loads(_b64url_decode(claims_b64))
+            signature = _b64url_decode(signature_b64)
+        except (AttributeError, ValueError):
+            raise ReceiptError('Malformed receipt')
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise ReceiptError('Malformed receipt')
+        if header.get('alg') != 'PS256' or header.get('typ') != RECEIPT_TYPE:
+            raise ReceiptError('Not a verification receipt')
+
+        public_key, key_id = self.verification_service._current_key()
+        if header.get('kid') != key_id:
+            raise ReceiptError('Receipt signed with an unknown key')
+        try:
+            public_key.verify(signature, f"{header_b64}.{claims_b64}".encode('ascii'),
+                              _PSS, hashes.SHA256())
+        except Exception:
+            raise ReceiptError('Invalid receipt signature')
+
+        now = now if now is not None else time.time()
+        if not isinstance(claims.get('exp'), int) or now > claims['exp'] + self.leeway:
+            raise ReceiptError('Receipt expired')
+        if file_sha256 and claims.get('sub') != str(file_sha256).lower():
+            raise ReceiptError('Receipt is for a different file')
+        return claims
+
+    def validate(self, token, file_sha256=None, now=None):
+        """{'valid': True, 'claims': ...} or {'valid': False, 'error': ...}; never raises"""
+        start = time.perf_counter()
+        try:
+            result = {'valid': True, 'claims': self.decode(token, file_sha256, now)}
+        except ReceiptError as e:
+            result = {'valid': False, 'error': str(e)}
+        with self._lock:
+            self.stats['validated'] += 1
+            self.stats['valid' if result['valid'] else 'invalid'] += 1
+            self.stats['total_validate_ms'] += (time.perf_counter() - start) * 1000
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        issued, validated = stats['issued'], stats['validated']
+        return {
+            'issuer': self.issuer,
+            'ttl': self.ttl,
+            'key_id': self.verification_service.key_id,
+            'issued': issued,
+            'validated': validated,
+            'valid': stats['valid'],
+            'invalid': stats['invalid'],
+            'mean_issue_ms': round(stats['total_issue_ms'] / issued, 3) if issued else 0.0,
+            'mean_validate_ms': round(stats['total_validate_ms'] / validated, 3) if validated else 0.0,
+        }
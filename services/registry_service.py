@@ -0,0 +1,156 @@
+# services/registry_service.py - Indexed registry of signed documents (SQLite, WAL mode)
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signed_documents (
+    transaction_id TEXT PRIMARY KEY,
+    document_hash TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    key_id TEXT,
+    signature_mode TEXT,
+    merkle_root TEXT,
+    merkle_proof TEXT,
+    signed_filename TEXT,
+    signed_file_path TEXT,
+    signed_file_sha256 TEXT,
+    digest_alg TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_signed_documents_hash ON signed_documents(document_hash);
+CREATE INDEX IF NOT EXISTS idx_signed_documents_file ON signed_documents(signed_filename);
+CREATE INDEX IF NOT EXISTS idx_signed_documents_file_sha256 ON signed_documents(signed_file_sha256);
+"""
+
+COLUMNS = (
+    'transaction_id', 'document_hash', 'signature', 'key_id', 'signature_mode',
+    'merkle_root', 'merkle_proof', 'signed_filename', 'signed_file_path',
+    'signed_file_sha256', 'digest_alg', 'created_at', 'updated_at',
+)
+
+# Columns added after the first release: (name, type), applied with ALTER TABLE
+MIGRATIONS = (
+    ('digest_alg', 'TEXT'),
+)
+
+
+class DocumentRegistry:
+    """
+    Records every signed document. transaction_id is the primary key (clustered,
+    WITHOUT ROWID) and document_hash has its own index, so both lookups are a
+    single B-tree descent regardless of table size. Each thread gets its own
+    connection; WAL lets readers proceed while a writer commits.
+    """
+
+    def __init__(self, db_path='data/registry.db'):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        conn = self._conn()
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(signed_documents)')}
+        for name, column_type in MIGRATIONS:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE signed_documents ADD COLUMN {name} {column_type}')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA cache_size=-65536')  # 64MB page cache
+            self._local.conn = conn
+        return conn
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        record = dict(row)
+        if record.get('merkle_proof'):
+            record['merkle_proof'] = json.loads(record['merkle_proof'])
+        return record
+
+    def get(self, transaction_id):
+        row = self._conn().execute(
+            'SELECT * FROM signed_documents WHERE transaction_id = ?',
+            (transaction_id,)
+        ).fetchone()
+        return self._to_dict(row)
+
+    def find_by_hash(self, document_hash, limit=10):
+        rows = self._conn().execute(
+            'SELECT * FROM signed_documents WHERE document_hash = ? LIMIT ?',
+            (document_hash, limit)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def find_by_signed_file_sha256(self, signed_file_sha256):
+        """Record whose issued signed PDF has this SHA-256 (verify a local copy by hash)"""
+        row = self._conn().execute(
+            'SELECT * FROM signed_documents WHERE signed_file_sha256 = ? LIMIT 1',
+            (signed_file_sha256,)
+        ).fetchone()
+        return self._to_dict(row)
+
+    def record(self, transaction_id, document_hash, signature, key_id=None,
+               signature_mode=None, merkle_root=None, merkle_proof=None,
+               signed_filename=None, signed_file_path=None, signed_file_sha256=None,
+               digest_alg=None, replaces=None):
+        """
+        Insert a signing record and return the stored one. The insert is the
+        arbiter between concurrent signings: if the transaction is already
+        registered the existing record is kept (first signing wins), and the
+        caller can tell it lost by comparing signed_filename. replaces names
+        the signed_filename of a stored record to overwrite, e.g. when its
+        signed file has gone missing and was re-issued; the update only
+        applies while that record is still the stored one.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        params = ()
+        if replaces is not None:
+            on_conflict = "DO UPDATE SET " + ', '.join(
+                f"{c} = excluded.{c}" for c in COLUMNS
+                if c not in ('transaction_id', 'created_at')
+            ) + " WHERE signed_documents.signed_filename IS ?"
+            params = (replaces,)
+        else:
+            on_conflict = "DO NOTHING"
+        self._conn().execute(
+            f"INSERT INTO signed_documents ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))}) "
+            f"ON CONFLICT(transaction_id) {on_conflict}",
+            (transaction_id, document_hash, signature, key_id, signature_mode,
+             merkle_root, json.dumps(merkle_proof) if merkle_proof is not None else None,
+             signed_filename, signed_file_path, signed_file_sha256, digest_alg, now, now, *params)
+        )
+        return self.get(transaction_id)
+
+    def iter_after(self, transaction_id='', limit=100):
+        """Next page of records in transaction_id order (keyset pagination on the primary key)"""
+        rows = self._conn().execute(
+            'SELECT * FROM signed_documents WHERE transaction_id > ? ORDER BY transaction_id LIMIT ?',
+            (transaction_id, limit)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def has_signed_filename(self, signed_filename):
+        row = self._conn().execute(
+            'SELECT 1 FROM signed_documents WHERE signed_filename = ? LIMIT 1',
+            (signed_filename,)
+        ).fetchone()
+        return row is not None
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM signed_documents').fetchone()[0]
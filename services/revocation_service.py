@@ -0,0 +1,230 @@
+# services/revocation_service.py - Revocation list with a memory-mapped Bloom filter prefilter
+
+import os
+import math
+import mmap
+import struct
+import hashlib
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+BLOOM_MAGIC = b'BLM1'
+BLOOM_HEADER = struct.Struct('<4sQI')  # magic, bit count, hash count
+
+
+class BloomFilter:
+    """
+    Bloom filter whose bit array lives in a memory-mapped file, so it survives
+    restarts and is shared by every worker mapping the same file. Readers take
+    no lock; writers only ever set bits.
+    """
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                magic, bits, hashes = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+            if magic != BLOOM_MAGIC:
+                raise ValueError(f"Not a bloom filter file: {path}")
+            self.bits, self.hashes = bits, hashes
+            self.created = False
+        else:
+            self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+            self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+            with open(path, 'wb') as f:
+                f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.bits, self.hashes))
+                f.truncate(BLOOM_HEADER.size + (self.bits + 7) // 8)
+            self.created = True
+
+        self.capacity = int(self.bits * (math.log(2) ** 2) / -math.log(error_rate))
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        self._offset = BLOOM_HEADER.size
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, key):
+        mm, offset = self._mm, self._offset
+        for pos in self._positions(key):
+            index = offset + (pos >> 3)
+            mm[index] = mm[index] | (1 << (pos & 7))
+
+    def __contains__(self, key):
+        mm, offset = self._mm, self._offset
+        for pos in self._positions(key):
+            if not mm[offset + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class RevocationService:
+    """
+    Revocations keyed by transaction_id or document hash. The exact store is
+    SQLite; every lookup first asks the Bloom filter and only queries SQLite on
+    a possible hit, so the common not-revoked case never touches the database.
+    When the filter fills past its capacity it is rebuilt at double size in a
+    background thread and swapped in; lookups keep using the old one meanwhile.
+    """
+
+    def __init__(self, db_path='data/revocations.db', bloom_path='data/revocations.bloom',
+                 capacity=1000000, error_rate=0.001):
+        self.db_path = db_path
+        self.bloom_path = bloom_path
+        self.error_rate = error_rate
+        for path in (db_path, bloom_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._rebuilding = None  # keys added while a rebuild is running
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS revocations (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                reason TEXT,
+                revoked_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.stats = {'checks': 0, 'bloom_hits': 0, 'revoked_hits': 0}
+
+        self.bloom = BloomFilter(bloom_path, capacity, error_rate)
+        # Entries in the exact store, kept up to date by revoke() (no COUNT(*) per revoke)
+        self._count = count = self.count()
+        if self.bloom.created and count:
+            self._fill(self.bloom)
+        if count > self.bloom.capacity:
+            self._start_rebuild(count * 2)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(kind, value):
+        return f"{kind}:{value}"
+
+    def _fill(self, bloom):
+        for row in self._conn().execute('SELECT key FROM revocations'):
+            bloom.add(row[0])
+        bloom.flush()
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM revocations').fetchone()[0]
+
+    def revoke(self, transaction_id=None, document_hash=None, reason=None):
+        """Revoke by transaction_id and/or document hash; returns the keys added"""
+        entries = []
+        if transaction_id:
+            entries.append(('transaction_id', transaction_id))
+        if document_hash:
+            entries.append(('document_hash', document_hash))
+        if not entries:
+            raise ValueError('transaction_id or document_hash is required')
+
+        now = datetime.now(timezone.utc).isoformat()
+        keys = []
+        conn = self._conn()
+        with self._write_lock:
+            for kind, value in entries:
+                key = self._key(kind, value)
+                # Exact store first, so a Bloom hit always finds the row
+                self._count += conn.execute(
+                    'INSERT INTO revocations (key, kind, value, reason, revoked_at) '
+                    'VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO NOTHING',
+                    (key, kind, value, reason, now)
+                ).rowcount
+                self.bloom.add(key)
+                if self._rebuilding is not None:
+                    self._rebuilding.append(key)
+                keys.append(key)
+            self.bloom.flush()
+
+        if self._rebuilding is None and self._count > self.bloom.capacity:
+            self._start_rebuild(self.bloom.capacity * 2)
+        return keys
+
+    def _start_rebuild(self, capacity):
+        with self._write_lock:
+            if self._rebuilding is not None:
+                return
+            self._rebuilding = []
+        threading.Thread(target=self._rebuild, args=(capacity,),
+                         name='bloom-rebuild', daemon=True).start()
+
+    def _rebuild(self, capacity):
+        tmp_path = f"{self.bloom_path}.rebuild"
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            bloom = BloomFilter(tmp_path, capacity, self.error_rate)
+            self._fill(bloom)
+            with self._write_lock:
+                for key in self._rebuilding:
+                    bloom.add(key)
+                bloom.flush()
+                os.replace(tmp_path, self.bloom_path)
+                bloom.path = self.bloom_path
+                old, self.bloom = self.bloom, bloom
+                self._rebuilding = None
+            logger.info(f"✅ Revocation filter rebuilt for {capacity} entries")
+            # Lookups in flight may still hold the old map; let it be garbage collected
+            del old
+        except Exception as e:
+            logger.error(f"❌ Revocation filter rebuild failed: {e}")
+            with self._write_lock:
+                self._rebuilding = None
+
+    def check(self, transaction_id=None, document_hash=None):
+        """Return the revocation record if either identifier is revoked, else None"""
+        self.stats['checks'] += 1
+        bloom = self.bloom
+        for kind, value in (('transaction_id', transaction_id), ('document_hash', document_hash)):
+            if not value:
+                continue
+            key = self._key(kind, value)
+            if key not in bloom:
+                continue
+            self.stats['bloom_hits'] += 1
+            row = self._conn().execute(
+                'SELECT kind, value, reason, revoked_at FROM revocations WHERE key = ?',
+                (key,)
+            ).fetchone()
+            if row is not None:
+                self.stats['revoked_hits'] += 1
+                return dict(row)
+        return None
+
+    def get_stats(self):
+        return {
+            'revoked': self.count(),
+            'bloom_bits': self.bloom.bits,
+            'bloom_hashes': self.bloom.hashes,
+            'bloom_capacity': self.bloom.capacity,
+            'rebuilding': self._rebuilding is not None,
+            **self.stats,
+        }
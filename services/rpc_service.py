@@ -0,0 +1,483 @@
+# services/rpc_service.py - Length-prefixed binary RPC over a Unix domain socket for co-located callers
+
+import os
+import json
+import time
+import socket
+import struct
+import threading
+import logging
+
+from services.digest_service import signing_message, normalize_digest
+
+logger = logging.getLogger(__name__)
+
+# Wire format (all integers big-endian):
+#   frame    = u32 length | body (length bytes)
+#   request  = u32 request_id | u8 opcode | fields
+#   response = u32 request_id | u8 status | fields (status != OK: str16 error)
+#   str16 / bytes16 = u16 length | utf-8 / raw bytes;  str32 = u32 length | utf-8
+#
+#   PING       ->  (nothing)                                  <- (nothing)
+#   VERIFY     ->  str16 digest_alg, str16 document_hash,     <- u8 flags, str16 revocation reason
+#                  bytes16 signature (raw, not hex),
+#                  str16 transaction_id, str32 merkle JSON
+#                  ({"merkle_root", "merkle_proof"} or "")
+#   VERIFY_QR  ->  str32 QR payload JSON (as in /verify-qr-data)  <- u8 flags, str16 revocation reason
+#   SIGN       ->  str16 digest_alg, str16 document_hash      <- bytes16 signature, str32 merkle JSON
+#
+# flags: bit 0 signature valid, bit 1 revoked. A connection carries any number of
+# requests, and a caller may pipeline: send many before reading; responses come
+# back in request order and carry the request_id.
+OP_PING = 0
+OP_VERIFY = 1
+OP_VERIFY_QR = 2
+OP_SIGN = 3
+OPCODES = {OP_PING: 'ping', OP_VERIFY: 'verify', OP_VERIFY_QR: 'verify_qr', OP_SIGN: 'sign'}
+
+STATUS_OK = 0
+STATUS_BAD_REQUEST = 1
+STATUS_ERROR = 2
+STATUS_FORBIDDEN = 3
+
+FLAG_SIGNATURE_VALID = 1
+FLAG_REVOKED = 2
+
+FRAME_HEADER = struct.Struct('!I')
+REQUEST_HEADER = struct.Struct('!IB')
+RECV_SIZE = 256 * 1024
+
+
+class RPCError(Exception):
+    """A request the server answered with a non-OK status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Reader:
+    """Sequential field decoder over one frame body"""
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def _take(self, n):
+        end = self.offset + n
+        if end > len(self.data):
+            raise ValueError('Truncated frame')
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def u8(self):
+        return self._take(1)[0]
+
+    def bytes16(self):
+        return bytes(self._take(struct.unpack('!H', self._take(2))[0]))
+
+    def str16(self):
+        return self.bytes16().decode('utf-8')
+
+    def str32(self):
+        return bytes(self._take(struct.unpack('!I', self._take(4))[0])).decode('utf-8')
+
+
+def _bytes16(value):
+    if len(value) > 0xFFFF:
+        raise ValueError('Field too long')
+    return struct.pack('!H', len(value)) + value
+
+
+def _str16(value):
+    return _bytes16((value or '').encode('utf-8'))
+
+
+def _str32(value):
+    data = (value or '').encode('utf-8')
+    return struct.pack('!I', len(data)) + data
+
+
+def _frame(request_id, code, body=b''):
+    payload = REQUEST_HEADER.pack(request_id, code) + body
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def encode_request(request_id, opcode, *fields):
+    """One request frame; fields as documented for the opcode"""
+    if opcode == OP_PING:
+        body = b''
+    elif opcode == OP_VERIFY:
+        digest_alg, document_hash, signature, transaction_id, merkle = fields
+        body = (_str16(digest_alg) + _str16(document_hash) + _bytes16(signature)
+                + _str16(transaction_id) + _str32(json.dumps(merkle) if merkle else ''))
+    elif opcode == OP_VERIFY_QR:
+        body = _str32(fields[0])
+    elif opcode == OP_SIGN:
+        digest_alg, document_hash = fields
+        body = _str16(digest_alg) + _str16(document_hash)
+    else:
+        raise ValueError(f"Unknown opcode: {opcode}")
+    return _frame(request_id, opcode, body)
+
+
+def split_frames(buffer):
+    """Complete frame bodies at the front of buffer, and how many bytes they used"""
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        (length,) = FRAME_HEADER.unpack_from(buffer, offset)
+        end = offset + FRAME_HEADER.size + length
+        if end > len(buffer):
+            break
+        frames.append(bytes(buffer[offset + FRAME_HEADER.size:end]))
+        offset = end
+    return frames, offset
+
+
+class RPCServer:
+    """
+    Binary RPC listener on a Unix domain socket, serving verify, QR-payload
+    verify and (optionally) hash signing with the service objects of the
+    Flask app. Access control is the socket file's mode (default 0660).
+
+    Each connection has its own thread and is kept open for any number of
+    requests. Everything received in one read is handled as a batch: with a
+    pool, the batch runs concurrently (so pipelined batch-signing requests
+    land in the same Merkle window), and all responses go back in request
+    order in a single send.
+
+    sign(message) -> (signature bytes, extra fields dict) and
+    audit(event, **fields) are supplied by the app; sign=None answers SIGN
+    requests with STATUS_FORBIDDEN.
+    """
+
+    def __init__(self, socket_path, verification_service, revocation_service, sign=None,
+                 audit=None, pool=None, mode=0o660, max_frame=1024 * 1024,
+                 max_connections=64):
+        self.socket_path = socket_path
+        self.verification_service = verification_service
+        self.revocation_service = revocation_service
+        self.sign = sign
+        self.audit = audit
+        self.pool = pool
+        self.mode = mode
+        self.max_frame = max_frame
+        self.max_connections = max_connections
+        self._sock = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self.stats = {'connections': 0, 'requests': 0, 'errors': 0, 'reads': 0,
+                      'rejected_connections': 0, 'protocol_errors': 0,
+                      **{name: 0 for name in OPCODES.values()}}
+
+    # --- request handling -------------------------------------------------------
+
+    def _verify(self, payload):
+        valid = self.verification_service.verify_payload(payload)
+        revocation = self.revocation_service.check(payload.get('transaction_id'),
+                                                   payload.get('document_hash'))
+        flags = (FLAG_SIGNATURE_VALID if valid else 0) | (FLAG_REVOKED if revocation else 0)
+        return valid, revocation, bytes([flags]) + _str16(revocation['reason'] if revocation else '')
+
+    def _handle(self, body, client):
+        """Response frame for one request frame body"""
+        request_id = 0
+        try:
+            request_id, opcode = REQUEST_HEADER.unpack_from(body)
+            reader = _Reader(body, REQUEST_HEADER.size)
+            with self._lock:
+                self.stats['requests'] += 1
+                if opcode in OPCODES:
+                    self.stats[OPCODES[opcode]] += 1
+
+            if opcode == OP_PING:
+                return _frame(request_id, STATUS_OK)
+
+            if opcode == OP_VERIFY:
+                payload = {
+                    'digest_alg': reader.str16() or None,
+                    'document_hash': reader.str16(),
+                    'signature': reader.bytes16(),
+                    'transaction_id': reader.str16() or None,
+                }
+                merkle = reader.str32()
+                if merkle:
+                    payload.update(json.loads(merkle))
+                if not payload['document_hash'] or not payload['signature']:
+                    return _frame(request_id, STATUS_BAD_REQUEST,
+                                  _str16('Missing document_hash or signature'))
+                _, _, response = self._verify(payload)
+                return _frame(request_id, STATUS_OK, response)
+
+            if opcode == OP_VERIFY_QR:
+                try:
+                    payload = json.loads(reader.str32())
+                except json.JSONDecodeError:
+                    return _frame(request_id, STATUS_BAD_REQUEST,
+                                  _str16('Invalid QR code data format'))
+                if not payload.get('document_hash') or not payload.get('signature'):
+                    return _frame(request_id, STATUS_BAD_REQUEST,
+                                  _str16('Invalid QR code data - missing hash or signature'))
+                valid, revocation, response = self._verify(payload)
+                if self.audit is not None:
+                    self.audit('verify', transaction_id=payload.get('transaction_id'),
+                               source='rpc-qr-data', document_hash=payload['document_hash'],
+                               overall_valid=valid and not revocation, signature_valid=valid,
+                               revoked=revocation is not None, client=client)
+                return _frame(request_id, STATUS_OK, response)
+
+            if opcode == OP_SIGN:
+                if self.sign is None:
+                    return _frame(request_id, STATUS_FORBIDDEN,
+                                  _str16('Signing is not enabled on this socket'))
+                digest_alg = normalize_digest(reader.str16() or None)
+                document_hash = reader.str16()
+                try:
+                    int(document_hash, 16)
+                except ValueError:
+                    return _frame(request_id, STATUS_BAD_REQUEST,
+                                  _str16('document_hash must be hex'))
+                signature, extra = self.sign(signing_message(document_hash, digest_alg))
+                if self.audit is not None:
+                    self.audit('sign', document_hash=document_hash, digest_alg=digest_alg,
+                               signature_mode=extra.get('signature_mode'), via='rpc',
+                               client=client)
+                return _frame(request_id, STATUS_OK,
+                              _bytes16(signature) + _str32(json.dumps(extra) if extra else ''))
+
+            return _frame(request_id, STATUS_BAD_REQUEST, _str16(f"Unknown opcode: {opcode}"))
+
+        except (ValueError, struct.error) as e:
+            with self._lock:
+                self.stats['errors'] += 1
+            return _frame(request_id, STATUS_BAD_REQUEST, _str16(str(e)))
+        except Exception as e:
+            logger.error(f"RPC request failed: {str(e)}")
+            with self._lock:
+                self.stats['errors'] += 1
+            return _frame(request_id, STATUS_ERROR, _str16(str(e)))
+
+    def _handle_batch(self, frames, client):
+        if self.pool is None or len(frames) == 1:
+            return b''.join(self._handle(body, client) for body in frames)
+        futures = [self.pool.submit(self._handle, body, client) for body in frames]
+        return b''.join(future.result() for future in futures)
+
+    # --- connections ------------------------------------------------------------
+
+    def _peer(self, conn):
+        """uid/pid of the connecting process, for the audit log"""
+        try:
+            pid, uid, _ = struct.unpack('3i', conn.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+            return f"unix:pid={pid},uid={uid}"
+        except (AttributeError, OSError):
+            return 'unix'
+
+    def _serve_connection(self, conn):
+        client = self._peer(conn)
+        buffer = bytearray()
+        try:
+            while not self._stop.is_set():
+                chunk = conn.recv(RECV_SIZE)
+                if not chunk:
+                    break
+                buffer += chunk
+                if len(buffer) >= FRAME_HEADER.size:
+                    (length,) = FRAME_HEADER.unpack_from(buffer)
+                    if length > self.max_frame or length < REQUEST_HEADER.size:
+                        with self._lock:
+                            self.stats['protocol_errors'] += 1
+                        logger.warning(f"⚠️  RPC frame of {length} bytes from {client}, closing")
+                        break
+                frames, used = split_frames(buffer)
+                if not frames:
+                    continue
+                del buffer[:used]
+                with self._lock:
+                    self.stats['reads'] += 1
+                conn.sendall(self._handle_batch(frames, client))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            with self._lock:
+                if len(self._connections) >= self.max_connections:
+                    self.stats['rejected_connections'] += 1
+                    conn.close()
+                    continue
+                self._connections.add(conn)
+                self.stats['connections'] += 1
+            threading.Thread(target=self._serve_connection, args=(conn,),
+                             name='rpc-conn', daemon=True).start()
+
+    def _in_use(self):
+        """True if another live listener already owns socket_path"""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if os.path.exists(self.socket_path):
+            if self._in_use():
+                logger.warning(f"⚠️  RPC socket {self.socket_path} is served by another process")
+                return
+            os.unlink(self.socket_path)  # stale socket of a dead process
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.socket_path)
+        os.chmod(self.socket_path, self.mode)
+        self._sock.listen(128)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._accept_loop, name='rpc-accept', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ RPC listener on {self.socket_path}")
+
+    def stop(self):
+        self._stop.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'socket_path': self.socket_path,
+                'listening': self._thread is not None,
+                'sign_enabled': self.sign is not None,
+                'open_connections': len(self._connections),
+                **self.stats,
+            }
+
+
+class RPCClient:
+    """
+    Reference client: one persistent connection, calls either one at a time
+    or pipelined via call_many.
+    """
+
+    def __init__(self, socket_path, timeout=30):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self._next_id = 0
+        self._buffer = bytearray()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_frames(self, count):
+        frames = []
+        while len(frames) < count:
+            found, used = split_frames(self._buffer)
+            if found:
+                del self._buffer[:used]
+                frames.extend(found)
+                continue
+            chunk = self.sock.recv(RECV_SIZE)
+            if not chunk:
+                raise ConnectionError('RPC connection closed')
+            self._buffer += chunk
+        return frames
+
+    @staticmethod
+    def _decode(opcode, body):
+        request_id, status = REQUEST_HEADER.unpack_from(body)
+        reader = _Reader(body, REQUEST_HEADER.size)
+        if status != STATUS_OK:
+            raise RPCError(status, reader.str16())
+        if opcode == OP_PING:
+            return None
+        if opcode in (OP_VERIFY, OP_VERIFY_QR):
+            flags = reader.u8()
+            return {
+                'signature_valid': bool(flags & FLAG_SIGNATURE_VALID),
+                'revoked': bool(flags & FLAG_REVOKED),
+                'revocation_reason': reader.str16() or None,
+            }
+        signature = reader.bytes16()
+        merkle = reader.str32()
+        return {'signature': signature, **(json.loads(merkle) if merkle else {})}
+
+    def call_many(self, calls):
+        """
+        Pipeline [(opcode, *fields), ...] in one write and return the results
+        in order; a failed call's slot holds its RPCError.
+        """
+        frames = []
+        for opcode, *fields in calls:
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            frames.append(encode_request(self._next_id, opcode, *fields))
+        self.sock.sendall(b''.join(frames))
+        results = []
+        for (opcode, *_), body in zip(calls, self._read_frames(len(calls))):
+            try:
+                results.append(self._decode(opcode, body))
+            except RPCError as e:
+                results.append(e)
+        return results
+
+    def call(self, opcode, *fields):
+        result = self.call_many([(opcode, *fields)])[0]
+        if isinstance(result, RPCError):
+            raise result
+        return result
+
+    def ping(self):
+        start = time.perf_counter()
+        self.call(OP_PING)
+        return (time.perf_counter() - start) * 1000
+
+    def verify(self, document_hash, signature, digest_alg=None, transaction_id=None, merkle=None):
+        """signature as raw bytes; merkle = {'merkle_root', 'merkle_proof'} for batch-signed documents"""
+        return self.call(OP_VERIFY, digest_alg, document_hash, signature, transaction_id, merkle)
+
+    def verify_qr(self, qr_data):
+        return self.call(OP_VERIFY_QR, qr_data)
+
+    def sign(self, document_hash, digest_alg=None):
+        return self.call(OP_SIGN, digest_alg, document_hash)
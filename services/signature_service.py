@@ -1,14 +1,63 @@
 import os
 import hashlib
-import fitz  # PyMuPDF
+from services.digest_service import LEGACY_DIGEST, file_digest, new_hasher, normalize_digest
+from services.document_session import DocumentSession
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.backends import default_backend
 
+class NormalizedTextHasher:
+    """
+    Hashes text pieces as if they were concatenated and normalized with
+    ' '.join(text.split()), without ever holding the whole text in memory.
+    """
+
+    def __init__(self, hash_obj=None, preview_length=100):
+        self.hash_obj = hash_obj or hashlib.sha256()
+        self.preview_length = preview_length
+        self.preview = ''
+        self._pending = ''   # token that may continue in the next piece
+        self._started = False
+
+    def _emit(self, token):
+        out = f" {token}" if self._started else token
+        self._started = True
+        if len(self.preview) < self.preview_length:
+            self.preview = (self.preview + out)[:self.preview_length]
+        self.hash_obj.update(out.encode('utf-8'))
+
+    def feed(self, piece):
+        if not piece:
+            return
+        if piece[0].isspace() and self._pending:
+            self._emit(self._pending)
+            self._pending = ''
+        tokens = piece.split()
+        if not tokens:
+            return
+        tokens[0] = self._pending + tokens[0]
+        self._pending = ''
+        for token in tokens[:-1]:
+            self._emit(token)
+        if piece[-1].isspace():
+            self._emit(tokens[-1])
+        else:
+            self._pending = tokens[-1]
+
+    def hexdigest(self):
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = ''
+        return self.hash_obj.hexdigest()
+
 class SignatureService:
-    def __init__(self):
+    def __init__(self, large_document_bytes=64 * 1024 * 1024, digest_alg=LEGACY_DIGEST):
         self.private_key_path = 'keys/private_key.pem'
         self.public_key_path = 'keys/public_key.pem'
+        # Above this size, MuPDF's resource store is shrunk after every page
+        self.large_document_bytes = large_document_bytes
+        # Default digest for new signatures (see services/digest_service.py)
+        self.digest_alg = normalize_digest(digest_alg)
         
     def generate_keys(self):
         """Generate RSA key pair"""
@@ -54,116 +103,73 @@ class SignatureService:
             )
         return private_key
     
-    def _extract_document_content(self, file_path):
+    def _session(self, source):
+        return DocumentSession.use(source, large_document_bytes=self.large_document_bytes)
+
+    def _feed_document_content(self, source, hasher):
         """
-        🔧 CORE FIX: Extract consistent document content for hashing
-        This method ensures the same content is used for both signing and verification
+        Stream the signed content - PAGES:<n>TITLE:<title>AUTHOR:<author>CONTENT:
+        then PAGE_<i>:<text> per page - into a NormalizedTextHasher (which
+        collapses whitespace), one page at a time, releasing each page eagerly
+        (large documents). source is a path or a DocumentSession.
         """
-        try:
-            doc = fitz.open(file_path)
-            document_content = {
-                'text_content': '',
-                'metadata': {},
-                'page_count': len(doc)
-            }
-            
-            # Extract metadata
-            document_content['metadata'] = doc.metadata
-            
-            # Extract text content from all pages
-            all_text = ""
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                page_text = page.get_text()
-                all_text += f"PAGE_{page_num}:{page_text}"
-            
-            document_content['text_content'] = all_text
-            doc.close()
-            
-            # Create a deterministic string representation
-            content_string = f"PAGES:{document_content['page_count']}"
-            content_string += f"TITLE:{document_content['metadata'].get('title', '')}"
-            content_string += f"AUTHOR:{document_content['metadata'].get('author', '')}"
-            content_string += f"CONTENT:{document_content['text_content']}"
-            
-            # Normalize whitespace and encoding
-            normalized_content = ' '.join(content_string.split())
-            
-            return normalized_content
-            
-        except Exception as e:
-            print(f"❌ Error extracting document content: {str(e)}")
-            # Fallback to simple text extraction
-            return self._simple_text_extraction(file_path)
+        with self._session(source) as session:
+            metadata = session.metadata
+            hasher.feed(f"PAGES:{session.page_count}")
+            hasher.feed(f"TITLE:{metadata.get('title', '')}")
+            hasher.feed(f"AUTHOR:{metadata.get('author', '')}")
+            hasher.feed("CONTENT:")
+            for page_num in range(session.page_count):
+                hasher.feed(f"PAGE_{page_num}:")
+                hasher.feed(session.page_text(page_num))
+                if session.large:
+                    session.release_page(page_num)
     
-    def _simple_text_extraction(self, file_path):
+    def _simple_text_extraction(self, source):
         """Simple fallback text extraction"""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
+            with self._session(source) as session:
+                text = "".join(session.page_text(n) for n in range(session.page_count))
             return ' '.join(text.split())
         except:
-            return f"FALLBACK_HASH_{os.path.basename(file_path)}"
+            path = source.path if isinstance(source, DocumentSession) else source
+            return f"FALLBACK_HASH_{os.path.basename(path)}"
     
-    def generate_document_hash(self, file_path):
+    def generate_document_hash(self, file_path, digest_alg=None):
         """
         🔧 UPDATED: Generate hash from document content (for signing)
-        Now uses content-based hashing instead of binary file hashing
+        Now uses content-based hashing instead of binary file hashing.
+        file_path may also be a DocumentSession shared with other stages.
         """
+        digest_alg = normalize_digest(digest_alg or self.digest_alg)
         try:
-            # Extract document content consistently
-            content = self._extract_document_content(file_path)
-            
-            # Generate hash from content
-            sha256_hash = hashlib.sha256()
-            sha256_hash.update(content.encode('utf-8'))
-            
-            hash_result = sha256_hash.hexdigest()
+            # Hash document content page by page, never holding the whole text
+            hasher = NormalizedTextHasher(new_hasher(digest_alg))
+            try:
+                self._feed_document_content(file_path, hasher)
+            except Exception as e:
+                print(f"❌ Error extracting document content: {str(e)}")
+                hasher = NormalizedTextHasher(new_hasher(digest_alg))
+                hasher.feed(self._simple_text_extraction(file_path))
+            
+            hash_result = hasher.hexdigest()
             print(f"📝 Document hash (signing): {hash_result[:16]}...")
-            print(f"📄 Content preview: {content[:100]}...")
+            print(f"📄 Content preview: {hasher.preview}...")
             
             return hash_result
             
         except Exception as e:
             print(f"❌ Error generating document hash: {str(e)}")
             # Fallback to binary hash (old method)
-            return self._binary_file_hash(file_path)
+            return self._binary_file_hash(file_path, digest_alg)
     
-    # def generate_document_hash_for_verification(self, file_path):
-    #     """
-    #     🔧 FIXED: Generate hash for verification using the SAME method as signing
-    #     This ensures consistency between signing and verification
-    #     """
-    #     try:
-    #         # Use the exact same method as signing
-    #         content = self._extract_document_content(file_path)
-            
-    #         # Generate hash from content
-    #         sha256_hash = hashlib.sha256()
-    #         sha256_hash.update(content.encode('utf-8'))
-            
-    #         hash_result = sha256_hash.hexdigest()
-    #         print(f"🔍 Verification hash: {hash_result[:16]}...")
-    #         print(f"📄 Content preview: {content[:100]}...")
-            
-    #         return hash_result
-            
-    #     except Exception as e:
-    #         print(f"❌ Error generating verification hash: {str(e)}")
-    #         # Use same fallback as signing method
-    #         return self._binary_file_hash(file_path)
-
-    def generate_document_hash_for_verification(self, file_path):
+    def generate_document_hash_for_verification(self, file_path, digest_alg=None):
         """
-        Generate SHA-256 hash based on full binary content of the PDF file.
+        Generate hash based on full binary content of the PDF file, with the
+        digest named in the QR payload (SHA-256 for legacy documents).
         """
         try:
-            with open(file_path, 'rb') as f:
-                file_bytes = f.read()
-            hash_result = hashlib.sha256(file_bytes).hexdigest()
+            hash_result = self._binary_file_hash(file_path, digest_alg)
             print(f"✅ Binary verification hash: {hash_result[:16]}...")
             return hash_result
         except Exception as e:
@@ -171,13 +177,11 @@ class SignatureService:
             return ''
 
     
-    def _binary_file_hash(self, file_path):
-        """Original binary file hashing method (fallback)"""
-        sha256_hash = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(chunk)
-        return sha256_hash.hexdigest()
+    def _binary_file_hash(self, file_path, digest_alg=LEGACY_DIGEST):
+        """Digest of the raw file, read in large aligned chunks (bounded memory)"""
+        if isinstance(file_path, DocumentSession):
+            return file_path.file_digest(digest_alg)
+        return file_digest(file_path, digest_alg)
     
     def sign_document(self, document_hash):
         """Create digital signature for document hash"""
@@ -0,0 +1,316 @@
+# services/upload_session_service.py - Resumable chunked uploads with a running SHA-256
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import secrets
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_READ_SIZE = 1024 * 1024  # 1MB
+
+
+class UploadNotFound(KeyError):
+    """Unknown, expired or already consumed upload session"""
+
+
+class UploadTooLarge(ValueError):
+    """The upload would exceed the service's max_bytes"""
+
+
+class UploadOffsetMismatch(Exception):
+    """A chunk was sent for an offset other than the session's current one"""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadSession:
+    def __init__(self, upload_id, filename, path, total_size=None, created=None,
+                 expires_at=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.path = path
+        self.total_size = total_size
+        self.created = created or time.time()
+        self.expires_at = expires_at
+        self.offset = 0
+        self.sha256 = None  # hex digest once finalized
+        self.lock = threading.Lock()
+        self._hasher = None
+
+    def hasher(self):
+        """Running SHA-256; after a restart it is rebuilt once from the partial file"""
+        if self._hasher is None:
+            self._hasher = hashlib.sha256()
+            if self.offset:
+                with open(self.path, 'rb') as f:
+                    while True:
+                        chunk = f.read(CHUNK_READ_SIZE)
+                        if not chunk:
+                            break
+                        self._hasher.update(chunk)
+        return self._hasher
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'offset': self.offset,
+            'total_size': self.total_size,
+            'complete': self.sha256 is not None,
+            'sha256': self.sha256,
+            'expires_at': self.expires_at,
+        }
+
+
+class UploadSessionService:
+    """
+    Upload sessions: create, append chunks at the current offset, query the
+    offset, finalize. Bytes go straight to a part file and through a running
+    SHA-256, so finalizing never re-reads the file. Each session has a small
+    JSON sidecar, so it can be resumed after a restart (offset = part file
+    size). Sessions idle for longer than ttl seconds are deleted by a
+    background reaper, started with start() by the process that serves the
+    uploads; before deleting, it re-reads the session's sidecar and part
+    file, so a session another process kept alive is never removed.
+
+    A finished upload is handed to sign/verify with link(), which leaves the
+    session in place; the caller drops it with release() once it succeeded,
+    so a request that fails transiently can be repeated with the same
+    upload_id. No session grows past max_bytes, declared total_size or not.
+    """
+
+    def __init__(self, directory='uploads/sessions', ttl=86400, reap_interval=300,
+                 max_bytes=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.reap_interval = reap_interval
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'completed': 0, 'consumed': 0, 'expired': 0,
+                      'bytes_received': 0}
+        self._reaper = None
+        self._load()
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _save_meta(self, session):
+        with open(self._meta_path(session.upload_id), 'w') as f:
+            json.dump({
+                'filename': session.filename,
+                'total_size': session.total_size,
+                'created': session.created,
+                'expires_at': session.expires_at,
+                'sha256': session.sha256,
+            }, f)
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-5]
+            try:
+                with open(self._meta_path(upload_id)) as f:
+                    meta = json.load(f)
+                session = UploadSession(upload_id, meta['filename'], self._part_path(upload_id),
+                                        meta.get('total_size'), meta.get('created'),
+                                        meta.get('expires_at'))
+                session.offset = os.path.getsize(session.path)
+                session.sha256 = meta.get('sha256')
+                self._sessions[upload_id] = session
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️  Dropping unreadable upload session {upload_id}: {e}")
+                self._remove_files(upload_id)
+        if self._sessions:
+            logger.info(f"✅ Resumed {len(self._sessions)} upload sessions")
+
+    def _remove_files(self, upload_id):
+        for path in (self._meta_path(upload_id), self._part_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, session):
+        session.expires_at = time.time() + self.ttl
+
+    def create(self, filename, total_size=None):
+        filename = os.path.basename(filename or '') or 'upload.pdf'
+        if total_size is not None and total_size < 0:
+            raise ValueError('total_size must not be negative')
+        if total_size is not None and self.max_bytes is not None and total_size > self.max_bytes:
+            raise UploadTooLarge('Upload exceeds the maximum document size')
+        upload_id = secrets.token_urlsafe(16)
+        session = UploadSession(upload_id, filename, self._part_path(upload_id), total_size)
+        self._touch(session)
+        open(session.path, 'wb').close()
+        self._save_meta(session)
+        with self._lock:
+            self._sessions[upload_id] = session
+            self.stats['created'] += 1
+        return session
+
+    def get(self, upload_id):
+        session = self._sessions.get(upload_id)
+        if session is None or session.expires_at < time.time():
+            raise UploadNotFound(upload_id)
+        return session
+
+    def append(self, upload_id, offset, stream):
+        """Write a chunk read from stream at offset; returns the new offset"""
+        session = self.get(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadOffsetMismatch(session.offset)  # another chunk is in flight
+        try:
+            if session.sha256 is not None:
+                raise ValueError('Upload is already finalized')
+            if offset != session.offset:
+                raise UploadOffsetMismatch(session.offset)
+            hasher = session.hasher()
+            with open(session.path, 'ab') as f:
+                # Progress is kept per piece, so a dropped connection resumes where it stopped
+                while True:
+                    chunk = stream.read(CHUNK_READ_SIZE)
+                    if not chunk:
+                        break
+                    if session.total_size is not None and session.offset + len(chunk) > session.total_size:
+                        raise ValueError('Chunk exceeds the declared total_size')
+                    if self.max_bytes is not None and session.offset + len(chunk) > self.max_bytes:
+                        raise UploadTooLarge('Upload exceeds the maximum document size')
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    session.offset += len(chunk)
+                    with self._lock:
+                        self.stats['bytes_received'] += len(chunk)
+            self._touch(session)
+            self._save_meta(session)
+            return session.offset
+        finally:
+            session.lock.release()
+
+    def finalize(self, upload_id, expected_sha256=None):
+        session = self.get(upload_id)
+        with session.lock:
+            if session.sha256 is None:
+                if session.total_size is not None and session.offset != session.total_size:
+                    raise ValueError(f"Upload incomplete: {session.offset} of {session.total_size} bytes")
+                digest = session.hasher().hexdigest()
+                if expected_sha256 and expected_sha256.lower() != digest:
+                    raise ValueError('Uploaded content does not match the expected sha256')
+                session.sha256 = digest
+                session._hasher = None
+                self._touch(session)
+                self._save_meta(session)
+                with self._lock:
+                    self.stats['completed'] += 1
+            elif expected_sha256 and expected_sha256.lower() != session.sha256:
+                raise ValueError('Uploaded content does not match the expected sha256')
+        return session
+
+    def link(self, upload_id, dest_path):
+        """
+        Finalize if needed and make the upload available at dest_path (a hard
+        link, or a copy across filesystems); returns (filename, sha256). The
+        session stays until release(). A finalized part file is never written
+        again, so the link keeps its content even once the session is gone.
+        """
+        session = self.finalize(upload_id)
+        with session.lock:
+            self._touch(session)  # don't reap it while the caller is working
+            self._save_meta(session)
+        try:
+            os.link(session.path, dest_path)
+        except OSError:
+            shutil.copyfile(session.path, dest_path)
+        return session.filename, session.sha256
+
+    def release(self, upload_id):
+        """Drop a session whose upload was used successfully; a no-op if it is already gone"""
+        with self._lock:
+            if self._sessions.pop(upload_id, None) is None:
+                return False
+            self.stats['consumed'] += 1
+        self._remove_files(upload_id)
+        return True
+
+    def delete(self, upload_id):
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is None:
+            raise UploadNotFound(upload_id)
+        self._remove_files(upload_id)
+
+    def _expires_on_disk(self, upload_id):
+        """Expiry from the sidecar and the part file's last write; None if the session is gone"""
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                expires_at = json.load(f).get('expires_at') or 0
+            part_mtime = os.path.getmtime(self._part_path(upload_id))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Could not re-read upload session {upload_id}: {e}")
+            return float('inf')
+        return max(expires_at, part_mtime + self.ttl)
+
+    def reap(self):
+        now = time.time()
+        with self._lock:
+            candidates = [uid for uid, s in self._sessions.items() if s.expires_at < now]
+        expired = []
+        for upload_id in candidates:
+            expires_at = self._expires_on_disk(upload_id)
+            with self._lock:
+                session = self._sessions.get(upload_id)
+                if session is None:
+                    continue
+                if expires_at is not None and expires_at >= now:
+                    session.expires_at = expires_at  # kept alive elsewhere
+                    continue
+                del self._sessions[upload_id]
+            if expires_at is not None:  # None: consumed or deleted by another process
+                self._remove_files(upload_id)
+                expired.append(upload_id)
+        if expired:
+            with self._lock:
+                self.stats['expired'] += len(expired)
+            logger.info(f"🧹 Reclaimed {len(expired)} expired upload sessions")
+        return len(expired)
+
+    def start(self):
+        """Start the background reaper; only the process serving the uploads should call this"""
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name='upload-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"❌ Upload session reaper failed: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            stats = dict(self.stats)
+        return {
+            'active': len(sessions),
+            'bytes_pending': sum(s.offset for s in sessions),
+            'ttl': self.ttl,
+            'max_bytes': self.max_bytes,
+            **stats,
+        }
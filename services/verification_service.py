@@ -1,11 +1,120 @@
+import os
+import json
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.backends import default_backend
+from services.batch_signing_service import (
+    SIGNATURE_MODE_MERKLE, merkle_root_from_proof, merkle_signing_message
+)
+from services.digest_service import LEGACY_DIGEST, signing_message
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64url_int(value):
+    return _b64url(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+def encode_verification_fragment(payload, key_id=None):
+    """
+    Verification URL fragment (#...) for a QR payload; the fragment itself
+    never reaches the server. A registered document (one with a transaction_id)
+    gets only a reference, r=<transaction_id>: the QR already holds the full
+    payload, so repeating it in the URL would double the code. /verify looks
+    the record up and checks its signature in the browser. Without a
+    transaction_id there is nothing to look up and the fragment carries the
+    compact signed fields.
+    """
+    if payload.get('transaction_id'):
+        return 'r=' + quote(payload['transaction_id'], safe='')
+    compact = {
+        'v': 1,
+        't': payload.get('transaction_id'),
+        'h': payload.get('document_hash'),
+        's': _b64url(bytes.fromhex(payload['signature'])),
+        'd': payload.get('timestamp'),
+    }
+    if payload.get('digest_alg', LEGACY_DIGEST) != LEGACY_DIGEST:
+        compact['a'] = payload['digest_alg']
+    if key_id:
+        compact['k'] = key_id
+    if payload.get('merkle_root'):
+        compact['m'] = payload['merkle_root']
+        compact['p'] = payload.get('merkle_proof') or []
+    return _b64url(json.dumps(compact, separators=(',', ':')).encode('utf-8'))
+
+
+def build_qr_payload(transaction_id, document_hash, digest_alg, signature_hex, timestamp,
+                     batch_fields=None, key_id=None, base_url=''):
+    """QR payload for a signed document, including its verification URL"""
+    qr_data = {
+        'transaction_id': transaction_id,
+        'document_hash': document_hash,
+        'digest_alg': digest_alg,
+        'signature': signature_hex,
+        'timestamp': timestamp,
+    }
+    qr_data.update(batch_fields or {})
+    # The fragment lets /verify check the signature in the browser
+    fragment = encode_verification_fragment(qr_data, key_id)
+    qr_data['verification_url'] = f"{base_url}/verify#{fragment}"
+    return qr_data
+
+
+class VerificationMemo:
+    """Thread-safe LRU of verification verdicts keyed by (hash, signature, key id, ...)"""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
 
 class VerificationService:
-    def __init__(self):
+    def __init__(self, memo_size=100000):
         self.public_key_path = 'keys/public_key.pem'
-    
+        self.memo = VerificationMemo(memo_size)
+        self._key_lock = threading.Lock()
+        self._public_key = None
+        self._key_id = None
+        self._key_mtime = None
+
     def load_public_key(self):
         """Load public key from file"""
         with open(self.public_key_path, 'rb') as f:
@@ -14,27 +123,103 @@ class VerificationService:
                 backend=default_backend()
             )
         return public_key
-    
-    def verify_signature(self, document_hash, signature):
-        """Verify digital signature"""
+
+    def _current_key(self):
+        """Cached public key and its key id, reloaded when the key file changes"""
+        mtime = os.stat(self.public_key_path).st_mtime_ns
+        if self._public_key is None or mtime != self._key_mtime:
+            with self._key_lock:
+                if self._public_key is None or mtime != self._key_mtime:
+                    public_key = self.load_public_key()
+                    der = public_key.public_bytes(
+                        encoding=serialization.Encoding.DER,
+                        format=serialization.PublicFormat.SubjectPublicKeyInfo
+                    )
+                    self._key_id = hashlib.sha256(der).hexdigest()[:16]
+                    self._public_key = public_key
+                    self._key_mtime = mtime
+        return self._public_key, self._key_id
+
+    @property
+    def key_id(self):
+        return self._current_key()[1]
+
+    def get_jwks(self):
+        """Public key as a JWK Set plus a strong ETag derived from the key"""
+        public_key, key_id = self._current_key()
+        numbers = public_key.public_numbers()
+        jwks = {
+            'keys': [{
+                'kty': 'RSA',
+                'kid': key_id,
+                'use': 'sig',
+                'alg': 'PS256',
+                'n': _b64url_int(numbers.n),
+                'e': _b64url_int(numbers.e),
+            }]
+        }
+        return jwks, f'"{key_id}"'
+
+    def verify_signature(self, document_hash, signature, memo=True):
+        """Verify digital signature (memo=False: neither read nor fill the verdict memo)"""
         try:
-            public_key = self.load_public_key()
-            
+            public_key, key_id = self._current_key()
+
+            memo_key = ('single', document_hash, bytes(signature), key_id)
+            cached = self.memo.get(memo_key) if memo else None
+            if cached is not None:
+                return cached
+
             # Convert hash to bytes
             hash_bytes = document_hash.encode('utf-8')
-            
+
             # Verify signature
-            public_key.verify(
+            try:
+                public_key.verify(
+                    signature,
+                    hash_bytes,
+                    padding.PSS(
+                        mgf=padding.MGF1(hashes.SHA256()),
+                        salt_length=padding.PSS.MAX_LENGTH
+                    ),
+                    hashes.SHA256()
+                )
+                valid = True
+            except Exception:
+                valid = False
+
+            if memo:
+                self.memo.put(memo_key, valid)
+            return valid
+
+        except Exception:
+            return False
+
+    def verify_merkle_signature(self, message, merkle_proof, merkle_root, signature, memo=True):
+        """Verify a batch signature: the proof must lead from the message's leaf to the signed root"""
+        try:
+            if merkle_root_from_proof(message, merkle_proof) != merkle_root:
+                return False
+        except Exception:
+            return False
+        return self.verify_signature(merkle_signing_message(merkle_root), signature, memo)
+
+    def verify_payload(self, payload, memo=True):
+        """Verify a QR payload signed either individually or as part of a Merkle batch"""
+        try:
+            # Payloads without digest_alg predate the digest registry and are SHA-256
+            message = signing_message(payload.get('document_hash'), payload.get('digest_alg'))
+        except ValueError:
+            return False
+        signature = payload.get('signature')
+        if isinstance(signature, str):
+            signature = bytes.fromhex(signature)
+        if payload.get('signature_mode') == SIGNATURE_MODE_MERKLE or payload.get('merkle_proof') is not None:
+            return self.verify_merkle_signature(
+                message,
+                payload.get('merkle_proof') or [],
+                payload.get('merkle_root'),
                 signature,
-                hash_bytes,
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
+                memo
             )
-            
-            return True
-            
-        except Exception:
-            return False
\ No newline at end of file
+        return self.verify_signature(message, signature, memo)
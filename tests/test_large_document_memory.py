@@ -0,0 +1,105 @@
+"""
+Large-document mode keeps memory bounded: hashing streams the file and the
+pages, and QR extraction holds one page at a time, so peak RSS growth does
+not follow the document size. Each measurement runs in a fresh interpreter
+(ru_maxrss is a high-water mark for the whole process).
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIB = 1024 * 1024
+
+MEASURE = """
+import json, logging, resource, sys
+logging.disable(logging.CRITICAL)
+from services.signature_service import SignatureService
+from services.qr_service import QRService
+
+def peak():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+signature_service = SignatureService(large_document_bytes=0)
+qr_service = QRService(large_document_bytes=0)
+runs = {
+    'binary_hash': signature_service.generate_document_hash_for_verification,
+    'content_hash': signature_service.generate_document_hash,
+    'qr_extraction': qr_service.extract_qr_from_pdf,
+}
+baseline = peak()
+for stage in sys.argv[2].split(','):
+    runs[stage](sys.argv[1])
+print(json.dumps({'growth': peak() - baseline}))
+"""
+
+
+def peak_growth(path, stages):
+    """Peak RSS growth (bytes) of a fresh process running stages on path"""
+    out = subprocess.run([sys.executable, '-c', MEASURE, path, stages], cwd=ROOT,
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])['growth']
+
+
+def scanned_pdf(path, pages, width=2400, height=3200):
+    """Full-page noise scans: incompressible, so the file is about pages x the JPEG size"""
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    jpeg = cv2.imencode('.jpg', noise, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        # Distinct trailing bytes, otherwise PyMuPDF stores identical images once
+        page.insert_image(page.rect, stream=jpeg + i.to_bytes(4, 'little'))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def text_pdf(path, pages):
+    text = "Statement line with account number, booking date, amount and balance. " * 40
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_textbox(fitz.Rect(50, 50, 545, 792), f"Page {i + 1}. {text}", fontsize=9)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return path
+
+
+@pytest.fixture(scope='module')
+def scanned(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('scanned')
+    return (scanned_pdf(str(directory / 'small.pdf'), 1),
+            scanned_pdf(str(directory / 'large.pdf'), 4))
+
+
+def test_hashing_a_large_scanned_document_does_not_load_it(scanned):
+    _, large = scanned
+    size = os.path.getsize(large)
+    assert size > 32 * MIB
+    growth = peak_growth(large, 'binary_hash,content_hash')
+    assert growth < 16 * MIB, f"hashing a {size // MIB}MB file grew RSS by {growth // MIB}MB"
+
+
+def test_hashing_many_pages_does_not_grow_with_page_count(tmp_path):
+    path = text_pdf(str(tmp_path / 'pages.pdf'), 1000)
+    growth = peak_growth(path, 'binary_hash,content_hash')
+    assert growth < 16 * MIB, f"hashing 1000 pages grew RSS by {growth // MIB}MB"
+
+
+def test_qr_extraction_memory_is_per_page_not_per_document(scanned):
+    small, large = scanned
+    small_growth = peak_growth(small, 'qr_extraction')
+    large_growth = peak_growth(large, 'qr_extraction')
+    # 4x the pages (and bytes) may cost at most one more page's working set
+    assert large_growth < small_growth + 48 * MIB, (
+        f"QR extraction grew RSS by {small_growth // MIB}MB for 1 page "
+        f"and {large_growth // MIB}MB for 4"
+    )